@@ -0,0 +1,100 @@
+"""Benchmark: cold start of the headless subcommands
+
+Runs each command in a fresh interpreter and reports the median wall time
+next to the floor of starting Python and importing SQLAlchemy's ORM.
+Exits with status 1 if a command is slower than the target or imports
+Textual. Run from the repository root:
+
+    python -m benchmarks.bench_cold_start
+    python -m benchmarks.bench_cold_start --target 0.5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.workloads import build_database
+
+MESSAGES = 10_000
+RUNS = 7
+# Seconds; most of it is importing SQLAlchemy
+TARGET = 0.8
+# Modules the headless commands must never load
+UI_MODULES = ("textual", "rich")
+
+
+def _median_seconds(argv, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _imported_ui_modules(argv):
+    """UI packages the command imported, from its -X importtime trace"""
+    trace = subprocess.run(
+        [argv[0], "-X", "importtime", *argv[1:]],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    ).stderr
+    found = set()
+    for line in trace.splitlines():
+        module = line.rpartition("|")[2].strip()
+        if module.split(".")[0] in UI_MODULES:
+            found.add(module.split(".")[0])
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless cold-start times")
+    parser.add_argument("--target", type=float, default=TARGET)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = Path(scratch) / "cold-start.db"
+        workload = build_database(path, "mixed", MESSAGES)
+        main_argv = [sys.executable, "-m", "src.main", "--db", f"sqlite:///{path}"]
+        commands = {
+            "path": ["path", str(workload.deepest_id)],
+            "subtree": ["subtree", str(workload.root_id), "--depth", "3"],
+            "search": ["search", "token cache"],
+            "stats": ["stats"],
+            "export": ["export", "--path", str(workload.deepest_id)],
+        }
+
+        floors = {
+            "python": [sys.executable, "-c", "pass"],
+            "import sqlalchemy.orm": [sys.executable, "-c", "import sqlalchemy.orm"],
+        }
+        print(f"{'command':<22} {'median s':>9}")
+        for name, argv in floors.items():
+            print(f"{name:<22} {_median_seconds(argv, args.runs):>9.3f}")
+
+        failed = False
+        for name, command in commands.items():
+            argv = main_argv + command
+            seconds = _median_seconds(argv, args.runs)
+            ui_modules = _imported_ui_modules(argv)
+            notes = []
+            if seconds > args.target:
+                notes.append(f"over the {args.target:.2f}s target")
+            if ui_modules:
+                notes.append(f"imports {', '.join(ui_modules)}")
+            failed = failed or bool(notes)
+            print(f"{name:<22} {seconds:>9.3f}  {'; '.join(notes)}".rstrip())
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
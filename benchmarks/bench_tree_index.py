@@ -0,0 +1,57 @@
+"""Benchmark: TreeIndex build time and structural queries against SQLite
+
+Run from the repository root:
+
+    python -m benchmarks.bench_tree_index
+"""
+
+import random
+import time
+
+from src.database.db import init_db
+from src.database.tree_index import load_tree_index
+from src.database.tree_loader import load_path
+
+from .bench_tree_loader import populate
+
+SIZES = [1_000, 16_000, 64_000, 256_000]
+QUERIES = 1_000
+
+
+def _timed(fn, args):
+    start = time.perf_counter()
+    for arg in args:
+        fn(*arg)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def main():
+    print(
+        f"{'messages':>10} {'build s':>9} {'path us':>9} {'sql path us':>12} "
+        f"{'lca us':>8} {'subtree us':>11}"
+    )
+    for count in SIZES:
+        session = init_db("sqlite:///:memory:")
+        populate(session, count)
+        rng = random.Random(1)
+        ids = [rng.randint(1, count) for _ in range(QUERIES)]
+        pairs = [(a, rng.randint(1, count)) for a in ids]
+
+        start = time.perf_counter()
+        index = load_tree_index(session)
+        build = time.perf_counter() - start
+        assert len(index) == count
+
+        path = _timed(index.path_ids, [(i,) for i in ids])
+        sql_path = _timed(load_path, [(session, i) for i in ids[:100]])
+        lca = _timed(index.lca, pairs)
+        subtree = _timed(index.subtree_size, [(i,) for i in ids])
+        print(
+            f"{count:>10} {build:>9.3f} {path:>9.1f} {sql_path:>12.1f} "
+            f"{lca:>8.1f} {subtree:>11.2f}"
+        )
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
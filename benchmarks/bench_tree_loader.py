@@ -0,0 +1,60 @@
+"""Benchmark: tree load time should grow linearly with message count
+
+Run from the repository root:
+
+    python -m benchmarks.bench_tree_loader
+"""
+
+import random
+import time
+from datetime import datetime
+
+from src.database.bodies import insert_messages
+from src.database.db import init_db
+from src.database.tree_loader import load_message_tree
+
+SIZES = [1_000, 4_000, 16_000, 64_000]
+
+
+def populate(session, count, seed=0):
+    """Insert a random branching forest of `count` messages"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    rows = []
+    for message_id in range(1, count + 1):
+        if message_id == 1 or rng.random() < 0.01:
+            parent_id = None
+        else:
+            # Mostly extend a recent message, occasionally fork an older one
+            parent_id = max(1, message_id - 1 - int(rng.expovariate(0.5)))
+        rows.append(
+            {
+                "id": message_id,
+                "parent_id": parent_id,
+                "timestamp": now,
+                "speaker": "user" if message_id % 2 else "assistant",
+                "content": f"message {message_id} " + "lorem ipsum " * 20,
+            }
+        )
+    insert_messages(session, rows)
+    session.commit()
+
+
+def main():
+    print(f"{'messages':>10} {'seconds':>10} {'us/message':>12}")
+    for count in SIZES:
+        session = init_db("sqlite:///:memory:")
+        populate(session, count)
+        session.expunge_all()
+
+        start = time.perf_counter()
+        tree_data = load_message_tree(session)
+        elapsed = time.perf_counter() - start
+
+        assert len(tree_data) == count
+        print(f"{count:>10} {elapsed:>10.3f} {elapsed / count * 1e6:>12.2f}")
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
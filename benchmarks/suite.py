@@ -0,0 +1,256 @@
+"""Benchmark suite: load, navigation and rendering over synthetic workloads
+
+Run from the repository root:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --shapes chain wide --sizes 1000 1000000
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --compare baseline.json
+    python -m benchmarks.suite --results results.json --compare baseline.json
+
+Every repeat starts a fresh headless app on the workload's database and
+times, in order:
+
+- init_db: opening (and migrating) the database
+- app_startup: constructing and mounting the app
+- tree_build: MessageTree.build_tree_from_db for the largest conversation
+- get_path_from_root: the root -> deepest message path query
+- show_graph: GraphView reloading and laying out the conversation
+- show_conversation_path: the path view of the deepest message, from empty
+- cursor_step: one tree cursor key, averaged over a scripted walk
+
+Times are CPU seconds of the process, so the pilot's waits for the app to
+go idle don't count, only the work done. Results are written as JSON;
+--compare flags any benchmark that got more than --threshold slower than
+the baseline and exits with status 1.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from textual import __version__ as textual_version
+
+from benchmarks.workloads import SHAPES, build_database
+from src.database.db import init_db
+from src.database.models import get_path_from_root
+from src.database.tree_loader import load_messages
+from src.ui.app import HIGHLIGHT_DEBOUNCE, ChatManagerApp
+from src.widgets.conversation_path import ConversationPath
+from src.widgets.graph_view import GraphView
+from src.widgets.message_tree import MessageTree
+
+SIZES = [1_000, 10_000, 100_000]
+REPEAT = 3
+WALK_STEPS = 60
+# Expand, descend, then step to the next line: reaches deep and wide nodes
+WALK_KEYS = ("l", "l", "j")
+SCREEN_SIZE = (160, 50)
+DEFAULT_THRESHOLD = 0.25
+# Differences below this many seconds are timer noise, never regressions
+MIN_DELTA = 0.002
+
+
+class Timer:
+    """Collects CPU seconds per benchmark name"""
+
+    clock = staticmethod(time.process_time)
+
+    def __init__(self):
+        self.runs = {}
+
+    def add(self, name, seconds):
+        self.runs.setdefault(name, []).append(seconds)
+
+    def time(self, name, func, *args):
+        start = self.clock()
+        result = func(*args)
+        self.add(name, self.clock() - start)
+        return result
+
+
+async def _settle(pilot):
+    """Wait for pending refreshes and the highlight debounce"""
+    await pilot.pause(HIGHLIGHT_DEBOUNCE)
+    await pilot.pause()
+
+
+async def run_app(db_url, workload, timer, steps):
+    """One fresh app session timing the UI benchmarks"""
+    start = timer.clock()
+    app = ChatManagerApp(db_url=db_url)
+    async with app.run_test(headless=True, size=SCREEN_SIZE) as pilot:
+        await pilot.pause()
+        timer.add("app_startup", timer.clock() - start)
+        session = app.session
+        if app.conversation_id != workload.root_id:
+            app.show_conversation(workload.root_id)
+            await _settle(pilot)
+
+        tree = app.query_one("#message-tree", MessageTree)
+        start = timer.clock()
+        tree.build_tree_from_db(session, None, workload.root_id)
+        await pilot.pause()
+        timer.add("tree_build", timer.clock() - start)
+
+        timer.time(
+            "get_path_from_root", get_path_from_root, session, workload.deepest_id
+        )
+        session.expunge_all()
+
+        graph = app.query_one("#graph-view", GraphView)
+        selected = load_messages(session, [workload.deepest_id])[0]
+        start = timer.clock()
+        graph.tree_data = None
+        graph.show_graph(session, selected)
+        await pilot.pause()
+        timer.add("show_graph", timer.clock() - start)
+
+        conversation = app.query_one("#conversation-path", ConversationPath)
+        conversation.clear_path()
+        app.bodies.clear()
+        await pilot.pause()
+        start = timer.clock()
+        conversation.show_conversation_path(workload.deepest_id, session)
+        await pilot.pause()
+        timer.add("show_conversation_path", timer.clock() - start)
+
+        tree.focus()
+        tree.cursor_line = 0
+        await _settle(pilot)
+        start = timer.clock()
+        for step in range(steps):
+            await pilot.press(WALK_KEYS[step % len(WALK_KEYS)])
+        await _settle(pilot)
+        timer.add("cursor_step", (timer.clock() - start) / steps)
+
+
+def run_workload(path, shape, size, repeat, steps):
+    """Time every benchmark on one workload, returns result dicts"""
+    workload = build_database(path, shape, size)
+    db_url = f"sqlite:///{path}"
+    timer = Timer()
+    for _ in range(repeat):
+        session = timer.time("init_db", init_db, db_url)
+        session.close()
+        asyncio.run(run_app(db_url, workload, timer, steps))
+
+    return [
+        {
+            "benchmark": name,
+            "workload": shape,
+            "messages": workload.count,
+            "depth": workload.depth,
+            "seconds": min(runs),
+            "runs": runs,
+        }
+        for name, runs in timer.runs.items()
+    ]
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "textual": textual_version,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _key(result):
+    return result["benchmark"], result["workload"], result["messages"]
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD, out=sys.stdout):
+    """Print new vs baseline timings, returns the regressed results"""
+    previous = {_key(result): result["seconds"] for result in baseline["results"]}
+    regressions = []
+    print(
+        f"{'benchmark':<24} {'workload':<8} {'messages':>9} "
+        f"{'baseline':>10} {'now':>10} {'change':>8}",
+        file=out,
+    )
+    for result in results["results"]:
+        before = previous.get(_key(result))
+        if before is None:
+            continue
+        now = result["seconds"]
+        change = now / before - 1 if before else 0.0
+        flag = ""
+        if change > threshold and now - before > MIN_DELTA:
+            flag = "  REGRESSION"
+            regressions.append(result)
+        elif change < -threshold and before - now > MIN_DELTA:
+            flag = "  faster"
+        print(
+            f"{result['benchmark']:<24} {result['workload']:<8} "
+            f"{result['messages']:>9} {before:>10.4f} {now:>10.4f} "
+            f"{change:>+8.0%}{flag}",
+            file=out,
+        )
+    print(f"{len(regressions)} regression(s) above {threshold:.0%}", file=out)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument(
+        "--steps", type=int, default=WALK_STEPS, help="Keys in the cursor walk"
+    )
+    parser.add_argument(
+        "--data-dir",
+        help="Keep generated databases here and reuse them on later runs",
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument(
+        "--results", help="Compare this results file instead of running the suite"
+    )
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Slowdown ratio flagged as a regression (default: {DEFAULT_THRESHOLD})",
+    )
+    args = parser.parse_args()
+
+    if args.results:
+        results = json.loads(Path(args.results).read_text())
+    else:
+        results = {"environment": environment(), "results": []}
+        with tempfile.TemporaryDirectory() as scratch:
+            data_dir = Path(args.data_dir or scratch)
+            data_dir.mkdir(parents=True, exist_ok=True)
+            for size in args.sizes:
+                for shape in args.shapes:
+                    path = data_dir / f"{shape}-{size}.db"
+                    for result in run_workload(
+                        path, shape, size, args.repeat, args.steps
+                    ):
+                        results["results"].append(result)
+                        print(
+                            f"{result['benchmark']:<24} {shape:<8} {size:>9} "
+                            f"{result['seconds']:>10.4f}s",
+                            flush=True,
+                        )
+        if args.output:
+            Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Synthetic conversation forests for the benchmarks
+
+Shapes:
+
+- chain: one conversation, every message a reply to the previous one
+- wide: one conversation branching FAN_OUT ways at every message
+- forest: many CONVERSATION_SIZE-message conversations with occasional forks
+- mixed: mostly long replies, some forks and about 1% new conversations
+
+Content lengths follow a log-normal distribution (median ~400 characters,
+a long tail of pasted code and documents), and rows carry root ids and
+token counts as the importer would write them.
+"""
+
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func, select
+
+from src.database.bodies import insert_messages
+from src.database.db import init_db
+from src.database.models import Message
+from src.database.tokens import count_tokens
+from src.database.tree_index import load_tree_index
+
+SHAPES = ("chain", "wide", "forest", "mixed")
+FAN_OUT = 8
+CONVERSATION_SIZE = 50
+BATCH_SIZE = 5_000
+MAX_CONTENT_LENGTH = 40_000
+
+_WORDS = [
+    "the", "model", "context", "window", "token", "prompt", "reply", "branch",
+    "message", "summary", "function", "return", "value", "error", "test", "file",
+    "line", "code", "python", "query", "index", "tree", "path", "node", "parent",
+    "child", "root", "depth", "cache", "layout", "render", "scroll", "because",
+    "however", "which", "should", "would", "could", "first", "then", "also", "only",
+]
+
+
+def _corpus(rng, length):
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+class Workload:
+    """Where a generated forest keeps its interesting messages
+
+    root_id is the largest conversation and deepest_id the deepest message
+    in it, the target for path loads and cursor walks.
+    """
+
+    def __init__(self, shape, count, root_id, deepest_id, depth):
+        self.shape = shape
+        self.count = count
+        self.root_id = root_id
+        self.deepest_id = deepest_id
+        self.depth = depth
+
+    @property
+    def name(self):
+        return f"{self.shape}-{self.count}"
+
+
+def _parent_id(shape, message_id, rng):
+    if message_id == 1:
+        return None
+    if shape == "chain":
+        return message_id - 1
+    if shape == "wide":
+        return (message_id - 2) // FAN_OUT + 1
+    if shape == "forest":
+        first = (message_id - 1) // CONVERSATION_SIZE * CONVERSATION_SIZE + 1
+        if message_id == first:
+            return None
+        if rng.random() < 0.1:
+            return rng.randint(first, message_id - 1)
+        return message_id - 1
+    if shape == "mixed":
+        if rng.random() < 0.01:
+            return None
+        return max(1, message_id - 1 - int(rng.expovariate(0.5)))
+    raise ValueError(f"unknown shape {shape!r}, expected one of {SHAPES}")
+
+
+def populate(session, shape, count, seed=0):
+    """Insert a `count`-message forest of the given shape, returns a Workload"""
+    rng = random.Random(seed)
+    corpus = _corpus(rng, MAX_CONTENT_LENGTH * 2)
+    start = datetime(2024, 1, 1)
+    root_ids = {}
+    depths = {}
+    path_tokens = {}
+    sizes = {}
+
+    rows = []
+    for message_id in range(1, count + 1):
+        parent_id = _parent_id(shape, message_id, rng)
+        length = min(int(rng.lognormvariate(6.0, 1.0)), MAX_CONTENT_LENGTH)
+        offset = rng.randrange(len(corpus) - length)
+        content = f"#{message_id} {corpus[offset : offset + length]}"
+        tokens = count_tokens(content)
+
+        root_id = message_id if parent_id is None else root_ids[parent_id]
+        root_ids[message_id] = root_id
+        depths[message_id] = 0 if parent_id is None else depths[parent_id] + 1
+        path_tokens[message_id] = path_tokens.get(parent_id, 0) + tokens
+        sizes[root_id] = sizes.get(root_id, 0) + 1
+
+        rows.append(
+            {
+                "id": message_id,
+                "parent_id": parent_id,
+                "root_id": root_id,
+                "timestamp": start + timedelta(seconds=message_id),
+                "speaker": "assistant" if depths[message_id] % 2 else "user",
+                "content": content,
+                "token_count": tokens,
+                "path_token_count": path_tokens[message_id],
+            }
+        )
+        if len(rows) >= BATCH_SIZE:
+            insert_messages(session, rows)
+            rows = []
+    if rows:
+        insert_messages(session, rows)
+    session.commit()
+
+    root_id = max(sizes, key=lambda root: (sizes[root], -root))
+    deepest_id = max(
+        (message_id for message_id, root in root_ids.items() if root == root_id),
+        key=lambda message_id: (depths[message_id], -message_id),
+    )
+    return Workload(shape, count, root_id, deepest_id, depths[deepest_id])
+
+
+def describe(session, shape):
+    """Workload of an already populated database"""
+    count = session.scalar(select(func.count()).select_from(Message))
+    root_id = session.execute(
+        select(Message.root_id)
+        .group_by(Message.root_id)
+        .order_by(func.count().desc(), Message.root_id)
+        .limit(1)
+    ).scalar()
+    index = load_tree_index(session, root_id)
+    depth, deepest_id = max(
+        (depth, -message_id) for message_id, depth in index.walk(root_id)
+    )
+    return Workload(shape, count, root_id, -deepest_id, depth)
+
+
+def build_database(path, shape, count, seed=0):
+    """Create a SQLite file at path holding the workload, or reuse it"""
+    exists = Path(path).exists()
+    session = init_db(f"sqlite:///{path}")
+    try:
+        if exists:
+            return describe(session, shape)
+        return populate(session, shape, count, seed)
+    finally:
+        session.close()
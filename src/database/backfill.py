@@ -0,0 +1,94 @@
+"""Batched backfills of derived message columns for existing databases"""
+
+import sys
+
+from sqlalchemy import delete, select, update
+
+from .models import ChangeLogPause, Message
+from .tokens import count_tokens
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def backfill_token_counts(
+    session, batch_size=DEFAULT_BATCH_SIZE, recount=False, out=sys.stderr
+):
+    """Fill token_count and path_token_count, committing every batch
+
+    Only rows without a count are tokenized unless recount is set (e.g.
+    after switching tokenizers). Path totals are then recomputed from the
+    id/parent_id structure and only rows whose stored total differs are
+    written. Returns (messages tokenized, path totals updated).
+    """
+    tokenized = 0
+    last_id = 0
+    while True:
+        stmt = (
+            select(Message.id, Message.content)
+            .where(Message.id > last_id)
+            .order_by(Message.id)
+            .limit(batch_size)
+        )
+        if not recount:
+            stmt = stmt.where(Message.token_count.is_(None))
+        rows = session.execute(stmt).all()
+        if not rows:
+            break
+        _update_unlogged(
+            session,
+            [{"id": row.id, "token_count": count_tokens(row.content)} for row in rows],
+        )
+        tokenized += len(rows)
+        last_id = rows[-1].id
+        if out is not None:
+            print(f"Tokenized {tokenized:,} messages", file=out)
+
+    structure = session.execute(
+        select(
+            Message.id, Message.parent_id, Message.token_count, Message.path_token_count
+        )
+    ).all()
+    parents = {row.id: row.parent_id for row in structure}
+    tokens = {row.id: row.token_count or 0 for row in structure}
+    totals = {}
+    for row in structure:
+        _resolve_total(row.id, parents, tokens, totals)
+
+    changed = [
+        {"id": row.id, "path_token_count": totals[row.id]}
+        for row in structure
+        if row.path_token_count != totals[row.id]
+    ]
+    for start in range(0, len(changed), batch_size):
+        _update_unlogged(session, changed[start : start + batch_size])
+    if out is not None:
+        print(f"Updated {len(changed):,} path token totals", file=out)
+    return tokenized, len(changed)
+
+
+def _update_unlogged(session, rows):
+    """Bulk-update and commit derived columns without logging the rows for
+    change sync: filling them in isn't an edit"""
+    session.add(ChangeLogPause())
+    session.flush()
+    session.execute(update(Message), rows)
+    session.execute(delete(ChangeLogPause))
+    session.commit()
+
+
+def _resolve_total(message_id, parents, tokens, totals):
+    """Cumulative root -> message token total, walking up without recursion"""
+    chain = []
+    current = message_id
+    while current is not None and current not in totals and current in parents:
+        chain.append(current)
+        current = parents[current]
+        if current in chain:
+            current = None
+            break
+
+    total = totals.get(current, 0)
+    for node in reversed(chain):
+        total += tokens[node]
+        totals[node] = total
+    return total
@@ -0,0 +1,273 @@
+"""Deduplicated message body storage: bulk writes, stats, compression and cleanup"""
+
+import sys
+from collections import OrderedDict
+from itertools import groupby
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, text, update
+
+from .body_codecs import decode_body, encode_body
+from .models import (
+    Message,
+    MessageBody,
+    PendingFtsChange,
+    compute_body_hash,
+    insert_bodies,
+    make_preview,
+)
+from .tree_loader import IN_CLAUSE_CHUNK
+
+DEFAULT_BATCH_SIZE = 1000
+# Decoded text kept by a BodyCache, in characters
+DEFAULT_CACHE_CHARS = 8_000_000
+
+
+def insert_messages(session, rows):
+    """Bulk-insert message dicts that carry their text under "content"
+
+    Each distinct body is written once (existing hashes are skipped) and
+    the message rows reference it by hash.
+    """
+    bodies = {}
+    message_rows = []
+    for row in rows:
+        row = dict(row)
+        content = row.pop("content")
+        row["body_hash"] = compute_body_hash(content)
+        row.setdefault("preview", make_preview(content))
+        bodies[row["body_hash"]] = content
+        message_rows.append(row)
+
+    insert_bodies(session, bodies)
+    if message_rows:
+        session.execute(insert(Message), message_rows)
+        index_pending_texts(session)
+
+
+# FTS5 commands applied for queued changes, by PendingFtsChange.op
+_FTS_OPS = {
+    "insert": "INSERT INTO messages_fts (rowid, content) VALUES (:id, :content)",
+    "delete": (
+        "INSERT INTO messages_fts (messages_fts, rowid, content) "
+        "VALUES ('delete', :id, :content)"
+    ),
+}
+
+
+def index_pending_texts(session):
+    """Apply the search index changes queued for compressed bodies
+
+    The FTS triggers index plain text themselves but leave compressed
+    bodies to Python. Runs in the caller's transaction; returns how many
+    changes were applied.
+    """
+    pending = session.execute(
+        select(
+            PendingFtsChange.seq,
+            PendingFtsChange.message_id,
+            PendingFtsChange.body_hash,
+            PendingFtsChange.op,
+        ).order_by(PendingFtsChange.seq)
+    ).all()
+    if not pending:
+        return 0
+    texts = load_bodies(session, {change.body_hash for change in pending})
+    # Consecutive changes of one kind go in one executemany, keeping order
+    for op, changes in groupby(pending, key=lambda change: change.op):
+        params = [
+            {"id": change.message_id, "content": texts[change.body_hash]}
+            # A body pruned meanwhile can't be (un)indexed; search skips
+            # rowids without a message anyway
+            for change in changes
+            if change.body_hash in texts
+        ]
+        if params:
+            session.execute(text(_FTS_OPS[op]), params)
+    session.execute(
+        delete(PendingFtsChange).where(PendingFtsChange.seq <= pending[-1].seq)
+    )
+    return len(pending)
+
+
+def load_bodies(session, hashes):
+    """Return {hash: text} for the given body hashes"""
+    hashes = list(hashes)
+    bodies = {}
+    for start in range(0, len(hashes), IN_CLAUSE_CHUNK):
+        stmt = select(MessageBody.hash, MessageBody.stored, MessageBody.codec).where(
+            MessageBody.hash.in_(hashes[start : start + IN_CLAUSE_CHUNK])
+        )
+        for row in session.execute(stmt):
+            bodies[row.hash] = decode_body(row.stored, row.codec)
+    return bodies
+
+
+class BodyCache:
+    """LRU of decoded message bodies, bounded by total characters
+
+    Views hold lightweight message rows and fetch full text through this
+    cache only for what they render, so memory stays flat however large
+    the database is.
+    """
+
+    def __init__(self, session, max_chars=DEFAULT_CACHE_CHARS):
+        self.session = session
+        self.max_chars = max_chars
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, body_hash):
+        return self.get_many([body_hash])[body_hash]
+
+    def get_many(self, hashes):
+        """Return {hash: text}, fetching every missing body in one query"""
+        found = {}
+        missing = []
+        for body_hash in dict.fromkeys(hashes):
+            text_ = self._entries.get(body_hash)
+            if text_ is None:
+                missing.append(body_hash)
+            else:
+                self._entries.move_to_end(body_hash)
+                found[body_hash] = text_
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            loaded = load_bodies(self.session, missing)
+            for body_hash in missing:
+                # Vanished bodies (pruned meanwhile) render as empty text
+                found[body_hash] = loaded.get(body_hash, "")
+                self._store(body_hash, found[body_hash])
+        return found
+
+    def _store(self, body_hash, text_):
+        self._entries[body_hash] = text_
+        self.chars += len(text_)
+        # The newest entry always stays, even if it alone is over budget
+        while self.chars > self.max_chars and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.chars -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self.chars = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "chars": self.chars,
+            "max_chars": self.max_chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def storage_stats(session):
+    """Logical vs stored body bytes, i.e. what deduplication and compression save"""
+    messages, logical = session.execute(
+        select(func.count(Message.id), func.coalesce(func.sum(MessageBody.size), 0))
+        .select_from(Message)
+        .join(MessageBody, MessageBody.hash == Message.body_hash)
+    ).one()
+    bodies, unique, compressed, stored = session.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(MessageBody.size), 0),
+            func.count(MessageBody.codec),
+            func.coalesce(
+                func.sum(
+                    case(
+                        (MessageBody.codec.is_(None), MessageBody.size),
+                        else_=func.length(MessageBody.stored),
+                    )
+                ),
+                0,
+            ),
+        ).select_from(MessageBody)
+    ).one()
+    return {
+        "messages": messages,
+        "bodies": bodies,
+        "compressed_bodies": compressed,
+        "logical_bytes": logical,
+        "unique_bytes": unique,
+        "stored_bytes": stored,
+        "saved_bytes": logical - stored,
+        "dedup_ratio": logical / unique if unique else 1.0,
+        "compression_ratio": unique / stored if stored else 1.0,
+    }
+
+
+def recompress_bodies(session, batch_size=DEFAULT_BATCH_SIZE, out=sys.stderr):
+    """Re-encode stored bodies with the current compression settings
+
+    Works in hash-ordered batches, each committed on its own, so the
+    database stays usable meanwhile. Only bodies whose codec changes are
+    rewritten. Returns the number of bodies rewritten.
+    """
+    rewritten = scanned = 0
+    last_hash = ""
+    while True:
+        rows = session.execute(
+            select(MessageBody.hash, MessageBody.stored, MessageBody.codec, MessageBody.size)
+            .where(MessageBody.hash > last_hash)
+            .order_by(MessageBody.hash)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        changed = []
+        for row in rows:
+            stored, codec = encode_body(decode_body(row.stored, row.codec), row.size)
+            if codec != row.codec:
+                changed.append({"b_hash": row.hash, "content": stored, "codec": codec})
+        if changed:
+            session.execute(
+                update(MessageBody.__table__).where(
+                    MessageBody.__table__.c.hash == bindparam("b_hash")
+                ),
+                changed,
+            )
+        session.commit()
+        scanned += len(rows)
+        rewritten += len(changed)
+        last_hash = rows[-1].hash
+        if out is not None:
+            print(f"Scanned {scanned:,} bodies, rewrote {rewritten:,}", file=out)
+    return rewritten
+
+
+def database_size(session):
+    """Bytes used by the database file (excluding the WAL)"""
+    page_count = session.execute(text("PRAGMA page_count")).scalar()
+    page_size = session.execute(text("PRAGMA page_size")).scalar()
+    return page_count * page_size
+
+
+def vacuum(session):
+    """Rebuild the database file to return freed pages to the filesystem"""
+    session.commit()
+    with session.get_bind().connect() as connection:
+        connection.exec_driver_sql("VACUUM")
+
+
+def prune_orphan_bodies(session):
+    """Delete bodies no message references any more; returns the count"""
+    # Unindexing a deleted message with a compressed body needs its text
+    index_pending_texts(session)
+    referenced = select(Message.id).where(Message.body_hash == MessageBody.hash)
+    result = session.execute(
+        delete(MessageBody)
+        .where(~referenced.exists())
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount
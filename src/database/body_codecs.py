@@ -0,0 +1,94 @@
+"""Optional transparent compression of large message bodies"""
+
+import zlib
+
+DEFAULT_CODEC = "zlib"
+# UTF-8 bytes; smaller bodies are stored as plain text
+DEFAULT_THRESHOLD = 4096
+
+
+def _zlib_codec():
+    return zlib.compress, zlib.decompress
+
+
+def _zstd_codec():
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ValueError(
+                "the 'zstd' codec needs Python 3.14+ or `pip install zstandard`"
+            ) from e
+        return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+    return zstd.compress, zstd.decompress
+
+
+# name -> factory returning (compress(bytes), decompress(bytes)); the name
+# is stored with every compressed body, so never rename an entry
+CODECS = {
+    "zlib": _zlib_codec,
+    "zstd": _zstd_codec,
+}
+
+_loaded = {}
+_codec_name = DEFAULT_CODEC
+_threshold = DEFAULT_THRESHOLD
+
+
+def _codec(name):
+    if name not in _loaded:
+        if name not in CODECS:
+            raise ValueError(f"unknown body codec {name!r}")
+        _loaded[name] = CODECS[name]()
+    return _loaded[name]
+
+
+def set_compression(codec=DEFAULT_CODEC, threshold=DEFAULT_THRESHOLD):
+    """Select the codec for new bodies of at least threshold bytes
+
+    codec None (or "none") stores every new body as plain text. Existing
+    bodies keep their codec until recompressed.
+    """
+    global _codec_name, _threshold
+    if codec == "none":
+        codec = None
+    if codec is not None:
+        _codec(codec)
+    _codec_name = codec
+    _threshold = threshold
+
+
+def compression_settings():
+    """(codec name or None, threshold) used for new bodies"""
+    return _codec_name, _threshold
+
+
+def encode_body(text, size):
+    """Return (stored value, codec) for a body of size UTF-8 bytes
+
+    Compressed output is only kept when it is actually smaller.
+    """
+    if _codec_name is None or size < _threshold:
+        return text, None
+    data = _codec(_codec_name)[0](text.encode("utf-8"))
+    if len(data) >= size:
+        return text, None
+    return data, _codec_name
+
+
+def decode_body(stored, codec):
+    """Text of a stored body"""
+    if codec is None:
+        return stored
+    return _codec(codec)[1](stored).decode("utf-8")
+
+
+def register_sql_functions(dbapi_connection):
+    """Make body_text(content, codec) callable from SQL on this connection
+
+    For app queries and migrations only: views and triggers must not call
+    it, or other sqlite3 clients could no longer write messages.
+    """
+    dbapi_connection.create_function("body_text", 2, decode_body, deterministic=True)
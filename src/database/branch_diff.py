@@ -0,0 +1,144 @@
+"""Where two branches of a conversation diverge and what follows on each side"""
+
+from sqlalchemy import func, select
+
+from .models import Message, ancestor_chain_cte
+from .tree_loader import load_messages, select_summaries
+
+
+class BranchDiff:
+    """Shared prefix (summarised by its last message) and the two suffixes
+
+    left and right are the summary rows after the divergence point, in
+    root -> tip order; the shared prefix itself is never loaded.
+    ancestor is None when the messages have no common ancestor.
+    """
+
+    def __init__(self, left_id, right_id, ancestor, shared_count, left, right):
+        self.left_id = left_id
+        self.right_id = right_id
+        self.ancestor = ancestor
+        self.shared_count = shared_count
+        self.left = left
+        self.right = right
+
+    @property
+    def shared_tokens(self):
+        if self.ancestor is None:
+            return 0
+        return self.ancestor.path_token_count
+
+    @property
+    def left_tokens(self):
+        return self._suffix_tokens(self.left)
+
+    @property
+    def right_tokens(self):
+        return self._suffix_tokens(self.right)
+
+    def _suffix_tokens(self, rows):
+        """Tokens after the divergence point, or None if unknown"""
+        if not rows:
+            return 0
+        tip = rows[-1].path_token_count
+        shared = self.shared_tokens
+        if tip is not None and shared is not None:
+            return tip - shared
+        counts = [row.token_count for row in rows]
+        return None if None in counts else sum(counts)
+
+    def __repr__(self):
+        ancestor_id = self.ancestor.id if self.ancestor is not None else None
+        return (
+            f"<BranchDiff(ancestor={ancestor_id}, shared={self.shared_count}, "
+            f"left={len(self.left)}, right={len(self.right)})>"
+        )
+
+
+def compare_branches(session, left_id, right_id, tree_data=None):
+    """Diff the root -> message paths of two messages
+
+    With a MessageTreeData holding both messages the divergence point comes
+    from its TreeIndex and no query is made; otherwise SQLite finds it by
+    joining the two ancestor chains and returns only the suffixes.
+    """
+    index = tree_data.index if tree_data is not None else None
+    if index is not None and left_id in index and right_id in index:
+        return _compare_in_memory(tree_data, left_id, right_id)
+    return _compare_in_sql(session, left_id, right_id)
+
+
+def _compare_in_memory(tree_data, left_id, right_id):
+    index = tree_data.index
+    ancestor_id = index.lca(left_id, right_id)
+    if ancestor_id is None:
+        ancestor, shared_count = None, 0
+    else:
+        ancestor = tree_data.get(ancestor_id)
+        shared_count = index.depth_of(ancestor_id) + 1
+
+    def suffix(message_id):
+        return [tree_data.get(i) for i in index.path_ids(message_id, ancestor_id)]
+
+    return BranchDiff(
+        left_id, right_id, ancestor, shared_count, suffix(left_id), suffix(right_id)
+    )
+
+
+def lowest_common_ancestor(session, left_id, right_id):
+    """(ancestor id, its depth above left, its depth above right) or None"""
+    left = ancestor_chain_cte(left_id, "left_chain")
+    right = ancestor_chain_cte(right_id, "right_chain")
+    stmt = (
+        select(left.c.id, left.c.depth, right.c.depth)
+        .join(right, left.c.id == right.c.id)
+        .order_by(left.c.depth)
+        .limit(1)
+    )
+    return session.execute(stmt).first()
+
+
+def _suffix_rows(session, message_id, depth):
+    """Summary rows of the depth messages ending at message_id, root first"""
+    if depth == 0:
+        return []
+    chain = ancestor_chain_cte(message_id)
+    stmt = (
+        select_summaries()
+        .join(chain, Message.id == chain.c.id)
+        .where(chain.c.depth < depth)
+        .order_by(chain.c.depth.desc())
+    )
+    return session.execute(stmt).all()
+
+
+def _compare_in_sql(session, left_id, right_id):
+    found = lowest_common_ancestor(session, left_id, right_id)
+    if found is None:
+        # Separate trees: both paths are suffixes of nothing
+        lengths = [
+            session.scalar(select(func.count()).select_from(ancestor_chain_cte(i)))
+            for i in (left_id, right_id)
+        ]
+        return BranchDiff(
+            left_id,
+            right_id,
+            None,
+            0,
+            _suffix_rows(session, left_id, lengths[0]),
+            _suffix_rows(session, right_id, lengths[1]),
+        )
+
+    ancestor_id, left_depth, right_depth = found
+    ancestor = load_messages(session, [ancestor_id])[0]
+    shared_count = session.scalar(
+        select(func.count()).select_from(ancestor_chain_cte(ancestor_id))
+    )
+    return BranchDiff(
+        left_id,
+        right_id,
+        ancestor,
+        shared_count,
+        _suffix_rows(session, left_id, left_depth),
+        _suffix_rows(session, right_id, right_depth),
+    )
@@ -0,0 +1,184 @@
+"""Token-budget compression of conversation paths with cached summaries"""
+
+import hashlib
+import re
+
+from sqlalchemy import select
+
+from .models import Summary, get_path_from_root
+from .tokens import count_tokens, tokenizer_name
+
+# Segment boundaries sit at depths that are multiples of this, so sibling
+# branches cut their shared prefix at the same places and share summaries
+SEGMENT_SIZE = 8
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+class ExtractiveSummarizer:
+    """Deterministic local summarizer: the lead sentence of every message"""
+
+    name = "extractive"
+
+    def __init__(self, max_words=24):
+        self.max_words = max_words
+
+    @property
+    def config(self):
+        """Identifies the output; cached summaries are reused only on a match"""
+        return f"{self.name}:v1:max_words={self.max_words}:{tokenizer_name()}"
+
+    def summarize(self, messages):
+        lines = []
+        for message in messages:
+            text = " ".join(message.content.split())
+            words = _SENTENCE_END.split(text, 1)[0].split()
+            lead = " ".join(words[: self.max_words])
+            if len(words) > self.max_words:
+                lead += " ..."
+            lines.append(f"{message.speaker}: {lead}")
+        return "\n".join(lines)
+
+
+SUMMARIZERS = {"extractive": ExtractiveSummarizer}
+
+
+class SummaryTurn:
+    """A summary standing in for a run of messages in a compressed path"""
+
+    speaker = "system"
+
+    def __init__(self, summary):
+        self.summary = summary
+        self.content = summary.content
+        self.token_count = summary.token_count
+
+    def __repr__(self):
+        return f"<SummaryTurn(ancestor_id={self.summary.ancestor_id})>"
+
+
+class CompressedPath:
+    """Result of compress_path: the turns to send plus accounting"""
+
+    def __init__(self, turns, original_tokens, tokens, budget, reused=0, created=0):
+        self.turns = turns
+        self.original_tokens = original_tokens
+        self.tokens = tokens
+        self.budget = budget
+        self.summaries_reused = reused
+        self.summaries_created = created
+
+    @property
+    def fits(self):
+        return self.tokens <= self.budget
+
+    @property
+    def summarized(self):
+        return sum(
+            turn.summary.message_count
+            for turn in self.turns
+            if isinstance(turn, SummaryTurn)
+        )
+
+    def __repr__(self):
+        return (
+            f"<CompressedPath(turns={len(self.turns)}, tokens={self.tokens}, "
+            f"original={self.original_tokens}, budget={self.budget})>"
+        )
+
+
+def _message_tokens(message):
+    if message.token_count is not None:
+        return message.token_count
+    return count_tokens(message.content)
+
+
+def segment_hash(messages):
+    """Content fingerprint of a path segment"""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.id}\x1f{message.speaker}\x1f".encode())
+        digest.update(message.content.encode())
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def _segments(cut, segment_size):
+    """(start, end) ranges covering path[:cut], aligned to segment_size"""
+    return [
+        (start, min(start + segment_size, cut)) for start in range(0, cut, segment_size)
+    ]
+
+
+def compress_path(session, message_id, budget, summarizer=None, segment_size=SEGMENT_SIZE):
+    """Fit the root -> message path into budget tokens
+
+    The oldest segments are replaced by summaries one at a time until the
+    rest of the path fits; the target message itself is always kept.
+    Summaries are looked up in the summaries table; new ones are added to
+    the session and flushed, and the caller commits.
+    """
+    summarizer = summarizer or ExtractiveSummarizer()
+    path = get_path_from_root(session, message_id)
+    tokens = [_message_tokens(message) for message in path]
+    original = sum(tokens)
+    if original <= budget or len(path) < 2:
+        return CompressedPath(list(path), original, original, budget)
+
+    # Candidate cuts: after each full segment, then everything but the target
+    last_cut = len(path) - 1
+    cuts = list(range(segment_size, last_cut, segment_size)) + [last_cut]
+    ranges = {r for cut in cuts for r in _segments(cut, segment_size)}
+
+    hashes = {r: segment_hash(path[r[0] : r[1]]) for r in ranges}
+    ancestor_ids = {path[end - 1].id for _, end in ranges}
+    stmt = select(Summary).where(
+        Summary.config == summarizer.config, Summary.ancestor_id.in_(ancestor_ids)
+    )
+    cached = {(row.ancestor_id, row.content_hash): row for row in session.scalars(stmt)}
+
+    summaries = {}
+    reused = created = 0
+
+    def summary_for(start, end):
+        nonlocal reused, created
+        if (start, end) in summaries:
+            return summaries[start, end]
+        key = (path[end - 1].id, hashes[start, end])
+        row = cached.get(key)
+        if row is None:
+            content = summarizer.summarize(path[start:end])
+            content = f"[Summary of messages {start + 1}-{end}]\n{content}"
+            row = Summary(
+                ancestor_id=key[0],
+                content_hash=key[1],
+                config=summarizer.config,
+                start_depth=start,
+                message_count=end - start,
+                content=content,
+                token_count=count_tokens(content),
+            )
+            session.add(row)
+            cached[key] = row
+            created += 1
+        else:
+            reused += 1
+        summaries[start, end] = row
+        return row
+
+    suffix = [0]
+    for count in reversed(tokens):
+        suffix.append(suffix[-1] + count)
+    suffix.reverse()
+
+    for cut in cuts:
+        rows = [summary_for(start, end) for start, end in _segments(cut, segment_size)]
+        total = sum(row.token_count for row in rows) + suffix[cut]
+        if total <= budget:
+            break
+
+    if created:
+        session.flush()
+
+    turns = [SummaryTurn(row) for row in rows] + list(path[cut:])
+    return CompressedPath(turns, original, total, budget, reused, created)
@@ -1,15 +1,18 @@
 """Database initialization and utilities"""
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from .models import Base, Message
+from .migrations import configure_sqlite, migrate
 
 
 def init_db(db_url="sqlite:///data/chat_history.db"):
-    """Initialize database and return session"""
+    """Initialize database, apply pending migrations and return session"""
     engine = create_engine(db_url, echo=False)
+    configure_sqlite(engine)
     Base.metadata.create_all(engine)
+    migrate(engine)
     Session = sessionmaker(bind=engine)
     return Session()
 
@@ -59,10 +62,9 @@ def create_sample_data(session):
         ),
     ]
 
-    for msg in messages:
-        existing = session.query(Message).filter_by(id=msg.id).first()
-        if not existing:
-            session.add(msg)
+    ids = [msg.id for msg in messages]
+    existing = set(session.scalars(select(Message.id).where(Message.id.in_(ids))))
+    session.add_all(msg for msg in messages if msg.id not in existing)
 
     session.commit()
     return len(messages)
@@ -0,0 +1,164 @@
+"""Streaming export of conversation paths as chat API `messages` arrays"""
+
+import json
+from itertools import islice
+
+from sqlalchemy import select
+
+from .compression import compress_path
+from .models import Message, get_path_from_root
+from .tree_index import load_tree_index
+from .tree_loader import IN_CLAUSE_CHUNK, conversation_of
+
+FORMATS = ("openai", "anthropic")
+MODES = ("path", "subtree", "conversation", "leaves")
+
+
+def _role(speaker):
+    if speaker in ("user", "system"):
+        return speaker
+    return "assistant"
+
+
+def to_openai(path):
+    """Chat Completions payload for a root -> message path"""
+    return {
+        "messages": [
+            {"role": _role(message.speaker), "content": message.content}
+            for message in path
+        ]
+    }
+
+
+def to_anthropic(path):
+    """Messages API payload for a root -> message path
+
+    System messages move to the top-level `system` field and consecutive
+    turns of the same role are merged, as the API requires alternation.
+    """
+    system = []
+    messages = []
+    for message in path:
+        role = _role(message.speaker)
+        if role == "system":
+            system.append(message.content)
+        elif messages and messages[-1]["role"] == role:
+            messages[-1]["content"] += "\n\n" + message.content
+        else:
+            messages.append({"role": role, "content": message.content})
+
+    payload = {"messages": messages}
+    if system:
+        payload["system"] = "\n\n".join(system)
+    return payload
+
+
+FORMATTERS = {"openai": to_openai, "anthropic": to_anthropic}
+
+
+def _walk_rows(session, walk):
+    """Depth-first (row, depth) pairs, fetching content one chunk at a time"""
+    while True:
+        chunk = list(islice(walk, IN_CLAUSE_CHUNK))
+        if not chunk:
+            return
+        stmt = select(Message.id, Message.speaker, Message.content).where(
+            Message.id.in_([message_id for message_id, _ in chunk])
+        )
+        rows = {row.id: row for row in session.execute(stmt)}
+        for message_id, depth in chunk:
+            # Deleted since the index was loaded
+            if message_id not in rows:
+                raise LookupError(f"No message {message_id}")
+            yield rows[message_id], depth
+
+
+def iter_leaf_paths(session, root_id=None, conversation_id=None):
+    """Yield every root -> leaf path, optionally only those through root_id
+    or within one conversation
+
+    Only the id/parent_id structure is held in memory, as a TreeIndex;
+    message content is streamed in depth-first order and kept just for the
+    current path.
+    """
+    if root_id is not None:
+        # A subtree is one slice of its conversation's pre-order
+        conversation_id = conversation_of(session, root_id)
+        if conversation_id is None:
+            return
+    index = load_tree_index(session, conversation_id)
+
+    prefix = []
+    if root_id is not None:
+        if root_id not in index:
+            return
+        prefix = get_path_from_root(session, root_id)[:-1]
+
+    path = list(prefix)
+    base = len(prefix)
+    for row, depth in _walk_rows(session, index.walk(root_id)):
+        del path[base + depth :]
+        path.append(row)
+        if index.is_leaf(row.id):
+            yield list(path)
+
+
+def iter_paths(session, mode="leaves", message_id=None):
+    """Paths selected by an export mode, as an iterator
+
+    Arguments are checked before anything is yielded: LookupError if the
+    message doesn't exist.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown export mode {mode!r}")
+    if mode != "leaves" and message_id is None:
+        raise ValueError(f"mode {mode!r} needs a message id")
+    conversation_id = None
+    if message_id is not None:
+        conversation_id = conversation_of(session, message_id)
+        if conversation_id is None:
+            raise LookupError(f"No message {message_id}")
+    return _iter_paths(session, mode, message_id, conversation_id)
+
+
+def _iter_paths(session, mode, message_id, conversation_id):
+    if mode == "path":
+        yield get_path_from_root(session, message_id)
+    elif mode == "subtree":
+        yield from iter_leaf_paths(session, message_id)
+    elif mode == "conversation":
+        yield from iter_leaf_paths(session, conversation_id=conversation_id)
+    else:
+        yield from iter_leaf_paths(session)
+
+
+def iter_export(
+    session, mode="leaves", message_id=None, fmt="openai", budget=None, summarizer=None
+):
+    """One JSON-serialisable payload per exported path, as an iterator
+
+    Raises like iter_paths before yielding. With a token budget every path
+    is compressed first; leaf paths sharing a prefix then share their
+    cached summaries.
+    """
+    if fmt not in FORMATTERS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    paths = iter_paths(session, mode, message_id)
+    return _payloads(session, paths, FORMATTERS[fmt], budget, summarizer)
+
+
+def _payloads(session, paths, formatter, budget, summarizer):
+    for path in paths:
+        if budget is not None:
+            path = compress_path(session, path[-1].id, budget, summarizer).turns
+        yield formatter(path)
+
+
+def write_jsonl(payloads, fp):
+    """Write payloads one per line and return how many were written"""
+    count = 0
+    for payload in payloads:
+        fp.write(json.dumps(payload, ensure_ascii=False))
+        fp.write("\n")
+        count += 1
+    return count
@@ -0,0 +1,388 @@
+"""Streaming bulk import of ChatGPT, Claude and JSONL conversation exports"""
+
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+from datetime import UTC, datetime
+
+from sqlalchemy import func, select
+
+from .bodies import insert_messages
+from .models import ImportCheckpoint, Message
+from .tokens import count_tokens
+
+FORMATS = ("auto", "chatgpt", "claude", "jsonl")
+
+DEFAULT_BATCH_SIZE = 5000
+# Rows per transaction; the checkpoint is committed together with them
+DEFAULT_COMMIT_EVERY = 50000
+READ_CHUNK = 1 << 20
+
+ROLE_MAP = {"human": "user", "user": "user", "assistant": "assistant"}
+
+
+class ExportFormatError(ValueError):
+    """Raised for unreadable or unrecognised export files"""
+
+
+def iter_json_array(fp, chunk_size=READ_CHUNK):
+    """Yield the elements of a top-level JSON array without loading the file
+
+    Elements are decoded one at a time with raw_decode; when an element is
+    cut off by the end of the buffer the read size doubles until it fits.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fp.read(chunk_size)
+    pos = _skip_ws(buffer, 0)
+    if pos >= len(buffer) or buffer[pos] != "[":
+        raise ExportFormatError("expected a JSON array at the top level")
+    pos += 1
+    read_size = chunk_size
+    eof = False
+
+    while True:
+        pos = _skip_ws(buffer, pos)
+        if pos < len(buffer) and buffer[pos] in ",]":
+            if buffer[pos] == "]":
+                return
+            pos = _skip_ws(buffer, pos + 1)
+
+        if pos >= len(buffer) and not eof:
+            buffer, pos, eof = _refill(fp, buffer, pos, read_size)
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ExportFormatError("truncated or invalid JSON array")
+            buffer, pos, eof = _refill(fp, buffer, pos, read_size)
+            read_size *= 2
+            continue
+
+        read_size = chunk_size
+        pos = end
+        yield value
+
+
+def _skip_ws(buffer, pos):
+    while pos < len(buffer) and buffer[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _refill(fp, buffer, pos, read_size):
+    chunk = fp.read(read_size)
+    return buffer[pos:] + chunk, 0, not chunk
+
+
+def iter_jsonl(fp):
+    """Yield one decoded object per non-empty line"""
+    for line_no, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ExportFormatError(f"line {line_no}: {e}") from e
+
+
+def _to_datetime(value, fallback=None):
+    """Naive UTC datetime from an epoch number or ISO-8601 string"""
+    if value is None or value == "":
+        return fallback
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=UTC).replace(tzinfo=None)
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return fallback
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(UTC).replace(tzinfo=None)
+    return parsed
+
+
+def _utcnow():
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def _text_from_parts(parts):
+    texts = []
+    for part in parts or []:
+        if isinstance(part, str):
+            texts.append(part)
+        elif isinstance(part, dict) and isinstance(part.get("text"), str):
+            texts.append(part["text"])
+    return "\n".join(text for text in texts if text)
+
+
+def parse_chatgpt_conversation(conversation):
+    """Yield (key, parent_key, speaker, content, timestamp) from a `mapping` tree
+
+    Nodes without visible text (the synthetic root, hidden system prompts,
+    empty tool calls) are dropped and their children re-attached to the
+    nearest kept ancestor. Output is parents-first.
+    """
+    mapping = conversation.get("mapping") or {}
+    fallback_time = _to_datetime(conversation.get("create_time"))
+    roots = [
+        key
+        for key, node in mapping.items()
+        if not node.get("parent") or node.get("parent") not in mapping
+    ]
+
+    # (node key, key of the nearest kept ancestor)
+    stack = [(key, None) for key in reversed(roots)]
+    while stack:
+        key, kept_parent = stack.pop()
+        node = mapping[key]
+        message = node.get("message") or {}
+        content = message.get("content") or {}
+        if content.get("content_type") == "code":
+            text = content.get("text") or ""
+        else:
+            text = _text_from_parts(content.get("parts")) or content.get("text") or ""
+        role = (message.get("author") or {}).get("role")
+
+        if text.strip() and role:
+            yield (
+                key,
+                kept_parent,
+                ROLE_MAP.get(role, role),
+                text,
+                _to_datetime(message.get("create_time"), fallback_time),
+            )
+            kept_parent = key
+
+        for child in reversed(node.get("children") or []):
+            if child in mapping:
+                stack.append((child, kept_parent))
+
+
+def parse_claude_conversation(conversation):
+    """Yield message tuples from a Claude export conversation
+
+    Uses parent_message_uuid when the export has it (branching edits),
+    otherwise chains messages in order.
+    """
+    fallback_time = _to_datetime(conversation.get("created_at"))
+    # Message key -> nearest kept ancestor (itself when kept)
+    kept = {}
+    previous = None
+    for index, message in enumerate(conversation.get("chat_messages") or []):
+        key = message.get("uuid") or f"#{index}"
+        if "parent_message_uuid" in message:
+            parent = kept.get(message["parent_message_uuid"])
+        else:
+            parent = previous
+
+        text = message.get("text") or _text_from_parts(message.get("content"))
+        if not text:
+            kept[key] = parent
+            continue
+
+        sender = message.get("sender") or message.get("role") or "user"
+        yield (
+            key,
+            parent,
+            ROLE_MAP.get(sender, sender),
+            text,
+            _to_datetime(message.get("created_at"), fallback_time),
+        )
+        kept[key] = key
+        previous = key
+
+
+def parse_message_list(record):
+    """Yield message tuples from an OpenAI-style {"messages": [...]} record"""
+    previous = None
+    for index, message in enumerate(record.get("messages") or []):
+        content = message.get("content")
+        text = content if isinstance(content, str) else _text_from_parts(content)
+        if not text:
+            continue
+        role = message.get("role") or message.get("speaker") or "user"
+        yield (
+            index,
+            previous,
+            ROLE_MAP.get(role, role),
+            text,
+            _to_datetime(message.get("timestamp") or message.get("created_at")),
+        )
+        previous = index
+
+
+def parse_record(record):
+    """Pick the parser for one conversation record by its shape"""
+    if "mapping" in record:
+        return parse_chatgpt_conversation(record)
+    if "chat_messages" in record:
+        return parse_claude_conversation(record)
+    if "messages" in record:
+        return parse_message_list(record)
+    raise ExportFormatError(f"unrecognised conversation record keys: {sorted(record)[:5]}")
+
+
+def open_records(path, fmt="auto"):
+    """Stream the conversation records of an export (.json, .jsonl or .zip)
+
+    Zip exports are read from their conversations.json, so fmt can't be
+    jsonl for them. The file is closed once the records are exhausted or the generator is
+    closed.
+    """
+    if fmt not in FORMATS:
+        raise ExportFormatError(f"unknown format {fmt!r}")
+
+    if zipfile.is_zipfile(path):
+        if fmt == "jsonl":
+            raise ExportFormatError("zip exports hold conversations.json, not JSONL")
+        with zipfile.ZipFile(path) as archive:
+            names = [n for n in archive.namelist() if n.endswith("conversations.json")]
+            if not names:
+                raise ExportFormatError("no conversations.json in archive")
+            with io.TextIOWrapper(archive.open(names[0]), encoding="utf-8") as fp:
+                yield from iter_json_array(fp)
+        return
+
+    with open(path, encoding="utf-8") as fp:
+        if fmt == "jsonl" or (fmt == "auto" and path.endswith(".jsonl")):
+            yield from iter_jsonl(fp)
+        else:
+            yield from iter_json_array(fp)
+
+
+class ImportStats:
+    """Counters and throughput reporting for an import run"""
+
+    def __init__(self, out=sys.stderr, interval=2.0):
+        self.records = 0
+        self.messages = 0
+        self.skipped_records = 0
+        self.started = time.perf_counter()
+        self._out = out
+        self._interval = interval
+        self._last_report = self.started
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.messages / self.elapsed if self.elapsed else 0.0
+
+    def maybe_report(self):
+        now = time.perf_counter()
+        if self._out is not None and now - self._last_report >= self._interval:
+            self._last_report = now
+            self.report()
+
+    def report(self, final=False):
+        if self._out is None:
+            return
+        label = "Imported" if final else "Importing"
+        print(
+            f"{label}: {self.messages:,} messages from {self.records:,} "
+            f"conversations in {self.elapsed:.1f}s ({self.rows_per_second:,.0f} rows/s)",
+            file=self._out,
+        )
+
+
+def import_export(
+    session,
+    path,
+    fmt="auto",
+    batch_size=DEFAULT_BATCH_SIZE,
+    commit_every=DEFAULT_COMMIT_EVERY,
+    restart=False,
+    out=sys.stderr,
+):
+    """Stream an export file into the messages table
+
+    Rows are inserted with batched Core INSERTs and committed together with
+    an ImportCheckpoint, so rerunning after an interruption skips the
+    conversations that were already committed.
+    """
+    source = os.path.abspath(path)
+    source_size = os.path.getsize(source)
+    stats = ImportStats(out=out)
+
+    checkpoint = session.get(ImportCheckpoint, source)
+    if checkpoint is not None and (restart or checkpoint.source_size != source_size):
+        session.delete(checkpoint)
+        session.flush()
+        checkpoint = None
+    if checkpoint is not None and checkpoint.completed:
+        if out is not None:
+            print(f"{path} was already imported; use --restart to import again", file=out)
+        return stats
+    if checkpoint is None:
+        checkpoint = ImportCheckpoint(source=source, source_size=source_size)
+        session.add(checkpoint)
+    resume_from = checkpoint.records_done or 0
+
+    next_id = (session.scalar(select(func.max(Message.id))) or 0) + 1
+    now = _utcnow()
+    batch = []
+    uncommitted = 0
+
+    def flush_batch():
+        nonlocal batch
+        if batch:
+            insert_messages(session, batch)
+            batch = []
+
+    def commit():
+        nonlocal uncommitted
+        flush_batch()
+        checkpoint.records_done = stats.records + stats.skipped_records
+        checkpoint.messages_done = (checkpoint.messages_done or 0) + uncommitted
+        checkpoint.updated_at = _utcnow()
+        session.commit()
+        uncommitted = 0
+
+    for index, record in enumerate(open_records(source, fmt)):
+        if index < resume_from:
+            stats.skipped_records += 1
+            continue
+
+        ids = {}
+        root_ids = {}
+        path_tokens = {}
+        for key, parent_key, speaker, content, timestamp in parse_record(record):
+            ids[key] = next_id
+            root_ids[key] = root_ids.get(parent_key, next_id)
+            tokens = count_tokens(content)
+            path_tokens[key] = path_tokens.get(parent_key, 0) + tokens
+            batch.append(
+                {
+                    "id": next_id,
+                    "parent_id": ids.get(parent_key),
+                    "root_id": root_ids[key],
+                    "timestamp": timestamp or now,
+                    "speaker": speaker,
+                    "content": content,
+                    "token_count": tokens,
+                    "path_token_count": path_tokens[key],
+                }
+            )
+            next_id += 1
+            stats.messages += 1
+            uncommitted += 1
+            if len(batch) >= batch_size:
+                flush_batch()
+
+        stats.records += 1
+        # Commit only on conversation boundaries so a resume never splits one
+        if uncommitted >= commit_every:
+            commit()
+        stats.maybe_report()
+
+    checkpoint.completed = True
+    commit()
+    stats.report(final=True)
+    return stats
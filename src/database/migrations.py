@@ -0,0 +1,352 @@
+"""Versioned schema migrations and SQLite connection tuning"""
+
+import hashlib
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from .body_codecs import register_sql_functions
+from .models import CHANGE_LOG_TRIGGERS, ROOT_ID_TRIGGER, make_preview
+
+# Connection pragmas applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # negative = KiB, so ~64 MB of page cache
+    "mmap_size": 268435456,
+    "busy_timeout": 5000,
+}
+
+
+def configure_sqlite(engine, pragmas=None):
+    """Apply performance pragmas and SQL functions to every new connection"""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})}
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        register_sql_functions(dbapi_connection)
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _add_message_indexes(connection):
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_parent_id ON messages (parent_id)"
+    )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_timestamp ON messages (timestamp)"
+    )
+
+
+def _table_columns(connection, table):
+    return {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def _add_token_count_columns(connection):
+    # Fresh databases already got the columns from create_all
+    existing = _table_columns(connection, "messages")
+    for column in ("token_count", "path_token_count"):
+        if column not in existing:
+            connection.exec_driver_sql(
+                f"ALTER TABLE messages ADD COLUMN {column} INTEGER"
+            )
+
+
+# External-content FTS5 index over message text; the triggers keep it in
+# step with every write, including bulk Core inserts and external writers.
+# Before schema 4 the text lived in messages.content.
+CONTENT_FTS_STATEMENTS = [
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "content, content='messages', content_rowid='id', tokenize='unicode61')"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages "
+        "BEGIN INSERT INTO messages_fts (rowid, content) "
+        "VALUES (new.id, new.content); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages "
+        "BEGIN INSERT INTO messages_fts (messages_fts, rowid, content) "
+        "VALUES ('delete', old.id, old.content); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content "
+        "ON messages BEGIN "
+        "INSERT INTO messages_fts (messages_fts, rowid, content) "
+        "VALUES ('delete', old.id, old.content); "
+        "INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content); END"
+    ),
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+]
+
+# Text of a message_bodies row in queries and migrations; compressed
+# bodies go through the body_text() function every app connection registers
+BODY_TEXT_SQL = (
+    "CASE WHEN message_bodies.codec IS NULL THEN message_bodies.content "
+    "ELSE body_text(message_bodies.content, message_bodies.codec) END"
+)
+
+
+def _fts_trigger_sql(row, op):
+    """Index (op "insert") or unindex ("delete") the body of a trigger row
+
+    Plain bodies are handled in SQL; compressed ones are queued in
+    message_fts_pending for index_pending_texts, as only Python can decode
+    them.
+    """
+    if op == "insert":
+        index = "INSERT INTO messages_fts (rowid, content) "
+        values = f"{row}.id, content"
+    else:
+        index = "INSERT INTO messages_fts (messages_fts, rowid, content) "
+        values = f"'delete', {row}.id, content"
+    return (
+        f"{index}SELECT {values} FROM message_bodies "
+        f"WHERE hash = {row}.body_hash AND codec IS NULL; "
+        "INSERT INTO message_fts_pending (message_id, body_hash, op) "
+        f"SELECT {row}.id, {row}.body_hash, '{op}' FROM message_bodies "
+        f"WHERE hash = {row}.body_hash AND codec IS NOT NULL; "
+    )
+
+
+# From schema 4 the text lives in message_bodies; the index reads it
+# through the message_texts view. Nothing here calls a function only app
+# connections register, so other sqlite3 clients can still write messages;
+# the view shows compressed bodies as NULL and search decodes those itself.
+BODY_FTS_VIEW_STATEMENTS = [
+    (
+        "CREATE VIEW IF NOT EXISTS message_texts AS SELECT messages.id AS id, "
+        "CASE WHEN message_bodies.codec IS NULL THEN message_bodies.content END "
+        "AS content FROM messages "
+        "JOIN message_bodies ON message_bodies.hash = messages.body_hash"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages "
+        f"BEGIN {_fts_trigger_sql('new', 'insert')}END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages "
+        f"BEGIN {_fts_trigger_sql('old', 'delete')}END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF body_hash "
+        f"ON messages BEGIN {_fts_trigger_sql('old', 'delete')}"
+        f"{_fts_trigger_sql('new', 'insert')}END"
+    ),
+]
+BODY_FTS_STATEMENTS = [
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, "
+        "content='message_texts', content_rowid='id', tokenize='unicode61')"
+    ),
+    *BODY_FTS_VIEW_STATEMENTS,
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    # The rebuild sees compressed bodies as NULL; queue them for Python
+    (
+        "INSERT INTO message_fts_pending (message_id, body_hash, op) "
+        "SELECT messages.id, messages.body_hash, 'insert' FROM messages "
+        "JOIN message_bodies ON message_bodies.hash = messages.body_hash "
+        "WHERE message_bodies.codec IS NOT NULL"
+    ),
+]
+
+
+def _add_message_fts(connection):
+    # Fresh databases are created with the current (body table) layout
+    if "body_hash" in _table_columns(connection, "messages"):
+        statements = BODY_FTS_STATEMENTS
+    else:
+        statements = CONTENT_FTS_STATEMENTS
+    try:
+        connection.exec_driver_sql("SAVEPOINT add_fts")
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("RELEASE SAVEPOINT add_fts")
+    except OperationalError:
+        # SQLite built without FTS5: search falls back to LIKE scans
+        connection.exec_driver_sql("ROLLBACK TO SAVEPOINT add_fts")
+        connection.exec_driver_sql("RELEASE SAVEPOINT add_fts")
+
+
+def _drop_message_fts(connection):
+    """Drop the FTS index; returns whether there was one"""
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+    ).first()
+    for trigger in ("insert", "delete", "update"):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS messages_fts_{trigger}")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS messages_fts")
+    return exists is not None
+
+
+def _sha256_hex(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _move_content_to_bodies(connection):
+    if "content" not in _table_columns(connection, "messages"):
+        return
+
+    # The hash must match models.compute_body_hash
+    connection.connection.dbapi_connection.create_function(
+        "sha256_hex", 1, _sha256_hex, deterministic=True
+    )
+    if "body_hash" not in _table_columns(connection, "messages"):
+        connection.exec_driver_sql(
+            "ALTER TABLE messages ADD COLUMN body_hash VARCHAR "
+            "REFERENCES message_bodies (hash)"
+        )
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO message_bodies (hash, content, size) "
+        "SELECT sha256_hex(content), content, length(CAST(content AS BLOB)) "
+        "FROM messages"
+    )
+    # Moving the text isn't an edit; keep it out of the change-sync log
+    last_change = connection.exec_driver_sql(
+        "SELECT coalesce(max(seq), 0) FROM message_changes"
+    ).scalar()
+    connection.exec_driver_sql("UPDATE messages SET body_hash = sha256_hex(content)")
+    connection.exec_driver_sql(
+        "DELETE FROM message_changes WHERE seq > ?", (last_change,)
+    )
+
+    had_fts = _drop_message_fts(connection)
+    connection.exec_driver_sql("ALTER TABLE messages DROP COLUMN content")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_body_hash ON messages (body_hash)"
+    )
+    if had_fts:
+        _add_message_fts(connection)
+
+
+def _add_body_codec(connection):
+    # Fresh databases already got the column from create_all
+    if "codec" not in _table_columns(connection, "message_bodies"):
+        connection.exec_driver_sql("ALTER TABLE message_bodies ADD COLUMN codec VARCHAR")
+
+    _replace_fts_view(connection)
+
+
+def _replace_fts_view(connection):
+    has_fts = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+    ).first()
+    if has_fts is None:
+        return
+    # The indexed text is unchanged, so only the view and triggers are
+    # replaced; no rebuild
+    connection.exec_driver_sql("DROP VIEW IF EXISTS message_texts")
+    for trigger in ("insert", "delete", "update"):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS messages_fts_{trigger}")
+    for statement in BODY_FTS_VIEW_STATEMENTS:
+        connection.exec_driver_sql(statement)
+
+
+def _add_message_preview(connection):
+    # Fresh databases already got the column from create_all
+    if "preview" not in _table_columns(connection, "messages"):
+        connection.exec_driver_sql("ALTER TABLE messages ADD COLUMN preview VARCHAR")
+
+    connection.connection.dbapi_connection.create_function(
+        "make_preview", 1, make_preview, deterministic=True
+    )
+    # Filling a derived column isn't an edit; keep it out of the change-sync log
+    last_change = connection.exec_driver_sql(
+        "SELECT coalesce(max(seq), 0) FROM message_changes"
+    ).scalar()
+    connection.exec_driver_sql(
+        f"UPDATE messages SET preview = (SELECT make_preview({BODY_TEXT_SQL}) "
+        "FROM message_bodies WHERE message_bodies.hash = messages.body_hash) "
+        "WHERE preview IS NULL"
+    )
+    connection.exec_driver_sql(
+        "DELETE FROM message_changes WHERE seq > ?", (last_change,)
+    )
+
+
+def _add_message_root_id(connection):
+    # Fresh databases already got the column, index and triggers
+    if "root_id" not in _table_columns(connection, "messages"):
+        connection.exec_driver_sql("ALTER TABLE messages ADD COLUMN root_id INTEGER")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_root_id ON messages (root_id)"
+    )
+    # The change log must skip root_id fills from now on
+    connection.exec_driver_sql("DROP TRIGGER IF EXISTS messages_after_update")
+    for statement in [*CHANGE_LOG_TRIGGERS, ROOT_ID_TRIGGER]:
+        connection.exec_driver_sql(statement)
+
+    # Roots (and orphans) first, then every descendant inherits their id
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE message_roots (id INTEGER PRIMARY KEY, root_id INTEGER)"
+    )
+    connection.exec_driver_sql(
+        "WITH RECURSIVE tree (id, root_id) AS ("
+        "SELECT id, id FROM messages WHERE parent_id IS NULL "
+        "OR parent_id NOT IN (SELECT id FROM messages) "
+        "UNION ALL SELECT messages.id, tree.root_id FROM messages "
+        "JOIN tree ON messages.parent_id = tree.id) "
+        "INSERT INTO message_roots (id, root_id) SELECT id, root_id FROM tree"
+    )
+    connection.exec_driver_sql(
+        "UPDATE messages SET root_id = message_roots.root_id FROM message_roots "
+        "WHERE message_roots.id = messages.id AND messages.root_id IS NULL"
+    )
+    connection.exec_driver_sql("DROP TABLE message_roots")
+
+
+def _add_change_log_pause(connection):
+    # Fresh databases already got the trigger from create_all
+    connection.exec_driver_sql("DROP TRIGGER IF EXISTS messages_after_update")
+    connection.exec_driver_sql(CHANGE_LOG_TRIGGERS[0])
+
+
+# (version, description, upgrade function); append only, never renumber
+MIGRATIONS = [
+    (1, "Index messages.parent_id and messages.timestamp", _add_message_indexes),
+    (2, "Add messages.token_count and path_token_count", _add_token_count_columns),
+    (3, "Add the messages_fts full-text index", _add_message_fts),
+    (4, "Move message text into deduplicated message_bodies", _move_content_to_bodies),
+    (5, "Add message_bodies.codec for compressed bodies", _add_body_codec),
+    (6, "Add and fill messages.preview", _add_message_preview),
+    (7, "Add and fill messages.root_id", _add_message_root_id),
+    (8, "Index compressed bodies without body_text() in triggers", _replace_fts_view),
+    (9, "Let derived-column backfills skip the change log", _add_change_log_pause),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection):
+    """Schema version stored in the database (0 for unversioned files)"""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine):
+    """Upgrade the database in place; returns (old version, new version)"""
+    if engine.dialect.name != "sqlite":
+        return LATEST_VERSION, LATEST_VERSION
+
+    with engine.connect() as connection:
+        start = current = get_schema_version(connection)
+        for version, description, upgrade in MIGRATIONS:
+            if version <= current:
+                continue
+            # Each step commits on its own so an interrupted upgrade resumes
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                upgrade(connection)
+                connection.exec_driver_sql(f"PRAGMA user_version={version}")
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            current = version
+    return start, current
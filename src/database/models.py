@@ -1,12 +1,97 @@
 """SQLAlchemy models for chat messages"""
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    Integer,
+    String,
+    DateTime,
+    ForeignKey,
+    UniqueConstraint,
+    case,
+    event,
+    func,
+    select,
+    update,
+    literal,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session, relationship, backref, attributes, selectinload
 from datetime import datetime
+import hashlib
+
+from .body_codecs import decode_body, encode_body
+from .tokens import count_tokens
 
 Base = declarative_base()
 
+# Characters kept in messages.preview, enough for tree labels and graph boxes
+PREVIEW_LENGTH = 160
+
+
+def compute_body_hash(content):
+    """Key of a message body in message_bodies"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def make_preview(content):
+    """Whitespace-collapsed start of a message, ending in … when cut"""
+    head = content[: PREVIEW_LENGTH * 4]
+    preview = " ".join(head.split())
+    if len(preview) > PREVIEW_LENGTH or len(head) < len(content):
+        preview = preview[: PREVIEW_LENGTH - 1] + "…"
+    return preview
+
+
+class MessageBody(Base):
+    """Message text stored once per distinct content, keyed by its hash"""
+
+    __tablename__ = "message_bodies"
+
+    hash = Column(String, primary_key=True)
+    # The text, or a BLOB of compressed UTF-8 when codec is set
+    stored = Column("content", String, nullable=False)
+    size = Column(Integer, nullable=False)  # UTF-8 bytes of the text
+    codec = Column(String, nullable=True)
+
+    @hybrid_property
+    def content(self):
+        """The text, decompressed on each access"""
+        return decode_body(self.stored, self.codec)
+
+    @content.inplace.expression
+    @classmethod
+    def _content_expression(cls):
+        return case(
+            (cls.codec.is_(None), cls.stored),
+            else_=func.body_text(cls.stored, cls.codec),
+        )
+
+    def __repr__(self):
+        return f"<MessageBody(hash={self.hash[:12]}, size={self.size}, codec={self.codec})>"
+
+
+def insert_bodies(session, bodies):
+    """Write {hash: text} bodies, skipping hashes that are already stored
+
+    Bodies over the compression threshold are stored compressed.
+    """
+    if not bodies:
+        return
+    session.execute(
+        sqlite_insert(MessageBody.__table__).on_conflict_do_nothing(),
+        [_body_row(hash_, content) for hash_, content in bodies.items()],
+    )
+
+
+def _body_row(hash_, content):
+    size = len(content.encode("utf-8"))
+    stored, codec = encode_body(content, size)
+    return {"hash": hash_, "content": stored, "size": size, "codec": codec}
+
 
 class Message(Base):
     """Chat message model with tree structure support"""
@@ -14,27 +99,351 @@ class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True)
-    parent_id = Column(Integer, ForeignKey("messages.id"), nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    parent_id = Column(Integer, ForeignKey("messages.id"), nullable=True, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     speaker = Column(String, nullable=False)  # 'user' or 'assistant'
-    content = Column(String, nullable=False)
+    body_hash = Column(
+        String, ForeignKey("message_bodies.hash"), nullable=False, index=True
+    )
+    # Root of the conversation tree; orphans count as their own root
+    root_id = Column(Integer, nullable=True, index=True)
+    # Short single-line start of the text, so views never need the body
+    preview = Column(String, nullable=True)
+    # Tokens in content, and in the whole root -> message path
+    token_count = Column(Integer, nullable=True)
+    path_token_count = Column(Integer, nullable=True)
 
     # Self-referential relationship for tree structure
     children = relationship(
         "Message", backref=backref("parent", remote_side=[id]), foreign_keys=[parent_id]
     )
+    # Deferred until content is read; bulk readers use selectinload(Message.body)
+    body = relationship(MessageBody, viewonly=True)
+
+    # (hash, text) assigned through `content` and not yet written/reloaded
+    _new_body = None
+
+    @hybrid_property
+    def content(self):
+        if self._new_body is not None and self._new_body[0] == self.body_hash:
+            return self._new_body[1]
+        return self.body.content
+
+    @content.inplace.setter
+    def _content_setter(self, value):
+        self.body_hash = compute_body_hash(value)
+        self._new_body = (self.body_hash, value)
+
+    @content.inplace.expression
+    @classmethod
+    def _content_expression(cls):
+        return (
+            select(MessageBody.content)
+            .where(MessageBody.hash == cls.body_hash)
+            .scalar_subquery()
+        )
 
     def __repr__(self):
         return f"<Message(id={self.id}, speaker={self.speaker}, parent_id={self.parent_id})>"
 
     def get_path_from_root(self, session):
         """Get the full conversation path from root to this message"""
-        path = []
-        current = self
-        while current:
-            path.insert(0, current)
-            if current.parent_id:
-                current = session.query(Message).filter_by(id=current.parent_id).first()
-            else:
-                current = None
-        return path
+        return get_path_from_root(session, self.id)
+
+
+class MessageChange(Base):
+    """Log of updated/deleted message ids, written by triggers for change sync"""
+
+    __tablename__ = "message_changes"
+
+    seq = Column(Integer, primary_key=True)
+    message_id = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<MessageChange(seq={self.seq}, message_id={self.message_id})>"
+
+
+class ChangeLogPause(Base):
+    """While a row exists, updates aren't logged in message_changes
+
+    Written and deleted inside one write transaction by bulk updates of
+    derived columns, so other connections never see it.
+    """
+
+    __tablename__ = "message_change_pauses"
+
+    id = Column(Integer, primary_key=True)
+
+
+class PendingFtsChange(Base):
+    """Search index change queued by the FTS triggers for a compressed body
+
+    Triggers can't decompress (SQL functions are per connection, and other
+    sqlite3 clients must still be able to write), so Python applies these;
+    see index_pending_texts.
+    """
+
+    __tablename__ = "message_fts_pending"
+
+    seq = Column(Integer, primary_key=True)
+    message_id = Column(Integer, nullable=False)
+    body_hash = Column(String, nullable=False)
+    op = Column(String, nullable=False)  # "insert" or "delete"
+
+    def __repr__(self):
+        return (
+            f"<PendingFtsChange(seq={self.seq}, message_id={self.message_id}, "
+            f"op={self.op})>"
+        )
+
+
+class ImportCheckpoint(Base):
+    """Progress of a bulk import, so an interrupted run can resume"""
+
+    __tablename__ = "import_checkpoints"
+
+    source = Column(String, primary_key=True)  # absolute path of the export
+    source_size = Column(Integer, nullable=False)
+    records_done = Column(Integer, nullable=False, default=0)
+    messages_done = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return (
+            f"<ImportCheckpoint(source={self.source}, "
+            f"records_done={self.records_done}, completed={self.completed})>"
+        )
+
+
+class Summary(Base):
+    """Cached summary of one path segment ending at ancestor_id
+
+    The root -> ancestor path is unique, so every branch below the ancestor
+    reuses the row as long as the segment's content hash and the summarizer
+    configuration match.
+    """
+
+    __tablename__ = "summaries"
+    __table_args__ = (UniqueConstraint("ancestor_id", "content_hash", "config"),)
+
+    id = Column(Integer, primary_key=True)
+    ancestor_id = Column(Integer, ForeignKey("messages.id"), nullable=False, index=True)
+    content_hash = Column(String, nullable=False)
+    config = Column(String, nullable=False)
+    start_depth = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    content = Column(String, nullable=False)
+    token_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return (
+            f"<Summary(id={self.id}, ancestor_id={self.ancestor_id}, "
+            f"messages={self.message_count}, config={self.config})>"
+        )
+
+
+# New rows are picked up through the max-id watermark; only edits and
+# deletes need logging, so bulk inserts don't pay for the triggers.
+# Filling in root_id right after an insert isn't an edit either, nor are
+# updates made while a ChangeLogPause row exists.
+CHANGE_LOG_TRIGGERS = [
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_after_update AFTER UPDATE ON messages "
+        "WHEN NOT (old.root_id IS NULL AND new.root_id IS NOT NULL) "
+        "AND NOT EXISTS (SELECT 1 FROM message_change_pauses) "
+        "BEGIN INSERT INTO message_changes (message_id) VALUES (new.id); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS messages_after_delete AFTER DELETE ON messages "
+        "BEGIN INSERT INTO message_changes (message_id) VALUES (old.id); END"
+    ),
+]
+
+# Rows inserted without a root_id (new roots whose id is only known after
+# the insert, Core or external writers) inherit it from their parent
+ROOT_ID_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS messages_fill_root_id AFTER INSERT ON messages "
+    "WHEN new.root_id IS NULL BEGIN "
+    "UPDATE messages SET root_id = coalesce("
+    "(SELECT root_id FROM messages WHERE id = new.parent_id), new.id) "
+    "WHERE id = new.id; END"
+)
+
+# Hooked on messages, which may be created after message_changes
+for _statement in [*CHANGE_LOG_TRIGGERS, ROOT_ID_TRIGGER]:
+    event.listen(Message.__table__, "after_create", DDL(_statement))
+
+
+def ancestor_chain_cte(message_id, name="ancestors"):
+    """Recursive CTE yielding (id, depth) for a message and all its ancestors
+
+    depth counts upwards from the message itself (0) to the root. Give
+    chains used in the same statement distinct names.
+    """
+    chain = (
+        select(Message.id, Message.parent_id, literal(0).label("depth"))
+        .where(Message.id == message_id)
+        .cte(name, recursive=True)
+    )
+    return chain.union_all(
+        select(Message.id, Message.parent_id, chain.c.depth + 1).where(
+            Message.id == chain.c.parent_id
+        )
+    )
+
+
+def subtree_cte(root_id):
+    """Recursive CTE yielding the id of a message and of all its descendants"""
+    subtree = (
+        select(Message.id).where(Message.id == root_id).cte("subtree", recursive=True)
+    )
+    return subtree.union_all(
+        select(Message.id).where(Message.parent_id == subtree.c.id)
+    )
+
+
+def get_path_from_root(session, message_id):
+    """Fetch the root -> message path with content, already ordered"""
+    chain = ancestor_chain_cte(message_id)
+    stmt = (
+        select(Message)
+        .join(chain, Message.id == chain.c.id)
+        .order_by(chain.c.depth.desc())
+        .options(selectinload(Message.body))
+    )
+    return list(session.scalars(stmt))
+
+
+def _parent_of(session, message, pending):
+    parent = message.__dict__.get("parent")
+    if parent is None and message.parent_id is not None:
+        parent = pending.get(message.parent_id) or session.get(
+            Message, message.parent_id
+        )
+    return parent
+
+
+def _fill_path_total(session, message, pending):
+    """Set path_token_count from the nearest ancestor that already has one"""
+    chain = []
+    current = message
+    while current is not None and (
+        current.path_token_count is None or current is message
+    ):
+        chain.append(current)
+        current = _parent_of(session, current, pending)
+        if current in chain:
+            current = None
+            break
+
+    total = current.path_token_count if current is not None else 0
+    for node in reversed(chain):
+        if node.token_count is None:
+            node.token_count = count_tokens(node.content)
+        total += node.token_count
+        node.path_token_count = total
+
+
+@event.listens_for(Session, "before_flush")
+def _write_message_bodies(session, flush_context, instances):
+    """Store the bodies of new or edited messages once per distinct hash"""
+    bodies = {}
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Message) and obj._new_body is not None:
+            hash_, content = obj._new_body
+            if hash_ == obj.body_hash:
+                bodies[hash_] = content
+                obj.preview = make_preview(content)
+    insert_bodies(session, bodies)
+
+
+@event.listens_for(Session, "before_flush")
+def _update_root_ids(session, flush_context, instances):
+    """Set root_id on new messages and on every message below a moved one
+
+    New roots without an id yet are left to the messages_fill_root_id
+    trigger.
+    """
+    new = sorted(
+        (obj for obj in session.new if isinstance(obj, Message)),
+        key=lambda obj: obj.id or 0,
+    )
+    moved = [
+        obj
+        for obj in session.dirty
+        if isinstance(obj, Message)
+        and attributes.get_history(obj, "parent_id").has_changes()
+    ]
+    if not new and not moved:
+        return
+
+    pending = {obj.id: obj for obj in new if obj.id is not None}
+    with session.no_autoflush:
+        for message in new:
+            if message.root_id is None:
+                message.root_id = _root_of(session, message, pending)
+
+        for message in moved:
+            old_root = message.root_id
+            message.root_id = _root_of(session, message, pending)
+            if message.root_id != old_root:
+                subtree = subtree_cte(message.id)
+                session.execute(
+                    update(Message)
+                    .where(Message.id.in_(select(subtree.c.id)))
+                    .values(root_id=message.root_id)
+                    .execution_options(synchronize_session="fetch")
+                )
+
+
+def _root_of(session, message, pending):
+    parent = _parent_of(session, message, pending)
+    if parent is None:
+        return message.id
+    return parent.root_id
+
+
+@event.listens_for(Session, "before_flush")
+def _update_token_counts(session, flush_context, instances):
+    """Keep token counts current for messages added or edited through the ORM"""
+    new = [obj for obj in session.new if isinstance(obj, Message)]
+    edited = [
+        obj
+        for obj in session.dirty
+        if isinstance(obj, Message)
+        and (
+            attributes.get_history(obj, "body_hash").has_changes()
+            or attributes.get_history(obj, "parent_id").has_changes()
+        )
+    ]
+    if not new and not edited:
+        return
+
+    pending = {obj.id: obj for obj in new if obj.id is not None}
+    with session.no_autoflush:
+        for message in sorted(new, key=lambda obj: obj.id or 0):
+            if message.path_token_count is None:
+                _fill_path_total(session, message, pending)
+
+        for message in edited:
+            old_total = message.path_token_count
+            if attributes.get_history(message, "body_hash").has_changes():
+                message.token_count = None
+            _fill_path_total(session, message, pending)
+            if old_total is not None and message.path_token_count != old_total:
+                # Every descendant's path runs through this message
+                subtree = subtree_cte(message.id)
+                session.execute(
+                    update(Message)
+                    .where(
+                        Message.id.in_(select(subtree.c.id)),
+                        Message.id != message.id,
+                    )
+                    .values(
+                        path_token_count=Message.path_token_count
+                        + (message.path_token_count - old_total)
+                    )
+                    .execution_options(synchronize_session="fetch")
+                )
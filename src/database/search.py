@@ -0,0 +1,180 @@
+"""Full-text search over message content"""
+
+import re
+
+from sqlalchemy import select, text
+
+from .bodies import index_pending_texts, load_bodies
+from .models import Message
+
+DEFAULT_LIMIT = 50
+SNIPPET_TOKENS = 12
+# Window for callers that opt in to ranking only the newest matches, so a
+# query matching most of a large database costs about the same as a rare one
+RANK_WINDOW = 2000
+# Marks the matched terms inside SearchHit.snippet
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+_TERMS = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchHit:
+    """One ranked search result"""
+
+    def __init__(self, message_id, speaker, snippet, rank):
+        self.message_id = message_id
+        self.speaker = speaker
+        self.snippet = snippet
+        self.rank = rank
+
+    def __repr__(self):
+        return f"<SearchHit(message_id={self.message_id}, rank={self.rank:.3f})>"
+
+
+class SearchResults(list):
+    """SearchHits, best first; windowed is True when only the newest
+    `window` matches were ranked because the query matched more"""
+
+    def __init__(self, hits=(), windowed=False):
+        super().__init__(hits)
+        self.windowed = windowed
+
+
+def fts_available(session):
+    """Whether the messages_fts index exists (SQLite built with FTS5)"""
+    if session.get_bind().dialect.name != "sqlite":
+        return False
+    row = session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")
+    ).first()
+    return row is not None
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query: all words, the last one as a prefix
+
+    Words are quoted, so operators and punctuation typed by the user can't
+    produce a syntax error.
+    """
+    terms = _TERMS.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_messages(session, query, limit=DEFAULT_LIMIT, window=None):
+    """Return SearchResults with up to limit hits for query, best match first
+
+    Every match is ranked unless window is given, in which case a query
+    matching more than window messages ranks only the newest window of them.
+    Index changes other writers queued for compressed bodies are applied
+    and committed first.
+    """
+    if fts_available(session):
+        if index_pending_texts(session):
+            session.commit()
+        return _search_fts(session, query, limit, window)
+    return _search_like(session, query, limit)
+
+
+def _search_fts(session, query, limit, window):
+    match = build_match_query(query)
+    if match is None:
+        return SearchResults()
+
+    floor = None
+    if window is not None:
+        # Lowest rowid among the newest window matches; a doclist walk from
+        # the end that stops early, unlike ranking every match
+        floor = session.execute(
+            text(
+                "SELECT rowid FROM messages_fts WHERE messages_fts MATCH :match "
+                "ORDER BY rowid DESC LIMIT 1 OFFSET :offset"
+            ),
+            {"match": match, "offset": window},
+        ).scalar()
+        if floor is not None:
+            # The match at this offset is the newest one left out
+            floor += 1
+
+    stmt = text(
+        "SELECT messages.id, messages.speaker, "
+        "snippet(messages_fts, 0, :start, :end, '…', :tokens), "
+        "bm25(messages_fts) AS rank, message_bodies.hash, message_bodies.codec "
+        "FROM messages_fts JOIN messages ON messages.id = messages_fts.rowid "
+        "JOIN message_bodies ON message_bodies.hash = messages.body_hash "
+        "WHERE messages_fts MATCH :match AND messages_fts.rowid >= :floor "
+        "ORDER BY rank LIMIT :limit"
+    )
+    rows = session.execute(
+        stmt,
+        {
+            "start": MATCH_START,
+            "end": MATCH_END,
+            "tokens": SNIPPET_TOKENS,
+            "match": match,
+            "floor": floor or 0,
+            "limit": limit,
+        },
+    ).all()
+    # The index view hides compressed text from snippet(); decode it here
+    texts = load_bodies(session, {row.hash for row in rows if row.codec})
+    terms = _TERMS.findall(query)
+    hits = [
+        SearchHit(
+            row.id,
+            row.speaker,
+            _body_snippet(texts[row.hash], terms) if row.hash in texts else row[2],
+            row.rank,
+        )
+        for row in rows
+    ]
+    return SearchResults(hits, floor is not None)
+
+
+def _search_like(session, query, limit):
+    """Substring scan used when FTS5 is unavailable; newest first"""
+    needle = query.strip()
+    if not needle:
+        return SearchResults()
+    escaped = needle.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    stmt = (
+        select(Message.id, Message.speaker, Message.content)
+        .where(Message.content.ilike(f"%{escaped}%", escape="\\"))
+        .order_by(Message.id.desc())
+        .limit(limit)
+    )
+    return SearchResults(
+        SearchHit(row.id, row.speaker, _like_snippet(row.content, needle), 0.0)
+        for row in session.execute(stmt)
+    )
+
+
+def _body_snippet(content, terms):
+    """Snippet around the earliest of the query terms"""
+    lowered = content.lower()
+    found = [(lowered.find(term.lower()), term) for term in terms]
+    found = [pair for pair in found if pair[0] >= 0]
+    return _like_snippet(content, min(found)[1] if found else terms[0])
+
+
+def _like_snippet(content, needle, context=40):
+    content = " ".join(content.split())
+    start = content.lower().find(needle.lower())
+    if start < 0:
+        return content[: context * 2]
+    end = start + len(needle)
+    prefix = "…" if start > context else ""
+    suffix = "…" if end + context < len(content) else ""
+    return (
+        prefix
+        + content[max(start - context, 0) : start]
+        + MATCH_START
+        + content[start:end]
+        + MATCH_END
+        + content[end : end + context]
+        + suffix
+    )
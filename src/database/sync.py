@@ -0,0 +1,111 @@
+"""Incremental change tracking for databases shared with other writers"""
+
+from sqlalchemy import func, select
+
+from .models import Message, MessageChange
+from .tree_loader import load_messages, select_summaries
+
+
+class ChangeSet:
+    """Rows added, modified or removed since the previous sync
+
+    added and updated hold tree_loader summary rows, not ORM objects.
+    """
+
+    def __init__(self, added=(), updated=(), deleted_ids=()):
+        self.added = list(added)
+        self.updated = list(updated)
+        self.deleted_ids = set(deleted_ids)
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.deleted_ids)
+
+    def touched_ids(self):
+        """Ids of existing messages whose row changed or disappeared"""
+        return {message.id for message in self.updated} | self.deleted_ids
+
+    def __repr__(self):
+        return (
+            f"<ChangeSet(added={len(self.added)}, updated={len(self.updated)}, "
+            f"deleted={len(self.deleted_ids)})>"
+        )
+
+
+class ChangeTracker:
+    """Track a high-water mark over `messages` and fetch only what changed
+
+    New rows are found through the max message id, edits and deletes through
+    the trigger-maintained `message_changes` log. On SQLite, `PRAGMA
+    data_version` on a dedicated connection makes the no-change case a single
+    pragma read, so it can be polled cheaply.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.max_id = session.scalar(select(func.max(Message.id))) or 0
+        self.change_seq = session.scalar(select(func.max(MessageChange.seq))) or 0
+
+        engine = session.get_bind()
+        self._raw = engine.raw_connection() if engine.dialect.name == "sqlite" else None
+        self.data_version = self._read_data_version()
+
+    def _read_data_version(self):
+        if self._raw is None:
+            return None
+        cursor = self._raw.cursor()
+        try:
+            cursor.execute("PRAGMA data_version")
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def has_external_changes(self):
+        """Cheap check for commits made through other connections"""
+        if self._raw is None:
+            return True
+        return self._read_data_version() != self.data_version
+
+    def fetch_changes(self):
+        """Return a ChangeSet since the last call and advance the watermark"""
+        self.data_version = self._read_data_version()
+
+        added = self.session.execute(
+            select_summaries().where(Message.id > self.max_id).order_by(Message.id)
+        ).all()
+
+        changed_ids = set(
+            self.session.scalars(
+                select(MessageChange.message_id).where(
+                    MessageChange.seq > self.change_seq
+                )
+            )
+        )
+        self.change_seq = (
+            self.session.scalar(select(func.max(MessageChange.seq))) or self.change_seq
+        )
+
+        added_ids = {message.id for message in added}
+        changed_ids -= added_ids
+        if added:
+            self.max_id = max(self.max_id, added[-1].id)
+
+        updated = load_messages(self.session, changed_ids)
+        deleted_ids = changed_ids - {message.id for message in updated}
+        for message_id in changed_ids:
+            # ORM copies loaded elsewhere in the session are stale now
+            stale = self.session.identity_map.get(
+                self.session.identity_key(Message, message_id)
+            )
+            if stale is None:
+                continue
+            if message_id in deleted_ids:
+                self.session.expunge(stale)
+            else:
+                self.session.expire(stale)
+
+        return ChangeSet(added, updated, deleted_ids)
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
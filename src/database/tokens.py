@@ -0,0 +1,56 @@
+"""Offline token counting used for stored per-message token counts"""
+
+import re
+
+DEFAULT_TOKENIZER = "heuristic"
+
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def heuristic_count(text):
+    """Approximate BPE token count: ~4 characters per word piece, 1 per symbol"""
+    count = 0
+    for piece in _WORD_PIECES.findall(text):
+        count += (len(piece) + 3) // 4
+    return count
+
+
+def _tiktoken_counter(encoding_name="cl100k_base"):
+    try:
+        import tiktoken
+    except ImportError as e:
+        raise ValueError("the 'tiktoken' tokenizer needs `pip install tiktoken`") from e
+    encoding = tiktoken.get_encoding(encoding_name)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+# name -> factory returning a `count(text) -> int` callable
+TOKENIZERS = {
+    "heuristic": lambda: heuristic_count,
+    "tiktoken": _tiktoken_counter,
+}
+
+_tokenizer_name = DEFAULT_TOKENIZER
+_tokenizer = heuristic_count
+
+
+def set_tokenizer(tokenizer):
+    """Select the tokenizer by registered name or pass a count(text) callable"""
+    global _tokenizer, _tokenizer_name
+    if callable(tokenizer):
+        _tokenizer_name = getattr(tokenizer, "__name__", "custom")
+        _tokenizer = tokenizer
+        return
+    if tokenizer not in TOKENIZERS:
+        raise ValueError(f"unknown tokenizer {tokenizer!r}")
+    _tokenizer = TOKENIZERS[tokenizer]()
+    _tokenizer_name = tokenizer
+
+
+def tokenizer_name():
+    return _tokenizer_name
+
+
+def count_tokens(text):
+    """Token count of text with the active tokenizer"""
+    return _tokenizer(text) if text else 0
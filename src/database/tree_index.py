@@ -0,0 +1,245 @@
+"""Array-backed structural index over a message forest"""
+
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import select
+
+from .models import Message
+
+NO_NODE = -1
+
+
+class TreeIndex:
+    """Immutable snapshot of the id/parent_id structure in flat arrays
+
+    Nodes are stored by position in id order; every per-node fact lives in
+    a parallel array (parent, first child, next sibling, depth, pre-order
+    entry/exit and a skew-binary jump pointer), so the index costs a few
+    machine words per message and no Python object per node. Answers:
+
+    - ancestor checks and subtree sizes in O(1) from the pre-order
+      entry/exit times (plus the O(log n) id lookup)
+    - subtree members as one contiguous slice of the pre-order
+    - level ancestors and lowest common ancestors in O(log n) via the
+      jump pointers
+
+    Messages whose parent is missing count as roots, as in MessageTreeData.
+    Messages on a parent cycle are unreachable from any root and left out.
+    The index isn't patched; rebuild it when the structure changes.
+    """
+
+    def __init__(self, pairs):
+        pairs = sorted(pairs)
+        count = len(pairs)
+        self.ids = array("q", [message_id for message_id, _ in pairs])
+
+        # The id -> position dict only lives for the build; lookups afterwards
+        # bisect self.ids
+        positions = {message_id: pos for pos, message_id in enumerate(self.ids)}
+        self.parent = array(
+            "i", [positions.get(parent_id, NO_NODE) for _, parent_id in pairs]
+        )
+        del positions
+
+        # Sibling lists are built back to front so they come out in id order
+        self.first_child = array("i", [NO_NODE]) * count
+        self.next_sibling = array("i", [NO_NODE]) * count
+        first_root = NO_NODE
+        for pos in range(count - 1, -1, -1):
+            parent = self.parent[pos]
+            if parent == NO_NODE:
+                self.next_sibling[pos] = first_root
+                first_root = pos
+            else:
+                self.next_sibling[pos] = self.first_child[parent]
+                self.first_child[parent] = pos
+        self.first_root = first_root
+
+        self.depth = array("i", [0]) * count
+        self.jump = array("i", [NO_NODE]) * count
+        self.entry = array("i", [NO_NODE]) * count
+        self.exit = array("i", [NO_NODE]) * count
+        self.preorder = array("i")
+        self._number(first_root)
+
+    def _find(self, message_id):
+        """Position of message_id, or NO_NODE"""
+        pos = bisect_left(self.ids, message_id)
+        if pos < len(self.ids) and self.ids[pos] == message_id:
+            return pos
+        return NO_NODE
+
+    def _number(self, first_root):
+        """Pre-order walk without a stack, filling depth, jump, entry and exit"""
+        parent, depth, jump = self.parent, self.depth, self.jump
+        entry, exit_, preorder = self.entry, self.exit, self.preorder
+        first_child, next_sibling = self.first_child, self.next_sibling
+
+        pos = first_root
+        time = 0
+        while pos != NO_NODE:
+            entry[pos] = time
+            preorder.append(pos)
+            time += 1
+            up = parent[pos]
+            if up == NO_NODE:
+                depth[pos] = 0
+                jump[pos] = pos
+            else:
+                depth[pos] = depth[up] + 1
+                # Skew-binary jump pointers (Myers, 1983)
+                far = jump[up]
+                if depth[up] - depth[far] == depth[far] - depth[jump[far]]:
+                    jump[pos] = jump[far]
+                else:
+                    jump[pos] = up
+
+            if first_child[pos] != NO_NODE:
+                pos = first_child[pos]
+                continue
+            while pos != NO_NODE:
+                exit_[pos] = time
+                if next_sibling[pos] != NO_NODE:
+                    pos = next_sibling[pos]
+                    break
+                pos = parent[pos]
+
+    def _pos(self, message_id):
+        pos = self._find(message_id)
+        if pos == NO_NODE or self.entry[pos] == NO_NODE:
+            raise KeyError(message_id)
+        return pos
+
+    def _is_ancestor(self, a, b):
+        return self.entry[a] <= self.entry[b] < self.exit[a]
+
+    def __len__(self):
+        return len(self.preorder)
+
+    def __contains__(self, message_id):
+        pos = self._find(message_id)
+        return pos != NO_NODE and self.entry[pos] != NO_NODE
+
+    def roots(self):
+        result = []
+        pos = self.first_root
+        while pos != NO_NODE:
+            result.append(self.ids[pos])
+            pos = self.next_sibling[pos]
+        return result
+
+    def parent_of(self, message_id):
+        """Parent id, or None for roots"""
+        parent = self.parent[self._pos(message_id)]
+        return None if parent == NO_NODE else self.ids[parent]
+
+    def children(self, message_id):
+        result = []
+        pos = self.first_child[self._pos(message_id)]
+        while pos != NO_NODE:
+            result.append(self.ids[pos])
+            pos = self.next_sibling[pos]
+        return result
+
+    def is_leaf(self, message_id):
+        return self.first_child[self._pos(message_id)] == NO_NODE
+
+    def depth_of(self, message_id):
+        """Edges between the message and its root"""
+        return self.depth[self._pos(message_id)]
+
+    def is_ancestor(self, ancestor_id, message_id):
+        """Whether ancestor_id is message_id or one of its ancestors"""
+        return self._is_ancestor(self._pos(ancestor_id), self._pos(message_id))
+
+    def subtree_range(self, message_id):
+        """[start, end) of the message's subtree within the pre-order"""
+        pos = self._pos(message_id)
+        return self.entry[pos], self.exit[pos]
+
+    def subtree_size(self, message_id):
+        """Messages in the subtree, the message itself included"""
+        start, end = self.subtree_range(message_id)
+        return end - start
+
+    def subtree_ids(self, message_id):
+        """Ids of the subtree in pre-order"""
+        start, end = self.subtree_range(message_id)
+        return [self.ids[pos] for pos in self.preorder[start:end]]
+
+    def _ancestor_at_depth(self, pos, target):
+        depth, jump, parent = self.depth, self.jump, self.parent
+        while depth[pos] > target:
+            if depth[jump[pos]] >= target:
+                pos = jump[pos]
+            else:
+                pos = parent[pos]
+        return pos
+
+    def ancestor_at_depth(self, message_id, depth):
+        """Ancestor of the message at the given depth (0 = its root)"""
+        pos = self._pos(message_id)
+        if not 0 <= depth <= self.depth[pos]:
+            raise ValueError(f"depth {depth} is outside 0..{self.depth[pos]}")
+        return self.ids[self._ancestor_at_depth(pos, depth)]
+
+    def lca(self, a_id, b_id):
+        """Lowest common ancestor id, or None if they are in different trees"""
+        a, b = self._pos(a_id), self._pos(b_id)
+        if self._is_ancestor(a, b):
+            return a_id
+        if self._is_ancestor(b, a):
+            return b_id
+
+        # Climb from a to the highest ancestor that is still not above b;
+        # its parent is the answer
+        parent, jump = self.parent, self.jump
+        pos = a
+        while True:
+            up = parent[pos]
+            if up == NO_NODE:
+                return None
+            far = jump[pos]
+            if far != pos and not self._is_ancestor(far, b):
+                pos = far
+            elif self._is_ancestor(up, b):
+                return self.ids[up]
+            else:
+                pos = up
+
+    def path_ids(self, message_id, after_id=None):
+        """Ids of the root -> message path
+
+        With after_id (an ancestor of the message) the path starts just below
+        it, so only that suffix is walked.
+        """
+        stop = NO_NODE if after_id is None else self._pos(after_id)
+        path = []
+        pos = self._pos(message_id)
+        while pos != stop:
+            if pos == NO_NODE:
+                raise ValueError(f"{after_id} is not an ancestor of {message_id}")
+            path.append(self.ids[pos])
+            pos = self.parent[pos]
+        path.reverse()
+        return path
+
+    def walk(self, message_id=None):
+        """Yield (id, depth) in pre-order, relative to message_id if given"""
+        if message_id is None:
+            start, end, base = 0, len(self.preorder), 0
+        else:
+            pos = self._pos(message_id)
+            start, end, base = self.entry[pos], self.exit[pos], self.depth[pos]
+        ids, depth = self.ids, self.depth
+        for pos in self.preorder[start:end]:
+            yield ids[pos], depth[pos] - base
+
+
+def load_tree_index(session, root_id=None):
+    """Build a TreeIndex of every message, or one conversation, in one scan"""
+    stmt = select(Message.id, Message.parent_id).order_by(Message.id)
+    if root_id is not None:
+        stmt = stmt.where(Message.root_id == root_id)
+    return TreeIndex(session.execute(stmt).tuples())
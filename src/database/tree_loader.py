@@ -0,0 +1,247 @@
+"""Bulk loading of the message tree into an in-memory index"""
+
+from bisect import insort
+from collections import defaultdict
+
+from sqlalchemy import func, select
+
+from .models import Message, ancestor_chain_cte
+from .tree_index import TreeIndex
+
+# Keep IN (...) lists below SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK = 500
+# Conversations listed per load_conversations call
+CONVERSATION_PAGE = 200
+
+# What the tree, graph and path views read per message; the text itself is
+# fetched on demand by body_hash
+SUMMARY_COLUMNS = (
+    Message.id,
+    Message.parent_id,
+    Message.root_id,
+    Message.speaker,
+    Message.timestamp,
+    Message.preview,
+    Message.body_hash,
+    Message.token_count,
+    Message.path_token_count,
+)
+
+
+def select_summaries():
+    """SELECT of lightweight, read-only message rows (no ORM objects, no text)"""
+    return select(*SUMMARY_COLUMNS)
+
+
+class MessageTreeData:
+    """Parent -> children adjacency index over a set of loaded messages
+
+    With root_id set the index covers one conversation, and patches for
+    rows of other conversations are ignored.
+    """
+
+    def __init__(self, messages, root_id=None):
+        self.root_id = root_id
+        self.messages = {}
+        self.children = defaultdict(list)
+        self.roots = []
+        # Where each message is attached (None for roots), so patches can
+        # detach it after its row was replaced by one with a new parent_id
+        self._attached_to = {}
+        self._index = None
+
+        for message in messages:
+            self.messages[message.id] = message
+
+        # Rows arrive ordered by id, so every children list keeps insertion order
+        for message in self.messages.values():
+            self._attach(message, append=True)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __contains__(self, message_id):
+        return message_id in self.messages
+
+    def get(self, message_id):
+        return self.messages.get(message_id)
+
+    def get_children(self, message_id):
+        return self.children.get(message_id, [])
+
+    @property
+    def index(self):
+        """TreeIndex over the loaded messages, built on first use"""
+        if self._index is None:
+            self._index = TreeIndex(
+                (message.id, message.parent_id) for message in self.messages.values()
+            )
+        return self._index
+
+    def path_to(self, message_id):
+        """Rows of the root -> message path, without a query"""
+        return [self.messages[path_id] for path_id in self.index.path_ids(message_id)]
+
+    def apply_changes(self, changes):
+        """Patch the index in place with a sync.ChangeSet"""
+        self._index = None
+        for message_id in changes.touched_ids():
+            message = self.messages.pop(message_id, None)
+            if message is not None:
+                self._detach(message)
+
+        incoming = [
+            message
+            for message in [*changes.updated, *changes.added]
+            if self.root_id is None or message.root_id == self.root_id
+        ]
+        # Deleted rows and rows moved to another conversation leave their
+        # remaining children behind as roots, as a fresh load would show them
+        staying = {message.id for message in incoming}
+        for message_id in changes.touched_ids() - staying:
+            for child in self.children.pop(message_id, []):
+                self._attach(child)
+        # Register every row before attaching any, so a row whose parent is
+        # patched later in the same batch still finds it
+        for message in incoming:
+            self.messages[message.id] = message
+        for message in incoming:
+            self._attach(message)
+
+    def _attach(self, message, append=False):
+        parent_id = message.parent_id
+        if parent_id is None or parent_id not in self.messages:
+            parent_id = None
+            siblings = self.roots
+        else:
+            siblings = self.children[parent_id]
+
+        if append:
+            siblings.append(message)
+        else:
+            insort(siblings, message, key=_message_id)
+        self._attached_to[message.id] = parent_id
+
+    def _detach(self, message):
+        parent_id = self._attached_to.pop(message.id, None)
+        siblings = self.roots if parent_id is None else self.children[parent_id]
+        if message in siblings:
+            siblings.remove(message)
+
+    def walk(self, start=None):
+        """Yield (message, depth) in depth-first order without recursion"""
+        stack = [(message, 0) for message in reversed(start or self.roots)]
+        while stack:
+            message, depth = stack.pop()
+            yield message, depth
+            children = self.children.get(message.id)
+            if children:
+                stack.extend((child, depth + 1) for child in reversed(children))
+
+
+def _message_id(message):
+    return message.id
+
+
+def load_message_tree(session, root_id=None):
+    """Load every message, or one conversation by its root id, in one query"""
+    stmt = select_summaries().order_by(Message.id)
+    if root_id is not None:
+        stmt = stmt.where(Message.root_id == root_id)
+
+    return MessageTreeData(session.execute(stmt).all(), root_id)
+
+
+def load_path(session, message_id):
+    """Summary rows of the root -> message path, already ordered"""
+    chain = ancestor_chain_cte(message_id)
+    stmt = (
+        select_summaries()
+        .join(chain, Message.id == chain.c.id)
+        .order_by(chain.c.depth.desc())
+    )
+    return session.execute(stmt).all()
+
+
+def load_messages(session, message_ids):
+    """Summary rows for the given ids, ordered by id"""
+    rows = []
+    for chunk in _chunks(sorted(message_ids)):
+        stmt = select_summaries().where(Message.id.in_(chunk)).order_by(Message.id)
+        rows.extend(session.execute(stmt))
+    return rows
+
+
+def load_conversations(session, after_id=0, limit=CONVERSATION_PAGE):
+    """One page of conversations ordered by root id, starting after after_id
+
+    Rows carry the root's id, speaker, timestamp and preview plus
+    message_count and last_timestamp over the whole conversation.
+    """
+    stats = (
+        select(
+            Message.root_id,
+            func.count().label("message_count"),
+            func.max(Message.timestamp).label("last_timestamp"),
+        )
+        .where(Message.root_id > after_id)
+        .group_by(Message.root_id)
+        .order_by(Message.root_id)
+        .limit(limit)
+        .subquery()
+    )
+    stmt = (
+        select(
+            stats.c.root_id,
+            Message.speaker,
+            Message.timestamp,
+            Message.preview,
+            stats.c.message_count,
+            stats.c.last_timestamp,
+        )
+        .join(Message, Message.id == stats.c.root_id)
+        .order_by(stats.c.root_id)
+    )
+    return session.execute(stmt).all()
+
+
+def conversation_of(session, message_id):
+    """Root id of the conversation a message belongs to, or None"""
+    return session.scalar(select(Message.root_id).where(Message.id == message_id))
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), IN_CLAUSE_CHUNK):
+        yield ids[start : start + IN_CLAUSE_CHUNK]
+
+
+def load_roots(session):
+    """Load only the root messages"""
+    stmt = select_summaries().where(Message.parent_id.is_(None)).order_by(Message.id)
+    return session.execute(stmt).all()
+
+
+def load_children(session, parent_ids):
+    """Load the direct children of the given messages, ordered by id"""
+    children = []
+    for chunk in _chunks(list(parent_ids)):
+        stmt = (
+            select_summaries()
+            .where(Message.parent_id.in_(chunk))
+            .order_by(Message.id)
+        )
+        children.extend(session.execute(stmt))
+    return children
+
+
+def count_children(session, parent_ids):
+    """Return {parent_id: child count} without loading the children"""
+    counts = {}
+    for chunk in _chunks(list(parent_ids)):
+        stmt = (
+            select(Message.parent_id, func.count())
+            .where(Message.parent_id.in_(chunk))
+            .group_by(Message.parent_id)
+        )
+        counts.update(session.execute(stmt).tuples().all())
+    return counts
@@ -0,0 +1,158 @@
+"""Non-interactive commands for scripts: paths, subtrees, search and stats
+
+Only the database layer is imported here, never Textual or Rich, so these
+commands start as fast as SQLAlchemy allows.
+"""
+
+import json
+import sys
+from itertools import islice
+
+from sqlalchemy import func, select
+
+from src.database.bodies import load_bodies, storage_stats
+from src.database.models import Message
+from src.database.search import MATCH_END, MATCH_START, search_messages
+from src.database.tree_index import load_tree_index
+from src.database.tree_loader import (
+    IN_CLAUSE_CHUNK,
+    conversation_of,
+    load_messages,
+    load_path,
+)
+
+
+def _row_dict(row, depth, content):
+    data = {
+        "id": row.id,
+        "parent_id": row.parent_id,
+        "root_id": row.root_id,
+        "depth": depth,
+        "speaker": row.speaker,
+        "timestamp": row.timestamp.isoformat(),
+        "token_count": row.token_count,
+        "path_token_count": row.path_token_count,
+        "preview": row.preview,
+    }
+    if content is not None:
+        data["content"] = content
+    return data
+
+
+def _row_line(row, depth):
+    tokens = "?" if row.token_count is None else f"{row.token_count:,}"
+    return (
+        f"{'  ' * depth}#{row.id}  {row.speaker:<9} "
+        f"{row.timestamp:%Y-%m-%d %H:%M}  {tokens:>7} tok  {row.preview or ''}"
+    )
+
+
+def _print_rows(session, pairs, full, as_json, out, indent=True):
+    """Print (row, depth) pairs, fetching text a chunk at a time with full"""
+    count = 0
+    while True:
+        chunk = list(islice(pairs, IN_CLAUSE_CHUNK))
+        if not chunk:
+            return count
+        bodies = {}
+        if full:
+            bodies = load_bodies(session, {row.body_hash for row, _ in chunk})
+        for row, depth in chunk:
+            content = bodies.get(row.body_hash) if full else None
+            if as_json:
+                out.write(json.dumps(_row_dict(row, depth, content)) + "\n")
+            else:
+                out.write(_row_line(row, depth if indent else 0) + "\n")
+                if content is not None:
+                    out.write(content + "\n\n")
+        count += len(chunk)
+
+
+def print_path(session, message_id, full=False, as_json=False, out=sys.stdout):
+    """The root -> message path, one message per line (JSON lines with as_json)"""
+    path = [(row, depth) for depth, row in enumerate(load_path(session, message_id))]
+    if not path:
+        raise LookupError(f"No message {message_id}")
+    return _print_rows(session, iter(path), full, as_json, out, indent=False)
+
+
+def _subtree_rows(session, walk):
+    while True:
+        chunk = list(islice(walk, IN_CLAUSE_CHUNK))
+        if not chunk:
+            return
+        rows = {row.id: row for row in load_messages(session, [i for i, _ in chunk])}
+        for message_id, depth in chunk:
+            yield rows[message_id], depth
+
+
+def print_subtree(
+    session, message_id, max_depth=None, full=False, as_json=False, out=sys.stdout
+):
+    """The message and its descendants in pre-order, indented by depth"""
+    root_id = conversation_of(session, message_id)
+    if root_id is None:
+        raise LookupError(f"No message {message_id}")
+    walk = load_tree_index(session, root_id).walk(message_id)
+    if max_depth is not None:
+        walk = (pair for pair in walk if pair[1] <= max_depth)
+    return _print_rows(session, _subtree_rows(session, walk), full, as_json, out)
+
+
+def print_search(session, query, limit, window=None, as_json=False, out=sys.stdout):
+    """Ranked hits for query; matched terms are *starred* in text output
+
+    A note goes to stderr when window limited the ranking to recent matches.
+    """
+    hits = search_messages(session, query, limit=limit, window=window)
+    for hit in hits:
+        snippet = " ".join(hit.snippet.split())
+        if as_json:
+            plain = snippet.replace(MATCH_START, "").replace(MATCH_END, "")
+            hit_data = {
+                "id": hit.message_id,
+                "speaker": hit.speaker,
+                "snippet": plain,
+                "rank": hit.rank,
+            }
+            out.write(json.dumps(hit_data) + "\n")
+        else:
+            snippet = snippet.replace(MATCH_START, "*").replace(MATCH_END, "*")
+            out.write(f"#{hit.message_id}  {hit.speaker:<9} {snippet}\n")
+    if hits.windowed:
+        print(f"Ranked only the newest {window:,} matches", file=sys.stderr)
+    return len(hits)
+
+
+def database_stats(session):
+    """storage_stats plus conversation and token totals"""
+    conversations, tokens = session.execute(
+        select(
+            func.count(func.distinct(Message.root_id)),
+            func.coalesce(func.sum(Message.token_count), 0),
+        )
+    ).one()
+    stats = storage_stats(session)
+    stats["conversations"] = conversations
+    stats["tokens"] = tokens
+    return stats
+
+
+def print_stats(session, as_json=False, out=sys.stdout):
+    stats = database_stats(session)
+    if as_json:
+        out.write(json.dumps(stats) + "\n")
+        return
+    out.write(
+        f"Messages:       {stats['messages']:,}\n"
+        f"Conversations:  {stats['conversations']:,}\n"
+        f"Tokens:         {stats['tokens']:,}\n"
+        f"Unique bodies:  {stats['bodies']:,}\n"
+        f"Compressed:     {stats['compressed_bodies']:,}\n"
+        f"Text (logical): {stats['logical_bytes']:,} bytes\n"
+        f"Text (unique):  {stats['unique_bytes']:,} bytes\n"
+        f"Text (stored):  {stats['stored_bytes']:,} bytes\n"
+        f"Saved:          {stats['saved_bytes']:,} bytes "
+        f"({stats['dedup_ratio']:.2f}x deduplication, "
+        f"{stats['compression_ratio']:.2f}x compression)\n"
+    )
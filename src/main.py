@@ -1,7 +1,38 @@
 """Entry point for the LLM Context Manager application"""
 
 import argparse
-from src.ui.app import ChatManagerApp
+import sys
+from src.database.backfill import (
+    DEFAULT_BATCH_SIZE as BACKFILL_BATCH_SIZE,
+    backfill_token_counts,
+)
+from src.database.bodies import (
+    DEFAULT_BATCH_SIZE as BODY_BATCH_SIZE,
+    database_size,
+    prune_orphan_bodies,
+    recompress_bodies,
+    vacuum,
+)
+from src.database.body_codecs import (
+    CODECS,
+    DEFAULT_CODEC,
+    DEFAULT_THRESHOLD,
+    set_compression,
+)
+from src.database.db import init_db
+from src.database.compression import SUMMARIZERS
+from src.database.exporter import FORMATS as EXPORT_FORMATS, iter_export, write_jsonl
+from src.database.importer import (
+    FORMATS,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COMMIT_EVERY,
+    ExportFormatError,
+    import_export,
+)
+from src.database.migrations import LATEST_VERSION, get_schema_version
+from src.database.search import DEFAULT_LIMIT as SEARCH_LIMIT
+from src.database.tokens import DEFAULT_TOKENIZER, TOKENIZERS, set_tokenizer
+from src.headless import print_path, print_search, print_stats, print_subtree
 
 
 def main():
@@ -15,9 +46,339 @@ def main():
         help="Database URL (default: sqlite:///data/chat_history.db)",
     )
 
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Load tree children on expand instead of all at startup",
+    )
+
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="SECONDS",
+        help="Poll the database for external writes every SECONDS",
+    )
+
+    parser.add_argument(
+        "--schema-version",
+        action="store_true",
+        help="Upgrade the database if needed, print its schema version and exit",
+    )
+
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write cProfile stats of the run to FILE (view: python -m pstats FILE)",
+    )
+
+    parser.add_argument(
+        "--tokenizer",
+        choices=sorted(TOKENIZERS),
+        default=DEFAULT_TOKENIZER,
+        help=f"Token counter for stored counts (default: {DEFAULT_TOKENIZER})",
+    )
+
+    parser.add_argument(
+        "--compression",
+        choices=sorted(CODECS) + ["none"],
+        default=DEFAULT_CODEC,
+        help=f"Codec for large message bodies (default: {DEFAULT_CODEC})",
+    )
+
+    parser.add_argument(
+        "--compress-threshold",
+        type=int,
+        default=DEFAULT_THRESHOLD,
+        metavar="BYTES",
+        help=f"Compress bodies of at least BYTES (default: {DEFAULT_THRESHOLD})",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    import_parser = subparsers.add_parser(
+        "import", help="Stream a ChatGPT/Claude/JSONL export into the database"
+    )
+    import_parser.add_argument("path", help="Export file (.json, .jsonl or .zip)")
+    import_parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="auto",
+        help="Export format (default: detect from the file)",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Rows per INSERT batch (default: {DEFAULT_BATCH_SIZE})",
+    )
+    import_parser.add_argument(
+        "--commit-every",
+        type=int,
+        default=DEFAULT_COMMIT_EVERY,
+        help=f"Rows per transaction (default: {DEFAULT_COMMIT_EVERY})",
+    )
+    import_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore any saved checkpoint and import from the beginning",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", help="Write conversation paths as JSONL chat API payloads"
+    )
+    target = export_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--path", type=int, metavar="ID", help="The root -> ID path"
+    )
+    target.add_argument(
+        "--subtree", type=int, metavar="ID", help="Every leaf path below ID"
+    )
+    target.add_argument(
+        "--conversation",
+        type=int,
+        metavar="ID",
+        help="Every leaf path of the conversation containing ID",
+    )
+    target.add_argument(
+        "--leaves", action="store_true", help="Every root -> leaf path"
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default="openai",
+        help="Payload format (default: openai)",
+    )
+    export_parser.add_argument(
+        "-o", "--output", help="Output file (default: standard output)"
+    )
+    export_parser.add_argument(
+        "--budget",
+        type=int,
+        metavar="TOKENS",
+        help="Compress each path to fit TOKENS, summarizing the oldest turns",
+    )
+    export_parser.add_argument(
+        "--summarizer",
+        choices=sorted(SUMMARIZERS),
+        default="extractive",
+        help="Summarizer used with --budget (default: extractive)",
+    )
+
+    backfill_parser = subparsers.add_parser(
+        "backfill-tokens", help="Compute token counts for existing messages"
+    )
+    backfill_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BACKFILL_BATCH_SIZE,
+        help=f"Rows per transaction (default: {BACKFILL_BATCH_SIZE})",
+    )
+    backfill_parser.add_argument(
+        "--recount",
+        action="store_true",
+        help="Recount every message, e.g. after changing --tokenizer",
+    )
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="Report message storage, deduplication and compression savings"
+    )
+    stats_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="First delete bodies no message references any more",
+    )
+    stats_parser.add_argument("--json", action="store_true", help="Print JSON")
+
+    path_parser = subparsers.add_parser(
+        "path", help="Print the root -> message path of a message"
+    )
+    path_parser.add_argument("message_id", type=int)
+
+    subtree_parser = subparsers.add_parser(
+        "subtree", help="Print a message and its descendants, indented by depth"
+    )
+    subtree_parser.add_argument("message_id", type=int)
+    subtree_parser.add_argument(
+        "--depth", type=int, metavar="N", help="Stop N levels below the message"
+    )
+
+    for listing_parser in (path_parser, subtree_parser):
+        listing_parser.add_argument(
+            "--full", action="store_true", help="Include the full message text"
+        )
+        listing_parser.add_argument(
+            "--json", action="store_true", help="Print one JSON object per message"
+        )
+
+    search_parser = subparsers.add_parser("search", help="Full-text search messages")
+    search_parser.add_argument("query")
+    search_parser.add_argument(
+        "--limit",
+        type=int,
+        default=SEARCH_LIMIT,
+        help=f"Maximum hits (default: {SEARCH_LIMIT})",
+    )
+    search_parser.add_argument(
+        "--window",
+        type=int,
+        help="Rank only the newest N matches of queries matching more (faster)",
+    )
+    search_parser.add_argument(
+        "--json", action="store_true", help="Print one JSON object per hit"
+    )
+
+    compact_parser = subparsers.add_parser(
+        "compact",
+        help="Re-encode stored bodies with the current --compression and vacuum",
+    )
+    compact_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BODY_BATCH_SIZE,
+        help=f"Bodies re-encoded per transaction (default: {BODY_BATCH_SIZE})",
+    )
+    compact_parser.add_argument(
+        "--no-vacuum",
+        action="store_true",
+        help="Skip the final VACUUM (it briefly blocks other writers)",
+    )
+
     args = parser.parse_args()
 
-    app = ChatManagerApp(db_url=args.db)
+    try:
+        set_tokenizer(args.tokenizer)
+        set_compression(args.compression, args.compress_threshold)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not args.profile:
+        run(args, parser)
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run, args, parser)
+    finally:
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile}", file=sys.stderr)
+
+
+def run(args, parser):
+    """Run the parsed command, or the TUI when none was given"""
+    if args.command == "compact":
+        session = init_db(args.db)
+        try:
+            before = database_size(session)
+            rewritten = recompress_bodies(session, batch_size=args.batch_size)
+            if not args.no_vacuum:
+                vacuum(session)
+            after = database_size(session)
+        finally:
+            session.close()
+        print(f"Re-encoded {rewritten:,} bodies")
+        print(f"Database size: {before:,} -> {after:,} bytes")
+        return
+
+    if args.command == "stats":
+        session = init_db(args.db)
+        try:
+            if args.prune:
+                print(f"Pruned {prune_orphan_bodies(session):,} unreferenced bodies")
+            print_stats(session, as_json=args.json)
+        finally:
+            session.close()
+        return
+
+    if args.command in ("path", "subtree", "search"):
+        session = init_db(args.db)
+        try:
+            if args.command == "path":
+                print_path(session, args.message_id, args.full, args.json)
+            elif args.command == "subtree":
+                print_subtree(
+                    session, args.message_id, args.depth, args.full, args.json
+                )
+            else:
+                print_search(session, args.query, args.limit, args.window, args.json)
+        except LookupError as e:
+            parser.exit(1, f"{e}\n")
+        finally:
+            session.close()
+        return
+
+    if args.command == "backfill-tokens":
+        session = init_db(args.db)
+        try:
+            backfill_token_counts(
+                session, batch_size=args.batch_size, recount=args.recount
+            )
+        finally:
+            session.close()
+        return
+
+    if args.command == "export":
+        if args.path is not None:
+            mode, message_id = "path", args.path
+        elif args.subtree is not None:
+            mode, message_id = "subtree", args.subtree
+        elif args.conversation is not None:
+            mode, message_id = "conversation", args.conversation
+        else:
+            mode, message_id = "leaves", None
+
+        session = init_db(args.db)
+        try:
+            payloads = iter_export(
+                session,
+                mode,
+                message_id,
+                fmt=args.format,
+                budget=args.budget,
+                summarizer=SUMMARIZERS[args.summarizer](),
+            )
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as fp:
+                    count = write_jsonl(payloads, fp)
+                print(f"Exported {count:,} conversations to {args.output}", file=sys.stderr)
+            else:
+                write_jsonl(payloads, sys.stdout)
+            # Keep summaries created for --budget for the next export
+            session.commit()
+        except LookupError as e:
+            parser.exit(1, f"{e}\n")
+        finally:
+            session.close()
+        return
+
+    if args.command == "import":
+        session = init_db(args.db)
+        try:
+            import_export(
+                session,
+                args.path,
+                fmt=args.format,
+                batch_size=args.batch_size,
+                commit_every=args.commit_every,
+                restart=args.restart,
+            )
+        except (OSError, ExportFormatError) as e:
+            parser.exit(1, f"Import failed: {e}\n")
+        finally:
+            session.close()
+        return
+
+    if args.schema_version:
+        session = init_db(args.db)
+        version = get_schema_version(session.connection())
+        print(f"Schema version: {version} (latest: {LATEST_VERSION})")
+        session.close()
+        return
+
+    # Textual and the widgets load only for the TUI; subcommands skip that cost
+    from src.ui.app import ChatManagerApp
+
+    app = ChatManagerApp(db_url=args.db, lazy_tree=args.lazy, watch_interval=args.watch)
     app.run()
 
 
@@ -1,16 +1,59 @@
 """Main application class"""
 
+from functools import wraps
 from pathlib import Path
+from sqlalchemy.orm import Session
 from textual.app import App, ComposeResult
 from textual.widgets import Header, Footer, TabbedContent, TabPane
 from textual.containers import Horizontal, Vertical
 from textual.binding import Binding
+from textual.worker import get_current_worker
 
 from src.database.models import Message
+from src.database.bodies import BodyCache
+from src.database.branch_diff import compare_branches
 from src.database.db import init_db, create_sample_data
+from src.database.tree_loader import conversation_of, load_message_tree, load_path
+from src.database.sync import ChangeTracker
+from src.database.migrations import get_schema_version
+from src.utils.instrumentation import instrumentation
+from src.widgets.branch_diff import BranchDiffView
+from src.widgets.conversation_list import ConversationList
 from src.widgets.message_tree import MessageTree
 from src.widgets.conversation_path import ConversationPath
 from src.widgets.graph_view import GraphView
+from src.widgets.search_panel import SearchPanel
+from src.widgets.stats_panel import StatsPanel
+
+
+# Seconds of highlight quiet time before the path/graph views are rebuilt
+HIGHLIGHT_DEBOUNCE = 0.06
+# Tab pane id -> id of the widget it holds, in `v` toggle order
+VIEW_TABS = {
+    "path-tab": "#conversation-path",
+    "graph-tab": "#graph-view",
+    "diff-tab": "#branch-diff",
+}
+
+
+def timed_action(name):
+    """Record the method as a UI action in the stats panel, paint included
+
+    Called from inside another action it counts as one of its phases.
+    """
+
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with instrumentation.action(name) as action:
+                result = method(self, *args, **kwargs)
+            if action is not None:
+                self.call_after_refresh(action.mark_painted)
+            return result
+
+        return wrapper
+
+    return decorate
 
 
 class ChatManagerApp(App):
@@ -22,84 +65,291 @@ class ChatManagerApp(App):
     BINDINGS = [
         Binding("q", "quit", "Quit", show=True),
         Binding("r", "refresh", "Refresh", show=True),
+        Binding("R", "full_refresh", "Reload", show=False),
         Binding("1", "focus_tree", "Focus Tree", show=True),
+        Binding("c", "focus_conversations", "Conversations", show=True),
         Binding("2", "focus_view", "Focus View", show=True),
         Binding("v", "toggle_view", "Toggle View", show=True),
+        Binding("m", "mark_current", "Mark", show=False),
+        Binding("/", "search", "Search", show=True),
+        Binding("s", "toggle_stats", "Stats", show=True),
         Binding("?", "help", "Help", show=True),
     ]
 
-    def __init__(self, db_url="sqlite:///data/chat_history.db"):
+    def __init__(
+        self,
+        db_url="sqlite:///data/chat_history.db",
+        lazy_tree=False,
+        watch_interval=None,
+    ):
         super().__init__()
         self.db_url = db_url
+        self.lazy_tree = lazy_tree
+        self.watch_interval = watch_interval
         self.session = init_db(self.db_url)
+        instrumentation.install(self.session.get_bind())
 
         if self.session.query(Message).count() == 0:
             create_sample_data(self.session)
 
+        self.tracker = ChangeTracker(self.session)
+        # Root id of the conversation the tree, graph and path views show
+        self.conversation_id = None
+        # Full message text for the path view, fetched on demand
+        self.bodies = BodyCache(self.session)
+
+        # Highlight handling: the newest request wins, older ones are dropped
+        self._highlight_timer = None
+        self._highlight_request = 0
+        # In-memory databases are per connection, so workers can't share them
+        self._threaded_reads = self.session.get_bind().url.database not in (
+            None,
+            "",
+            ":memory:",
+        )
+
     def compose(self) -> ComposeResult:
         yield Header()
 
         with Horizontal():
             with Vertical(id="tree-container"):
-                yield MessageTree(id="message-tree")
+                yield SearchPanel(id="search-panel")
+                yield ConversationList(id="conversation-list")
+                yield MessageTree(id="message-tree", lazy=self.lazy_tree)
 
             with Vertical(id="view-container"):
                 with TabbedContent(initial="path-tab"):
                     with TabPane("Path View", id="path-tab"):
-                        yield ConversationPath(id="conversation-path")
+                        yield ConversationPath(
+                            id="conversation-path", bodies=self.bodies
+                        )
 
                     with TabPane("Graph View", id="graph-tab"):
                         yield GraphView(id="graph-view")
 
+                    with TabPane("Branch Diff", id="diff-tab"):
+                        yield BranchDiffView(id="branch-diff")
+
+        yield StatsPanel(id="stats-panel")
         yield Footer()
 
     def on_mount(self) -> None:
+        self.sub_title = f"schema v{get_schema_version(self.session.connection())}"
+
+        conversations = self.query_one("#conversation-list", ConversationList)
+        conversations.load(self.session)
+        self.show_conversation(conversations.first_root_id())
+
+        self.query_one("#message-tree", MessageTree).focus()
+
+        if self.watch_interval:
+            self.set_interval(self.watch_interval, self.sync_changes)
+
+    @timed_action("show_conversation")
+    def show_conversation(self, root_id, message_id=None):
+        """Scope the tree, graph and path views to one conversation"""
+        self.conversation_id = root_id
+        # A lazy tree fetches its own rows; the graph then loads on first use
+        tree_data = None
+        if not self.lazy_tree and root_id is not None:
+            with instrumentation.phase("conversation.load"):
+                tree_data = load_message_tree(self.session, root_id)
+
         tree = self.query_one("#message-tree", MessageTree)
-        tree.build_tree_from_db(self.session)
+        tree.build_tree_from_db(self.session, tree_data, root_id=root_id)
+        self.query_one("#branch-diff", BranchDiffView).clear_diff()
+        self.query_one("#conversation-list", ConversationList).show_active(root_id)
+        if root_id is None:
+            return
 
-        first_message = self.session.query(Message).first()
-        if first_message:
-            conversation = self.query_one("#conversation-path", ConversationPath)
-            conversation.show_conversation_path(first_message, self.session)
+        conversation = self.query_one("#conversation-path", ConversationPath)
+        conversation.show_conversation_path(
+            message_id or root_id, self.session, tree_data
+        )
+        graph = self.query_one("#graph-view", GraphView)
+        graph.show_graph(self.session, conversation.current_message, tree_data)
 
-            graph = self.query_one("#graph-view", GraphView)
-            graph.show_graph(self.session, first_message)
+    def on_conversation_list_selected(self, event) -> None:
+        self.show_conversation(event.root_id)
+        self.query_one("#message-tree", MessageTree).focus()
 
-        tree.focus()
+    def on_message_tree_branches_marked(self, event) -> None:
+        self.show_branch_diff(event.left_id, event.right_id)
+        self.query_one(TabbedContent).active = "diff-tab"
+
+    @timed_action("branch_diff")
+    def show_branch_diff(self, left_id, right_id):
+        """Compare two branches, from the graph's in-memory tree when it has both"""
+        tree_data = self.query_one("#graph-view", GraphView).tree_data
+        diff = compare_branches(self.session, left_id, right_id, tree_data)
+        self.query_one("#branch-diff", BranchDiffView).show_diff(diff)
 
     def on_tree_node_highlighted(self, event) -> None:
-        if event.node.data:
-            conversation = self.query_one("#conversation-path", ConversationPath)
-            conversation.show_conversation_path(event.node.data, self.session)
+        if event.node.data is None:
+            return
 
-            graph = self.query_one("#graph-view", GraphView)
-            graph.show_graph(self.session, event.node.data)
+        # Debounce key repeat: only the last highlight in a burst is rendered
+        self._highlight_request += 1
+        request = self._highlight_request
+        message_id = event.node.data
+        if self._highlight_timer is not None:
+            self._highlight_timer.stop()
+        self._highlight_timer = self.set_timer(
+            HIGHLIGHT_DEBOUNCE, lambda: self._start_highlight_update(request, message_id)
+        )
 
-    def action_refresh(self) -> None:
+    @timed_action("highlight")
+    def _start_highlight_update(self, request, message_id):
+        if request != self._highlight_request:
+            return
+        # The graph's tree holds the whole conversation: no query needed
+        tree_data = self.query_one("#graph-view", GraphView).tree_data
+        if tree_data is not None and message_id in tree_data.index:
+            self._apply_highlight_update(request, tree_data.path_to(message_id))
+            return
+        if not self._threaded_reads:
+            path = load_path(self.session, message_id)
+            self._apply_highlight_update(request, path)
+            return
+
+        # exclusive=True cancels any in-flight rebuild for an older highlight
+        self.run_worker(
+            lambda: self._load_highlight_path(request, message_id),
+            thread=True,
+            exclusive=True,
+            group="highlight",
+        )
+
+    def _load_highlight_path(self, request, message_id):
+        """Worker: fetch the path on its own session, off the UI thread"""
+        worker = get_current_worker()
+        with instrumentation.action("highlight.load"):
+            with Session(bind=self.session.get_bind()) as session:
+                # Plain rows, safe to hand to the UI thread
+                path = load_path(session, message_id)
+
+        if not worker.is_cancelled:
+            self.call_from_thread(self._apply_highlight_update, request, path)
+
+    @timed_action("highlight")
+    def _apply_highlight_update(self, request, path):
+        if request != self._highlight_request or not path:
+            return
+
+        message = path[-1]
+        conversation = self.query_one("#conversation-path", ConversationPath)
+        conversation.show_path(message, path)
+
+        # Selection changes only repaint the graph; relayout happens on reload
+        graph = self.query_one("#graph-view", GraphView)
+        graph.show_graph(self.session, message)
+
+    def sync_changes(self, force=False):
+        """Patch the views with rows written since the last sync"""
+        if not force and not self.tracker.has_external_changes():
+            return None
+
+        changes = self.tracker.fetch_changes()
+        if changes:
+            self._apply_sync(changes)
+        return changes
+
+    @timed_action("sync")
+    def _apply_sync(self, changes):
         tree = self.query_one("#message-tree", MessageTree)
-        tree.build_tree_from_db(self.session)
+        graph = self.query_one("#graph-view", GraphView)
+        graph.apply_changes(changes, self.session)
+        if not tree.apply_changes(changes):
+            tree.build_tree_from_db(
+                self.session, graph.tree_data, root_id=self.conversation_id
+            )
+        # New or deleted roots change the conversation list
+        if changes.deleted_ids or any(row.parent_id is None for row in changes.added):
+            self.query_one("#conversation-list", ConversationList).reload()
+
+        conversation = self.query_one("#conversation-path", ConversationPath)
+        conversation.apply_changes(changes, self.session)
+
+        # Marks survive patches but not rebuilds
+        diff_view = self.query_one("#branch-diff", BranchDiffView)
+        if len(tree.marked) == 2:
+            self.show_branch_diff(*tree.marked)
+        elif diff_view.diff is not None:
+            diff_view.clear_diff()
+
+    def action_refresh(self) -> None:
+        changes = self.sync_changes(force=True)
+        if changes:
+            self.notify(
+                f"Refreshed: {len(changes.added)} new, {len(changes.updated)} "
+                f"updated, {len(changes.deleted_ids)} deleted"
+            )
+        else:
+            self.notify("Already up to date")
+
+    @timed_action("reload")
+    def action_full_refresh(self) -> None:
+        self.tracker.fetch_changes()
+        conversations = self.query_one("#conversation-list", ConversationList)
+        conversations.reload()
+        root_id = self.conversation_id
+        if root_id is None or conversation_of(self.session, root_id) != root_id:
+            root_id = conversations.first_root_id()
 
         graph = self.query_one("#graph-view", GraphView)
-        graph.show_graph(self.session)
+        graph.tree_data = None
+        self.show_conversation(root_id)
 
         self.notify("Refreshed")
 
+    def action_search(self) -> None:
+        self.query_one("#search-panel", SearchPanel).open(self.session)
+
+    @timed_action("search_select")
+    def on_search_panel_selected(self, event) -> None:
+        root_id = conversation_of(self.session, event.message_id)
+        if root_id is not None and root_id != self.conversation_id:
+            self.show_conversation(root_id, event.message_id)
+        tree = self.query_one("#message-tree", MessageTree)
+        tree_data = self.query_one("#graph-view", GraphView).tree_data
+        index = tree_data.index if tree_data is not None else None
+        if tree.reveal_message(event.message_id, index):
+            tree.focus()
+            return
+        # Too deep (or not loaded) for the tree; still show the message's path
+        self.notify(f"Message {event.message_id} can't be shown in the tree")
+        self._highlight_request += 1
+        self._start_highlight_update(self._highlight_request, event.message_id)
+
+    def action_mark_current(self) -> None:
+        """Mark the message shown in the path view (the tree marks its cursor)"""
+        conversation = self.query_one("#conversation-path", ConversationPath)
+        message = conversation.current_message
+        if message is not None:
+            self.query_one("#message-tree", MessageTree).mark(message.id)
+
     def action_focus_tree(self) -> None:
         self.query_one("#message-tree").focus()
 
+    def action_focus_conversations(self) -> None:
+        self.query_one("#conversation-list").focus()
+
     def action_focus_view(self) -> None:
         tabs = self.query_one(TabbedContent)
-        if tabs.active == "path-tab":
-            self.query_one("#conversation-path").focus()
-        else:
-            self.query_one("#graph-view").focus()
+        self.query_one(VIEW_TABS[tabs.active]).focus()
 
     def action_toggle_view(self) -> None:
         tabs = self.query_one(TabbedContent)
-        tabs.active = "graph-tab" if tabs.active == "path-tab" else "path-tab"
+        order = list(VIEW_TABS)
+        tabs.active = order[(order.index(tabs.active) + 1) % len(order)]
+
+    def action_toggle_stats(self) -> None:
+        self.query_one("#stats-panel", StatsPanel).toggle()
 
     def action_help(self) -> None:
         self.notify("Press ? for help", timeout=5)
 
     def on_unmount(self) -> None:
+        self.tracker.close()
+        instrumentation.uninstall(self.session.get_bind())
         self.session.close()
@@ -2,11 +2,34 @@
 
 from rich.text import Text
 
+from src.database.search import MATCH_END, MATCH_START
+from src.utils.render_cache import RenderCache, message_version
+
+# Tree labels keyed by (message id, version, max_length); shared across rebuilds
+label_cache = RenderCache(maxsize=4096)
+
 
 def format_message_label(message, max_length=40):
-    """Format message for display in tree"""
-    content = message.content[:max_length]
-    if len(message.content) > max_length:
+    """Format message for display in tree (cached per message version)"""
+    key = (message.id, message_version(message), max_length)
+    return label_cache.get(key, lambda: _build_message_label(message, max_length))
+
+
+def format_token_count(count):
+    """Short token count such as `950 tok` or `12.3k tok`"""
+    if count is None:
+        return "? tok"
+    if count < 1000:
+        return f"{count} tok"
+    if count < 1_000_000:
+        return f"{count / 1000:.1f}k tok"
+    return f"{count / 1_000_000:.1f}M tok"
+
+
+def _build_message_label(message, max_length):
+    preview = message.preview or ""
+    content = preview[:max_length]
+    if len(preview) > max_length:
         content += "..."
 
     if message.speaker == "user":
@@ -22,14 +45,48 @@ def format_message_label(message, max_length=40):
     label.append(f"{icon} ", style="")
     label.append(f"[{timestamp_str}] ", style="dim")
     label.append(content, style=style)
+    if message.path_token_count is not None:
+        label.append(f" ({format_token_count(message.path_token_count)})", style="dim")
+
+    return label
+
+
+def format_conversation_label(row, max_length=40):
+    """Format a load_conversations row for the conversation list"""
+    icon = "👤" if row.speaker == "user" else "🤖"
+    preview = row.preview or ""
+    title = preview[:max_length] + ("..." if len(preview) > max_length else "")
+    last = row.last_timestamp or row.timestamp
 
+    label = Text()
+    label.append(f"{icon} ", style="")
+    label.append(f"#{row.root_id} ", style="dim")
+    label.append(title, style="bold")
+    label.append(
+        f" · {row.message_count:,} msgs · {last.strftime('%Y-%m-%d')}", style="dim"
+    )
     return label
 
 
-def format_message_detail(message):
-    """Format full message details"""
-    print(f"DEBUG format_message_detail called for message {message.id}")  # DEBUG
+def format_search_hit(hit):
+    """Format a search hit with its matched terms highlighted"""
+    icon = "👤" if hit.speaker == "user" else "🤖"
+    label = Text()
+    label.append(f"{icon} ", style="")
+    label.append(f"#{hit.message_id} ", style="dim")
+
+    snippet = " ".join(hit.snippet.split())
+    for index, part in enumerate(snippet.split(MATCH_START)):
+        matched, _, rest = part.rpartition(MATCH_END) if index else ("", "", part)
+        if matched:
+            label.append(matched, style="bold reverse")
+        label.append(rest)
+
+    return label
 
+
+def format_message_detail(message, content):
+    """Format full message details; content is the message's full text"""
     timestamp_str = message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
 
     if message.speaker == "user":
@@ -46,9 +103,6 @@ def format_message_detail(message):
         f"Message ID: {message.id} | Parent: {message.parent_id or 'Root'}\n\n",
         style="dim italic",
     )
-    content_text.append(message.content, style="white")
-
-    print(f"DEBUG content_text length: {len(str(content_text))}")  # DEBUG
-    print(f"DEBUG border_style: {border_style}")  # DEBUG
+    content_text.append(content, style="white")
 
     return content_text, border_style
@@ -0,0 +1,254 @@
+"""Layout stage of the graph view: line spans of every visible box"""
+
+from itertools import accumulate
+
+from src.utils.render_cache import message_version
+
+HEADER_HEIGHT = 4
+SEPARATOR_HEIGHT = 3
+# Top border, speaker, timestamp, separator and bottom border
+BOX_CHROME_HEIGHT = 5
+# Columns of guide prefix per tree level
+INDENT = 4
+MIN_WIDTH = 52
+
+HEADER = ("header",)
+SEPARATOR = ("separator",)
+
+
+class GraphLayout:
+    """Visible blocks of a MessageTreeData in pre-order, with their line spans
+
+    blocks holds HEADER, SEPARATOR or node blocks
+    ("node", message, parent id, is_last, level, content lines, hidden),
+    where hidden counts the descendants folded into a collapsed box. A
+    subtree is a contiguous run of blocks, so changes and collapses splice
+    in a fresh layout of just the affected subtrees; boxes whose message
+    didn't change reuse their cached measurement, and collapsed subtrees
+    have no blocks at all.
+
+    measure(message, hidden) returns (content lines, box width). sizes is a
+    dict the caller may share between layouts of the same tree and zoom.
+    """
+
+    def __init__(self, tree_data, measure, collapsed, sizes=None):
+        self.tree_data = tree_data
+        self.collapsed = collapsed
+        self._measure = measure
+        self._sizes = {} if sizes is None else sizes
+        self.build()
+
+    def build(self):
+        """Lay out the whole tree"""
+        self.blocks = [HEADER]
+        self.heights = [HEADER_HEIGHT]
+        self.widths = [MIN_WIDTH]
+        for idx, root in enumerate(self.tree_data.roots):
+            if idx > 0:
+                self.blocks.append(SEPARATOR)
+                self.heights.append(SEPARATOR_HEIGHT)
+                self.widths.append(0)
+            self._lay_out(
+                root, None, True, 0, self.blocks, self.heights, self.widths
+            )
+        self._reindex()
+
+    @property
+    def height(self):
+        return self.starts[-1] + self.heights[-1]
+
+    @property
+    def width(self):
+        return max(self.widths)
+
+    def _box_size(self, message, hidden):
+        """(content lines, width), measured once per message version"""
+        cached = self._sizes.get(message.id)
+        # Rows are immutable, so the same object needs no version check
+        if cached is not None and cached[0] is message and cached[2] == hidden:
+            return cached[3], cached[4]
+        version = message_version(message)
+        if cached is None or cached[1] != version or cached[2] != hidden:
+            cached = (message, version, hidden, *self._measure(message, hidden))
+        else:
+            cached = (message, *cached[1:])
+        self._sizes[message.id] = cached
+        return cached[3], cached[4]
+
+    def _hidden_count(self, message_id):
+        if message_id not in self.collapsed or message_id not in self.tree_data:
+            return 0
+        return self.tree_data.index.subtree_size(message_id) - 1
+
+    def _lay_out(self, message, parent_id, is_last, level, blocks, heights, widths):
+        """Append the visible blocks of message's subtree, without recursion"""
+        stack = [(message, parent_id, is_last, level)]
+        while stack:
+            message, parent_id, is_last, level = stack.pop()
+            hidden = self._hidden_count(message.id)
+            lines, width = self._box_size(message, hidden)
+            blocks.append(("node", message, parent_id, is_last, level, lines, hidden))
+            heights.append(BOX_CHROME_HEIGHT + lines)
+            widths.append(level * INDENT + width)
+            if hidden:
+                continue
+
+            children = self.tree_data.get_children(message.id)
+            last = len(children) - 1
+            for child_idx in range(last, -1, -1):
+                stack.append(
+                    (children[child_idx], message.id, child_idx == last, level + 1)
+                )
+
+    def _reindex(self):
+        self.starts = list(accumulate(self.heights[:-1], initial=0))
+        self.index = {
+            block[1].id: position
+            for position, block in enumerate(self.blocks)
+            if block[0] == "node"
+        }
+
+    def _subtree_end(self, position):
+        """Position just past the visible subtree of the block at position"""
+        blocks = self.blocks
+        level = blocks[position][4]
+        end = position + 1
+        count = len(blocks)
+        while end < count and blocks[end][0] == "node" and blocks[end][4] > level:
+            end += 1
+        return end
+
+    def _relayout(self, message_ids):
+        """Replace the visible subtrees of message_ids with a fresh layout"""
+        spans = sorted(
+            (self.index[message_id], self._subtree_end(self.index[message_id]))
+            for message_id in message_ids
+            if message_id in self.index
+        )
+        # Drop subtrees nested in another one, then splice back to front so
+        # earlier positions stay valid
+        outer = []
+        for start, end in spans:
+            if not outer or start >= outer[-1][1]:
+                outer.append((start, end))
+        for start, end in reversed(outer):
+            _, message, parent_id, is_last, level, _, _ = self.blocks[start]
+            blocks, heights, widths = [], [], []
+            message = self.tree_data.get(message.id)
+            if message is not None:
+                self._lay_out(
+                    message, parent_id, is_last, level, blocks, heights, widths
+                )
+            self.blocks[start:end] = blocks
+            self.heights[start:end] = heights
+            self.widths[start:end] = widths
+        self._reindex()
+
+    def toggle(self, message_id):
+        """Collapse or expand the subtree below a visible message
+
+        Returns False for messages that aren't shown or have no children.
+        """
+        if message_id not in self.index:
+            return False
+        if message_id in self.collapsed:
+            self.collapsed.discard(message_id)
+        elif self.tree_data.get_children(message_id):
+            self.collapsed.add(message_id)
+        else:
+            return False
+        self._relayout([message_id])
+        return True
+
+    def reveal(self, message_id):
+        """Expand every collapsed ancestor hiding message_id"""
+        if message_id in self.index or message_id not in self.tree_data:
+            return
+        index = self.tree_data.index
+        hiding = [
+            ancestor_id
+            for ancestor_id in self.collapsed
+            if ancestor_id != message_id
+            and ancestor_id in index
+            and index.is_ancestor(ancestor_id, message_id)
+        ]
+        self.collapsed.difference_update(hiding)
+        self._relayout(hiding)
+
+    def expand_all(self):
+        if self.collapsed:
+            self.collapsed.clear()
+            self.build()
+
+    def apply_changes(self, changes):
+        """Re-lay-out only what a sync.ChangeSet touched
+
+        Expects tree_data to be patched already. Returns False when roots
+        were added or removed and the caller should build() instead.
+        """
+        tree_data = self.tree_data
+        # Deletes and moves can orphan children, which then show as roots
+        shown_roots = [
+            block[1].id
+            for block in self.blocks
+            if block[0] == "node" and block[4] == 0
+        ]
+        if shown_roots != [root.id for root in tree_data.roots]:
+            return False
+
+        affected = set()
+        for message_id in changes.deleted_ids:
+            position = self.index.get(message_id)
+            if position is None:
+                continue
+            parent_id = self.blocks[position][2]
+            if parent_id is None:
+                return False
+            affected.add(parent_id)
+
+        for message in changes.added:
+            if message.id not in tree_data:
+                continue
+            if message.parent_id is None or message.parent_id not in tree_data:
+                return False
+            affected.add(message.parent_id)
+
+        for message in changes.updated:
+            position = self.index.get(message.id)
+            if message.id not in tree_data:
+                # Moved to another conversation: its old parent's run loses
+                # the whole subtree
+                if position is None:
+                    continue
+                old_parent_id = self.blocks[position][2]
+                if old_parent_id is None:
+                    return False
+                affected.add(old_parent_id)
+                continue
+            if position is None:
+                # Was hidden; only its new parent's run can change
+                if message.parent_id is None or message.parent_id not in tree_data:
+                    return False
+                affected.add(message.parent_id)
+                continue
+            old_parent_id = self.blocks[position][2]
+            if old_parent_id != message.parent_id:
+                if old_parent_id is None or message.parent_id not in tree_data:
+                    return False
+                affected.update((old_parent_id, message.parent_id))
+            else:
+                # Same place in the tree: just the box itself
+                affected.add(message.id)
+
+        # Folded counts change when descendants come and go
+        if self.collapsed and (changes.added or changes.deleted_ids or changes.updated):
+            affected.update(
+                message_id
+                for message_id in self.collapsed
+                if message_id in self.index
+                and self.blocks[self.index[message_id]][6]
+                != self._hidden_count(message_id)
+            )
+
+        self._relayout(affected)
+        return True
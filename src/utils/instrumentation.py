@@ -0,0 +1,133 @@
+"""Per-action timing of SQL queries and view phases"""
+
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+from sqlalchemy import event
+
+DEFAULT_HISTORY = 50
+
+
+class ActionStats:
+    """Where the time of one UI action went
+
+    seconds is the action's own run time, split into named phases and the
+    SQL queries made while it ran; paint_seconds is filled in once the
+    screen has been refreshed afterwards (layout and line rendering).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.phases = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.paint_seconds = None
+        self._ended = None
+
+    def mark_painted(self):
+        if self._ended is not None and self.paint_seconds is None:
+            self.paint_seconds = perf_counter() - self._ended
+
+    def __repr__(self):
+        return (
+            f"<ActionStats({self.name!r}, {self.seconds * 1000:.1f}ms, "
+            f"queries={self.queries})>"
+        )
+
+
+class Instrumentation:
+    """Records the last `history` actions with their queries and phases
+
+    Actions are tracked per thread, so a worker's queries never count
+    towards the UI action running at the same time. A phase outside any
+    action is recorded as an action of its own.
+    """
+
+    def __init__(self, history=DEFAULT_HISTORY):
+        self.actions = deque(maxlen=history)
+        # Bumped per finished action so viewers can skip redundant redraws
+        self.version = 0
+        self._local = threading.local()
+        self._engines = []
+
+    @property
+    def current(self):
+        return getattr(self._local, "action", None)
+
+    def install(self, engine):
+        """Count and time the queries run on engine"""
+        if engine in self._engines:
+            return
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        self._engines.append(engine)
+
+    def uninstall(self, engine):
+        if engine not in self._engines:
+            return
+        event.remove(engine, "before_cursor_execute", self._before_execute)
+        event.remove(engine, "after_cursor_execute", self._after_execute)
+        self._engines.remove(engine)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, many):
+        elapsed = perf_counter() - conn.info["query_started"].pop()
+        action = self.current
+        if action is not None:
+            action.queries += 1
+            action.query_seconds += elapsed
+
+    @contextmanager
+    def action(self, name):
+        """Time an action; yields its ActionStats, or None when nested
+
+        A nested action is timed as a phase of the enclosing one, unless it
+        has the same name.
+        """
+        current = self.current
+        if current is not None:
+            if current.name == name:
+                yield None
+                return
+            with self.phase(name):
+                yield None
+            return
+
+        action = ActionStats(name)
+        self._local.action = action
+        start = perf_counter()
+        try:
+            yield action
+        finally:
+            action._ended = perf_counter()
+            action.seconds = action._ended - start
+            self._local.action = None
+            self.actions.append(action)
+            self.version += 1
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the block to the current action's phase"""
+        action = self.current
+        if action is None:
+            with self.action(name):
+                yield
+            return
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            action.phases[name] = action.phases.get(name, 0.0) + perf_counter() - start
+
+    def clear(self):
+        self.actions.clear()
+        self.version += 1
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,55 @@
+"""Bounded LRU cache for rendered message fragments"""
+
+from collections import OrderedDict
+
+
+class RenderCache:
+    """LRU cache of rendered fragments with hit/miss counters for tuning"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, render):
+        """Return the cached fragment for key, calling render() on a miss"""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = render()
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return value
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def message_version(message):
+    """Cheap fingerprint of the rendered fields of a message
+
+    The body hash stands in for the content, so the text is never rescanned.
+    """
+    return hash(
+        (message.body_hash, message.speaker, message.timestamp, message.path_token_count)
+    )
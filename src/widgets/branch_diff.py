@@ -0,0 +1,125 @@
+"""Side-by-side comparison of two branches of a conversation"""
+
+from rich.text import Text
+from textual.binding import Binding
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+from src.utils.formatters import format_message_label, format_token_count
+
+# Title, shared prefix, divergence point, column titles and a rule
+HEADER_LINES = 5
+GUTTER = " │ "
+
+
+class BranchDiffView(ScrollView):
+    """Shared prefix collapsed to one line above the two diverging suffixes
+
+    One message per line and only the lines on screen are rendered, so
+    branches thousands of messages deep scroll as cheaply as short ones.
+    """
+
+    BINDINGS = [
+        Binding("j", "scroll_down", "Down", show=False),
+        Binding("k", "scroll_up", "Up", show=False),
+        Binding("g", "scroll_home", "Top", show=False),
+        Binding("G", "scroll_end", "Bottom", show=False),
+        Binding("d", "page_down", "Page Down", show=False),
+        Binding("u", "page_up", "Page Up", show=False),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.diff = None
+
+    def show_diff(self, diff):
+        """Display a branch_diff.BranchDiff"""
+        self.diff = diff
+        rows = max(len(diff.left), len(diff.right), 1)
+        self.virtual_size = Size(0, HEADER_LINES + rows)
+        self.scroll_home(animate=False)
+        self.refresh()
+
+    def clear_diff(self):
+        self.diff = None
+        self.virtual_size = Size(0, 1)
+        self.refresh()
+
+    def render_line(self, y):
+        width = self.scrollable_content_region.width
+        text = self._line(self.scroll_offset.y + y, width)
+        text.truncate(width, overflow="ellipsis")
+        strip = Strip(text.render(self.app.console), text.cell_len)
+        return strip.crop_extend(0, width, self.rich_style)
+
+    def _line(self, line, width):
+        diff = self.diff
+        if diff is None:
+            if line == 0:
+                return Text("Mark two messages with m to compare them", style="dim")
+            return Text()
+
+        if line == 0:
+            return Text.assemble(
+                ("Branch diff  ", "bold blue"),
+                f"#{diff.left_id}  ⟷  #{diff.right_id}",
+            )
+        if line == 1:
+            if diff.ancestor is None:
+                return Text("No common ancestor: separate trees", style="dim")
+            return Text(
+                f"▸ Shared prefix: {diff.shared_count:,} messages · "
+                f"{format_token_count(diff.shared_tokens)} (collapsed)",
+                style="dim",
+            )
+        if line == 2:
+            if diff.ancestor is None:
+                return Text()
+            return Text("◆ Diverges after ", style="bold").append_text(
+                format_message_label(diff.ancestor, max_length=width)
+            )
+
+        column = max((width - len(GUTTER)) // 2, 1)
+        if line == 3:
+            return self._columns(
+                self._side_title("A", diff.left_id, diff.left, diff.left_tokens),
+                self._side_title("B", diff.right_id, diff.right, diff.right_tokens),
+                column,
+            )
+        if line == 4:
+            rule = Text("─" * column, style="dim")
+            return self._columns(rule, rule, column)
+
+        index = line - HEADER_LINES
+        return self._columns(
+            self._row(diff.left, index, column),
+            self._row(diff.right, index, column),
+            column,
+        )
+
+    def _side_title(self, name, message_id, rows, tokens):
+        return Text.assemble(
+            (f"{name} #{message_id}", "bold"),
+            (f" · {len(rows):,} msgs · {format_token_count(tokens)}", "dim"),
+        )
+
+    def _row(self, rows, index, column):
+        if index < len(rows):
+            return format_message_label(rows[index], max_length=column)
+        if index == 0:
+            return Text("(ends at the divergence point)", style="dim italic")
+        return Text()
+
+    def _columns(self, left, right, column):
+        left = left.copy()
+        left.truncate(column, overflow="ellipsis", pad=True)
+        right = right.copy()
+        right.truncate(column, overflow="ellipsis")
+        return Text.assemble(left, (GUTTER, "dim"), right)
+
+    def action_page_down(self):
+        self.scroll_page_down()
+
+    def action_page_up(self):
+        self.scroll_page_up()
@@ -0,0 +1,88 @@
+"""Paged list of conversations for picking the one the views show"""
+
+from textual.binding import Binding
+from textual.message import Message
+from textual.widgets import OptionList
+from textual.widgets.option_list import Option, OptionDoesNotExist
+
+from src.database.tree_loader import CONVERSATION_PAGE, load_conversations
+from src.utils.formatters import format_conversation_label
+
+# Load the next page once the highlight is this close to the end
+LOAD_AHEAD = 10
+
+
+class ConversationList(OptionList):
+    """Conversations by root id, loaded a page at a time as the list scrolls"""
+
+    BINDINGS = [
+        Binding("j", "cursor_down", "Down", show=False),
+        Binding("k", "cursor_up", "Up", show=False),
+    ]
+
+    class Selected(Message):
+        """A conversation was chosen"""
+
+        def __init__(self, root_id):
+            super().__init__()
+            self.root_id = root_id
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = None
+        self.active_root_id = None
+        self._last_root_id = 0
+        self._exhausted = False
+
+    def load(self, session):
+        """Replace the list with the first page of conversations"""
+        self.session = session
+        self.clear_options()
+        self._last_root_id = 0
+        self._exhausted = False
+        self._load_page()
+
+    def reload(self):
+        """Reload the pages seen so far, e.g. after conversations were added"""
+        if self.session is None:
+            return
+        seen = self._last_root_id
+        self.load(self.session)
+        while not self._exhausted and self._last_root_id < seen:
+            self._load_page()
+        self.show_active(self.active_root_id)
+
+    def first_root_id(self):
+        if not self.option_count:
+            return None
+        return int(self.get_option_at_index(0).id)
+
+    def show_active(self, root_id):
+        """Mark the conversation the views show and move the highlight to it"""
+        self.active_root_id = root_id
+        if root_id is None:
+            return
+        try:
+            self.highlighted = self.get_option_index(str(root_id))
+        except OptionDoesNotExist:
+            # Not on a loaded page (e.g. reached through search)
+            pass
+
+    def _load_page(self):
+        rows = load_conversations(self.session, self._last_root_id)
+        if len(rows) < CONVERSATION_PAGE:
+            self._exhausted = True
+        if rows:
+            self._last_root_id = rows[-1].root_id
+        self.add_options(
+            Option(format_conversation_label(row), id=str(row.root_id)) for row in rows
+        )
+
+    def on_option_list_option_highlighted(self, event):
+        event.stop()
+        if not self._exhausted and event.option_index >= self.option_count - LOAD_AHEAD:
+            self._load_page()
+
+    def on_option_list_option_selected(self, event):
+        event.stop()
+        self.post_message(self.Selected(int(event.option.id)))
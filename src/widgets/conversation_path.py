@@ -1,19 +1,60 @@
 """Widget for displaying conversation paths"""
 
-from pathlib import Path
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from textual.widgets import Static
 from textual.containers import ScrollableContainer
 from textual.binding import Binding
 
-from src.database.models import Message
+from src.database.bodies import BodyCache
+from src.database.tree_loader import load_path
 from src.utils.formatters import format_message_detail
+from src.utils.instrumentation import instrumentation
+from src.utils.render_cache import message_version
+
+# Messages mounted above and below the viewport
+OVERSCAN = 4
+# Height of `.arrow` and vertical margin of `.message-box` in app.tcss
+ARROW_HEIGHT = 2
+BOX_MARGIN = 1
+# Icon, timestamp and id lines plus the blank line before the content
+DETAIL_HEADER_LINES = 4
+# Top and bottom border and padding of `.message-box`
+BOX_CHROME = 4
+# Left and right margin, border and padding of `.message-box`
+BOX_INSET = 8
+# Rough characters per token, for sizing messages whose text isn't loaded
+CHARS_PER_TOKEN = 4
+
+
+class PathEntry:
+    """Widgets mounted for one message of the displayed path"""
+
+    def __init__(self, message_id, version, box, arrow=None):
+        self.message_id = message_id
+        self.version = version
+        self.box = box
+        # Arrow leading into this message; the first message has none
+        self.arrow = arrow
+
+    @property
+    def first_widget(self):
+        return self.arrow if self.arrow is not None else self.box
+
+    def remove(self):
+        self.box.remove()
+        if self.arrow is not None:
+            self.arrow.remove()
 
 
 class ConversationPath(ScrollableContainer):
-    """Widget to show the full conversation path from root to selected message"""
+    """Widget to show the full conversation path from root to selected message
 
-    # Load CSS from same directory
-    CSS_PATH = Path(__file__).with_suffix(".tcss")
+    Only the messages near the viewport are mounted; spacers above and
+    below stand in for the rest, sized from estimated (and, once mounted,
+    measured) message heights. The path holds lightweight summary rows;
+    full text is fetched through a BodyCache only for mounted messages.
+    """
 
     BINDINGS = [
         Binding("j", "scroll_down", "Down", show=False),
@@ -24,9 +65,22 @@ class ConversationPath(ScrollableContainer):
         Binding("u", "page_up", "Page Up", show=False),
     ]
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, bodies=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.bodies = bodies
         self.current_message = None
+        self.path_ids = set()
+        self._header = None
+        self._top_spacer = None
+        self._bottom_spacer = None
+
+        self._path = []
+        self._versions = []
+        # Height of each message slot (arrow + box + margins) and prefix sums
+        self._heights = []
+        self._offsets = [0]
+        # Mounted window: path index -> PathEntry
+        self._entries = {}
 
     def compose(self):
         """Compose initial widget with placeholder"""
@@ -35,59 +89,314 @@ class ConversationPath(ScrollableContainer):
             classes="placeholder",
         )
 
-    def show_conversation_path(self, message: Message, session):
-        """Display the full conversation path leading to this message"""
+    def show_conversation_path(self, message_id, session, tree_data=None):
+        """Display the full conversation path leading to this message
+
+        A MessageTreeData holding the message supplies the path from memory.
+        """
+        if self.bodies is None:
+            self.bodies = BodyCache(session)
+        try:
+            with instrumentation.phase("path.load"):
+                if tree_data is not None and message_id in tree_data.index:
+                    path = tree_data.path_to(message_id)
+                else:
+                    path = load_path(session, message_id)
+        except Exception as e:
+            self._show_error(e)
+            return
+        if path:
+            self.show_path(path[-1], path)
+        else:
+            self.clear_path()
+
+    def show_path(self, message, path):
+        """Display an already fetched root -> message path of summary rows
+
+        Widgets of the prefix shared with the currently shown path are kept;
+        only the diverging suffix is unmounted and the new tail mounted.
+        """
+        with instrumentation.phase("path.widgets"):
+            self._show_path(message, path)
+
+    def _show_path(self, message, path):
         self.current_message = message
 
         try:
-            path = message.get_path_from_root(session)
+            self.path_ids = {msg.id for msg in path}
 
-            # Remove old widgets
-            for widget in self.query(
-                ".conv-header, .message-box, .arrow, .placeholder"
-            ):
+            for widget in self.query(".placeholder, .error"):
                 widget.remove()
+            self._ensure_frame()
 
-            # Add header
-            header = Static(
-                f"📋 Conversation Path — {len(path)} messages",
-                classes="conv-header",
+            # Add or update header
+            tokens = self._path_tokens(message, path)
+            self._header.update(
+                f"📋 Conversation Path — {len(path)} messages · "
+                f"{'?' if tokens is None else f'{tokens:,}'} tokens"
             )
-            self.mount(header)
 
-            # Add each message
-            for idx, msg in enumerate(path):
-                self._add_message_display(msg, idx, len(path))
+            shared = 0
+            for old, msg in zip(self._path, path):
+                if old.id != msg.id:
+                    break
+                shared += 1
+
+            for index in [i for i in self._entries if i >= shared]:
+                self._entries.pop(index).remove()
+
+            versions = self._versions[:shared]
+            heights = self._heights[:shared]
+            for index, msg in enumerate(path):
+                version = message_version(msg)
+                if index < shared:
+                    # Kept rows only need fresh content if the row changed
+                    if versions[index] != version:
+                        versions[index] = version
+                        heights[index] = self._estimate_height(msg, index)
+                        entry = self._entries.get(index)
+                        if entry is not None:
+                            content = self.bodies.get(msg.body_hash)
+                            entry.box.update(format_message_detail(msg, content)[0])
+                            entry.version = version
+                else:
+                    versions.append(version)
+                    heights.append(self._estimate_height(msg, index))
+
+            self._path = list(path)
+            self._versions = versions
+            self._set_heights(heights)
+
+            # Move the selection highlight instead of rebuilding
+            for index, entry in self._entries.items():
+                entry.box.set_class(entry.message_id == message.id, "selected")
+
+            self._update_window()
+            self.scroll_to_message(len(path) - 1)
 
         except Exception as e:
-            self.log(f"Error: {e}")
-            import traceback
+            self._show_error(e)
+
+    def _path_tokens(self, message, path):
+        """Stored path total, or a sum over the path; None if rows lack counts"""
+        if message.path_token_count is not None:
+            return message.path_token_count
+        if any(msg.token_count is None for msg in path):
+            return None
+        return sum(msg.token_count for msg in path)
+
+    def scroll_to_message(self, index):
+        """Jump so that the message at a path index is at the top"""
+        if not 0 <= index < len(self._path):
+            return
+        # The window follows through watch_scroll_y once the scroll lands
+        self.scroll_to(y=self._content_top() + self._offsets[index], animate=False)
+
+    def watch_scroll_y(self, old_value, new_value):
+        super().watch_scroll_y(old_value, new_value)
+        self._update_window()
+
+    def on_resize(self, event) -> None:
+        # Wrapping changes with the width, so re-estimate everything
+        if self._path:
+            self._set_heights(
+                [self._estimate_height(msg, i) for i, msg in enumerate(self._path)]
+            )
+            self._update_window()
+
+    def _ensure_frame(self):
+        if self._header is None:
+            self._header = Static("", classes="conv-header")
+            self._top_spacer = Static("", classes="spacer")
+            self._bottom_spacer = Static("", classes="spacer")
+            self.mount(self._header, self._top_spacer, self._bottom_spacer)
+
+    def _content_top(self):
+        """Scroll offset at which the first message slot starts"""
+        if self._header is None:
+            return 0
+        return self._header.outer_size.height + BOX_MARGIN
 
-            self.log(traceback.format_exc())
+    def _set_heights(self, heights):
+        self._heights = heights
+        self._offsets = [0, *accumulate(heights)]
 
-            error_widget = Static(f"⚠️  Error: {e}", classes="error")
-            self.mount(error_widget)
+    def _estimate_height(self, message, index):
+        """Approximate rendered height of a message slot in lines
 
-    def _add_message_display(self, message: Message, index: int, total: int):
-        """Add a single message to the conversation view"""
+        Sized from the token count, so the text of off-screen messages is
+        never loaded; mounted messages are measured afterwards.
+        """
+        width = max(self.scrollable_content_region.width - BOX_INSET, 20)
+        if message.token_count is not None:
+            chars = message.token_count * CHARS_PER_TOKEN
+        else:
+            chars = len(message.preview or "")
+        lines = DETAIL_HEADER_LINES + max(1, -(-chars // width))
+        height = lines + BOX_CHROME + BOX_MARGIN
+        if index > 0:
+            height += ARROW_HEIGHT + BOX_MARGIN
+        return height
+
+    def _update_window(self):
+        """Mount the messages near the viewport and unmount the rest"""
+        if not self._path or self._header is None:
+            return
+
+        top = self.scroll_y - self._content_top()
+        viewport = self.scrollable_content_region.height or self.size.height
+        count = len(self._path)
+        first = max(bisect_right(self._offsets, top) - 1 - OVERSCAN, 0)
+        last = min(bisect_left(self._offsets, top + viewport) + OVERSCAN, count)
+
+        for index in [i for i in self._entries if not first <= i < last]:
+            self._entries.pop(index).remove()
+
+        mounted = sorted(self._entries)
+        head = range(first, mounted[0] if mounted else last)
+        tail = range(mounted[-1] + 1 if mounted else last, last)
+        # One query for every body the window is about to show
+        contents = self.bodies.get_many(
+            self._path[index].body_hash for index in [*head, *tail]
+        )
+
+        if head:
+            widgets = []
+            for index in head:
+                message = self._path[index]
+                widgets.extend(
+                    self._add_message_display(
+                        message, index, contents[message.body_hash]
+                    )
+                )
+            anchor = (
+                self._entries[mounted[0]].first_widget
+                if mounted
+                else self._bottom_spacer
+            )
+            self.mount(*widgets, before=anchor)
+        if tail:
+            widgets = []
+            for index in tail:
+                message = self._path[index]
+                widgets.extend(
+                    self._add_message_display(
+                        message, index, contents[message.body_hash]
+                    )
+                )
+            self.mount(*widgets, before=self._bottom_spacer)
+
+        self._top_spacer.styles.height = self._offsets[first]
+        self._bottom_spacer.styles.height = self._offsets[count] - self._offsets[last]
+
+        if head or tail:
+            self.call_after_refresh(self._measure_window)
+
+    def _measure_window(self):
+        """Replace estimates with the real heights of mounted messages"""
+        heights = list(self._heights)
+        changed = False
+        for index, entry in self._entries.items():
+            if not entry.box.is_mounted or index >= len(heights):
+                continue
+            height = entry.box.outer_size.height + BOX_MARGIN
+            if entry.arrow is not None:
+                height += entry.arrow.outer_size.height + BOX_MARGIN
+            if height > BOX_MARGIN and height != heights[index]:
+                heights[index] = height
+                changed = True
+        if changed:
+            # Keep the message at the top of the viewport (or the end) in place
+            at_end = self.scroll_y >= self.max_scroll_y
+            top = self.scroll_y - self._content_top()
+            anchor = max(bisect_right(self._offsets, top) - 1, 0)
+            shift = top - self._offsets[anchor]
+
+            self._set_heights(heights)
+            count = len(self._path)
+            first = min(self._entries, default=0)
+            last = max(self._entries, default=-1) + 1
+            self._top_spacer.styles.height = self._offsets[first]
+            self._bottom_spacer.styles.height = (
+                self._offsets[count] - self._offsets[last]
+            )
+
+            if self.scroll_y != self.scroll_target_y:
+                # Don't fight an animated scroll
+                return
+            if at_end:
+                self.call_after_refresh(self.scroll_end, animate=False)
+            elif anchor < count:
+                y = self._content_top() + self._offsets[anchor] + shift
+                self.call_after_refresh(self.scroll_to, y=y, animate=False)
+
+    def _show_error(self, e):
+        self.log(f"Error: {e}")
+        import traceback
+
+        self.log(traceback.format_exc())
+
+        error_widget = Static(f"⚠️  Error: {e}", classes="error")
+        self.mount(error_widget)
+
+    def apply_changes(self, changes, session):
+        """Re-render only if a sync.ChangeSet touched the displayed path"""
+        if self.current_message is None:
+            return
+        if self.current_message.id in changes.deleted_ids:
+            self.clear_path()
+        elif self.path_ids & changes.touched_ids():
+            self.show_conversation_path(self.current_message.id, session)
+
+    def clear_path(self):
+        """Go back to the placeholder"""
+        self.current_message = None
+        self.path_ids = set()
+        self._header = None
+        self._top_spacer = None
+        self._bottom_spacer = None
+        self._path = []
+        self._versions = []
+        self._set_heights([])
+        self._entries = {}
+        for widget in self.query(
+            ".conv-header, .spacer, .message-box, .arrow, .error"
+        ):
+            widget.remove()
+        self.mount(
+            Static(
+                "📋 Select a message from the tree to view conversation path",
+                classes="placeholder",
+            )
+        )
+
+    def _add_message_display(self, message, index: int, content):
+        """Create the widgets for one message and record them as an entry"""
         try:
-            content_text, _ = format_message_detail(message)
+            content_text, _ = format_message_detail(message, content)
 
             # Build classes
             classes = ["message-box", message.speaker]
-            if message == self.current_message:
+            if message.id == self.current_message.id:
                 classes.append("selected")
 
             msg_static = Static(content_text, classes=" ".join(classes))
-            self.mount(msg_static)
 
             # Add arrow between messages
-            if index < total - 1:
-                arrow = Static("⬇️", classes="arrow")
-                self.mount(arrow)
+            arrow = Static("⬇️", classes="arrow") if index > 0 else None
+
+            self._entries[index] = PathEntry(
+                message.id, message_version(message), msg_static, arrow
+            )
+            return [msg_static] if arrow is None else [arrow, msg_static]
 
         except Exception as e:
             self.log(f"Error adding message: {e}")
+            return []
+
+    def action_scroll_end(self) -> None:
+        # A jump rather than an animation, so re-measured heights stay at the end
+        self.scroll_end(animate=False)
 
     def action_page_down(self) -> None:
         self.scroll_page_down()
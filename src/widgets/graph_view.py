@@ -1,18 +1,27 @@
 """Graph/Flowchart visualization of conversation tree"""
 
-from pathlib import Path
-from textual.widgets import Static
-from textual.containers import ScrollableContainer
+from bisect import bisect_right
 from textual.binding import Binding
+from textual.geometry import Region, Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
 from rich.text import Text
 
-from src.database.models import Message
+from src.database.tree_loader import load_message_tree
+from src.utils.graph_layout import GraphLayout
+from src.utils.instrumentation import instrumentation
+from src.utils.render_cache import RenderCache, message_version
 
+PREFIX_CACHE_SIZE = 512
 
-class GraphView(ScrollableContainer):
-    """ASCII flowchart view of conversation tree"""
 
-    CSS_PATH = Path(__file__).with_suffix(".tcss")
+class GraphView(ScrollView):
+    """ASCII flowchart view of one conversation tree
+
+    Line spans come from a GraphLayout kept per zoom level; painting only
+    renders the lines inside the viewport. Collapsed subtrees are neither
+    laid out nor painted.
+    """
 
     BINDINGS = [
         Binding("j", "scroll_down", "Down", show=False),
@@ -23,147 +32,344 @@ class GraphView(ScrollableContainer):
         Binding("u", "page_up", "Page Up", show=False),
         Binding("+", "zoom_in", "Zoom In", show=False),
         Binding("-", "zoom_out", "Zoom Out", show=False),
+        Binding("z", "toggle_collapse", "Collapse", show=False),
+        Binding("Z", "expand_all", "Expand All", show=False),
     ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.current_message = None
         self.compact_mode = False
-
-    def compose(self):
-        yield Static("Loading graph view...", classes="graph-content")
-
-    def show_graph(self, session, selected_message=None):
-        """Display the conversation as a flowchart/graph"""
+        self.tree_data = None
+        # Ids of messages whose subtrees are folded, shared by every zoom level
+        self.collapsed = set()
+
+        self.graph_layout = None
+        # Layouts per zoom level for the current tree, so zooming back is free
+        self._layouts = {}
+        self._layouts_tree = None
+        # Box measurements per zoom level, kept across layouts of a conversation
+        self._box_sizes = {False: {}, True: {}}
+        # Box lines keyed by (message id, version, compact_mode, mark, hidden)
+        self.render_cache = RenderCache(maxsize=2048)
+        self._line_style = None
+        self._prefix_cache = {}
+
+    def show_graph(self, session, selected_message=None, tree_data=None):
+        """Display the selected message's conversation as a flowchart/graph"""
         self.current_message = selected_message
-
-        root_messages = session.query(Message).filter_by(parent_id=None).all()
-        graph_text = self._build_graph(root_messages, session)
-
-        content = self.query_one(".graph-content", Static)
-        content.update(graph_text)  # Text object will be rendered properly by Static
-
-    def _build_graph(self, root_messages, session):
-        """Build ASCII graph representation using Rich Text"""
-        output = Text()
-
-        # Header
-        output.append("╔", style="bold blue")
-        output.append("═" * 50, style="bold blue")
-        output.append("╗\n", style="bold blue")
-        output.append("║", style="bold blue")
-        output.append(
-            " " * 10 + "CONVERSATION FLOW DIAGRAM" + " " * 15, style="bold blue"
+        root_id = selected_message.root_id if selected_message is not None else None
+
+        # Reuse the last loaded tree unless the caller hands us a fresh one or
+        # the selection moved to another conversation
+        if tree_data is not None:
+            self.tree_data = tree_data
+        elif self.tree_data is None or (
+            root_id is not None and self.tree_data.root_id != root_id
+        ):
+            with instrumentation.phase("graph.load"):
+                self.tree_data = load_message_tree(session, root_id)
+
+        if self._layouts_tree is not self.tree_data:
+            previous = self._layouts_tree
+            if previous is None or previous.root_id != self.tree_data.root_id:
+                self.collapsed.clear()
+                for sizes in self._box_sizes.values():
+                    sizes.clear()
+            self._layouts_tree = self.tree_data
+            self._layouts.clear()
+
+        compact = self.compact_mode
+        with instrumentation.phase("graph.layout"):
+            if compact not in self._layouts:
+                self._layouts[compact] = GraphLayout(
+                    self.tree_data,
+                    self._measure,
+                    self.collapsed,
+                    self._box_sizes[compact],
+                )
+            layout = self._layouts[compact]
+
+            changed = layout is not self.graph_layout
+            if (
+                selected_message is not None
+                and selected_message.id not in layout.index
+            ):
+                layout.reveal(selected_message.id)
+                self._drop_other_layouts()
+                changed = True
+        self.refresh()
+        if changed:
+            self._use_layout(layout)
+            # The new virtual size only bounds scrolling after the refresh
+            self.call_after_refresh(self._scroll_to_selected)
+        else:
+            self._scroll_to_selected()
+
+    def apply_changes(self, changes, session):
+        """Patch the cached tree with a sync.ChangeSet and redraw
+
+        Only the subtrees the changes touched are laid out again.
+        """
+        if self.tree_data is None or not changes:
+            return
+        self.tree_data.apply_changes(changes)
+        if self.current_message and self.current_message.id in changes.deleted_ids:
+            self.current_message = None
+        if self.graph_layout is not None:
+            if not self.graph_layout.apply_changes(changes):
+                self.graph_layout.build()
+            self._drop_other_layouts()
+            self._use_layout(self.graph_layout)
+        self.show_graph(session, self.current_message)
+
+    def _drop_other_layouts(self):
+        """Forget layouts of other zoom levels after the current one changed"""
+        layout = self.graph_layout
+        self._layouts = {self.compact_mode: layout} if layout is not None else {}
+
+    def _measure(self, message, hidden):
+        content_lines, width = self._box_content(message, hidden)
+        return len(content_lines), width
+
+    def _use_layout(self, layout):
+        self.graph_layout = layout
+        self._prefix_cache = {}
+        self.virtual_size = Size(layout.width, layout.height)
+
+    def _scroll_to_selected(self):
+        if self.current_message is None or self.graph_layout is None:
+            return
+        layout = self.graph_layout
+        index = layout.index.get(self.current_message.id)
+        if index is None:
+            return
+        self.scroll_to_region(
+            Region(0, layout.starts[index], 1, layout.heights[index]),
+            animate=False,
+            immediate=True,
         )
-        output.append("║\n", style="bold blue")
-        output.append("╚", style="bold blue")
-        output.append("═" * 50, style="bold blue")
-        output.append("╝\n\n", style="bold blue")
-
-        for idx, root in enumerate(root_messages):
-            if idx > 0:
-                output.append("\n" + "─" * 60 + "\n\n", style="dim")
-            self._add_node_graph(
-                root, session, output, level=0, is_last=True, prefix=""
-            )
 
-        return output
-
-    def _add_node_graph(
-        self, message, session, output, level=0, is_last=True, prefix=""
-    ):
-        """Recursively add nodes in flowchart style"""
-        children = session.query(Message).filter_by(parent_id=message.id).all()
+    def action_toggle_collapse(self):
+        """Fold or unfold the subtree below the selected message"""
+        if self.current_message is None or self.graph_layout is None:
+            return
+        if self.graph_layout.toggle(self.current_message.id):
+            self._drop_other_layouts()
+            self._use_layout(self.graph_layout)
+            self.refresh()
+            self.call_after_refresh(self._scroll_to_selected)
+
+    def action_expand_all(self):
+        if self.graph_layout is None or not self.collapsed:
+            return
+        self.graph_layout.expand_all()
+        self._drop_other_layouts()
+        self._use_layout(self.graph_layout)
+        self.refresh()
+        self.call_after_refresh(self._scroll_to_selected)
+
+    def render_lines(self, crop):
+        # Resolve the base style once per paint rather than once per line
+        self._line_style = self.rich_style
+        return super().render_lines(crop)
+
+    def render_line(self, y):
+        """Render a single visible line of the graph"""
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.size.width
+        lead, body = self._render_graph_line(scroll_y + y)
+
+        # Deep boxes sit behind thousands of guide characters, all one cell
+        # wide, so only the on-screen slice of the lead is turned into Text
+        if scroll_x < len(lead):
+            text = Text(lead[scroll_x : scroll_x + width])
+            text.append_text(body)
+            offset = 0
+        else:
+            text = body
+            offset = scroll_x - len(lead)
+
+        strip = Strip(text.render(self.app.console), text.cell_len)
+        return strip.crop_extend(offset, offset + width, self._line_style)
+
+    def _render_graph_line(self, line):
+        """Return (guide lead, body Text) for a line of the graph"""
+        if line < 0 or line >= self.virtual_size.height:
+            return "", Text()
+
+        layout = self.graph_layout
+        index = bisect_right(layout.starts, line) - 1
+        block = layout.blocks[index]
+        offset = line - layout.starts[index]
+
+        if block[0] == "header":
+            return "", self._header_line(offset)
+        if block[0] == "separator":
+            return "", Text().append("─" * 60 if offset == 1 else "", style="dim")
+        return self._node_line(index, block, offset)
+
+    def _header_line(self, offset):
+        style = "bold blue"
+        if offset == 0:
+            return Text().append("╔" + "═" * 50 + "╗", style=style)
+        if offset == 1:
+            return Text().append(
+                "║" + " " * 10 + "CONVERSATION FLOW DIAGRAM" + " " * 15 + "║",
+                style=style,
+            )
+        if offset == 2:
+            return Text().append("╚" + "═" * 50 + "╝", style=style)
+        return Text()
+
+    def _prefix(self, index):
+        """Rebuild the guide prefix from the ancestor chain
+
+        Walks up only until an ancestor whose prefix was built recently;
+        neighbouring boxes on screen share most of their ancestry.
+        """
+        blocks = self.graph_layout.blocks
+        positions = self.graph_layout.index
+        cache = self._prefix_cache
+        chain = []
+        current = index
+        while current is not None and current not in cache:
+            chain.append(current)
+            parent_id = blocks[current][2]
+            current = positions[parent_id] if parent_id is not None else None
+
+        prefix = cache[current] if current is not None else ""
+        for block_index in reversed(chain):
+            parent_id = blocks[block_index][2]
+            if parent_id is not None:
+                parent = blocks[positions[parent_id]]
+                if parent[4] > 0:
+                    prefix += "    " if parent[3] else "│   "
+            cache[block_index] = prefix
+
+        if len(cache) > PREFIX_CACHE_SIZE:
+            cache.clear()
+            cache[index] = prefix
+        return prefix
+
+    def _node_line(self, index, block, offset):
+        _, message, _, is_last, level, _, hidden = block
+        mark = self._mark(message.id)
+
+        compact = self.compact_mode
+        key = (message.id, message_version(message), compact, mark, hidden)
+        lines = self.render_cache.get(
+            key, lambda: self._create_message_box(message, mark, compact, hidden)
+        )
 
+        prefix = self._prefix(index)
         if level == 0:
-            connector = ""
-            branch = ""
+            lead = prefix
+        elif offset == 0:
+            lead = prefix + ("└── " if is_last else "├── ")
         else:
-            connector = "└── " if is_last else "├── "
-            branch = "    " if is_last else "│   "
+            lead = prefix + ("    " if is_last else "│   ")
+        return lead, lines[offset] if offset < len(lines) else Text()
+
+    def _mark(self, message_id):
+        """"selected", "path" for ancestors of the selection, or None"""
+        selected = self.current_message
+        if selected is None:
+            return None
+        if message_id == selected.id:
+            return "selected"
+        index = self.tree_data.index
+        # Rows from a sync can be drawn before the index catches up
+        if message_id not in index or selected.id not in index:
+            return None
+        if index.is_ancestor(message_id, selected.id):
+            return "path"
+        return None
+
+    def _box_content(self, message, hidden=0):
+        """Wrapped preview lines and box width for a message"""
+        compact = self.compact_mode
+        max_width = 50 if not compact else 30
+        content_lines = self._wrap_text(message.preview or "", max_width - 4)
 
-        is_selected = self.current_message and message.id == self.current_message.id
+        if compact and len(content_lines) > 2:
+            content_lines = content_lines[:2]
+            if len(content_lines[-1]) > max_width - 7:
+                content_lines[-1] = content_lines[-1][: max_width - 7] + "..."
 
-        # Create message box
-        self._create_message_box(
-            message, is_selected, self.compact_mode, output, prefix, connector, branch
-        )
+        width = max(len(line) for line in content_lines) + 4
+        width = max(width, 25, len(self._box_title(message, hidden)) + 4)
+        return content_lines, width
 
-        # Add children recursively
-        for idx, child in enumerate(children):
-            is_last_child = idx == len(children) - 1
-            new_prefix = prefix + branch
-            self._add_node_graph(
-                child, session, output, level + 1, is_last_child, new_prefix
-            )
+    def _box_title(self, message, hidden):
+        icon = "👤" if message.speaker == "user" else "🤖"
+        title = f"{icon} {message.speaker.upper()}"
+        if hidden:
+            title += f"  ▸ {hidden:,} folded"
+        return title
 
-    def _create_message_box(
-        self, message, is_selected, compact, output, prefix, connector, branch
-    ):
-        """Create a box representation directly into the Text object"""
+    def _create_message_box(self, message, mark, compact, hidden=0):
+        """Create the lines of a box as Text objects, without tree guides"""
 
         # Determine style
-        if message.speaker == "user":
-            icon = "👤"
-            color = "cyan"
-        else:
-            icon = "🤖"
-            color = "green"
+        color = "cyan" if message.speaker == "user" else "green"
 
-        if is_selected:
+        # The selected box stands out; its ancestors are bold
+        if mark == "selected":
+            color = "bold yellow"
+        elif mark == "path":
             color = f"bold {color}"
 
         timestamp = message.timestamp.strftime("%H:%M")
-
-        # Content wrapping
-        max_width = 50 if not compact else 30
-        content_lines = self._wrap_text(message.content, max_width - 4)
-
-        if compact and len(content_lines) > 2:
-            content_lines = content_lines[:2]
-            if len(content_lines[-1]) > max_width - 7:
-                content_lines[-1] = content_lines[-1][: max_width - 7] + "..."
-
-        width = max(len(line) for line in content_lines) + 4
-        width = max(width, 25)
+        content_lines, width = self._box_content(message, hidden)
+        title = self._box_title(message, hidden)
+        lines = []
 
         # Top border
-        output.append(prefix + connector)
-        output.append("┌" + "─" * (width - 2) + "┐\n", style=color)
+        line = Text()
+        line.append("┌" + "─" * (width - 2) + "┐", style=color)
+        lines.append(line)
 
         # Header line
-        output.append(prefix + branch)
-        output.append("│ ", style=color)
-        output.append(f"{icon} {message.speaker.upper()}", style=color)
-        padding = width - len(f"{icon} {message.speaker.upper()}") - 4
-        output.append(" " * padding)
-        output.append(" │\n", style=color)
+        line = Text()
+        line.append("│ ", style=color)
+        line.append(title, style=color)
+        padding = width - len(title) - 4
+        line.append(" " * padding)
+        line.append(" │", style=color)
+        lines.append(line)
 
         # Timestamp line
-        output.append(prefix + branch)
-        output.append("│ ", style=color)
+        line = Text()
+        line.append("│ ", style=color)
         timestamp_text = f"{timestamp} (ID:{message.id})"
-        output.append(timestamp_text, style="dim")
+        line.append(timestamp_text, style="dim")
         padding = width - len(timestamp_text) - 4
-        output.append(" " * padding)
-        output.append(" │\n", style=color)
+        line.append(" " * padding)
+        line.append(" │", style=color)
+        lines.append(line)
 
         # Separator
-        output.append(prefix + branch)
-        output.append("├" + "─" * (width - 2) + "┤\n", style=color)
+        line = Text()
+        line.append("├" + "─" * (width - 2) + "┤", style=color)
+        lines.append(line)
 
         # Content lines
-        for line in content_lines:
-            output.append(prefix + branch)
-            output.append("│ ", style=color)
-            output.append(line)
-            padding = width - len(line) - 4
-            output.append(" " * padding)
-            output.append(" │\n", style=color)
+        for content_line in content_lines:
+            line = Text()
+            line.append("│ ", style=color)
+            line.append(content_line)
+            padding = width - len(content_line) - 4
+            line.append(" " * padding)
+            line.append(" │", style=color)
+            lines.append(line)
 
         # Bottom border
-        output.append(prefix + branch)
-        output.append("└" + "─" * (width - 2) + "┘\n", style=color)
+        line = Text()
+        line.append("└" + "─" * (width - 2) + "┘", style=color)
+        lines.append(line)
+
+        return lines
 
     def _wrap_text(self, text, width):
         """Wrap text to fit within width"""
@@ -1,18 +1,31 @@
 """Tree widget for displaying chat message hierarchy"""
 
-from pathlib import Path
+from rich.text import Text
 from textual.widgets import Tree
 from textual.binding import Binding
+from textual.message import Message
 
-from src.database.models import Message
+from src.database.tree_loader import (
+    load_message_tree,
+    load_children,
+    load_messages,
+    load_path,
+    load_roots,
+    count_children,
+)
 from src.utils.formatters import format_message_label
+from src.utils.instrumentation import instrumentation
+
+# Tree lays out expanded nodes recursively, so very deep chains stay collapsed
+MAX_REVEAL_DEPTH = 500
 
 
 class MessageTree(Tree):
-    """Custom Tree widget for displaying chat messages with Vim bindings"""
+    """Custom Tree widget for displaying chat messages with Vim bindings
 
-    # Load CSS from same directory - just change extension!
-    CSS_PATH = Path(__file__).with_suffix(".tcss")
+    Node data is the message id; labels are rendered from summary rows
+    when nodes are added, so no message objects are kept.
+    """
 
     BINDINGS = [
         Binding("j", "cursor_down", "Down", show=False),
@@ -23,45 +36,265 @@ class MessageTree(Tree):
         Binding("G", "scroll_end", "Bottom", show=False),
         Binding("enter", "select_cursor", "Select", show=False),
         Binding("space", "toggle_node", "Toggle", show=False),
+        Binding("m", "mark_node", "Mark", show=False),
     ]
 
-    def __init__(self, *args, **kwargs):
+    class BranchesMarked(Message):
+        """Two messages are marked for a branch comparison"""
+
+        def __init__(self, left_id, right_id):
+            super().__init__()
+            self.left_id = left_id
+            self.right_id = right_id
+
+    def __init__(self, *args, lazy=False, **kwargs):
         super().__init__("Chat History", *args, **kwargs)
         self.show_root = True
         self.guide_depth = 4
+        # In lazy mode children are fetched from the database on first expand
+        self.lazy = lazy
+        # Conversation shown, or None for every root in the database
+        self.root_id = None
+        self.session = None
+        self._loaded_ids = set()
+        self._message_nodes = {}
+        # Ids marked with `m`, oldest first, and their labels without the mark
+        self.marked = []
+        self._unmarked_labels = {}
 
     def action_collapse_node(self) -> None:
         if self.cursor_node:
             if self.cursor_node.is_expanded:
                 self.cursor_node.collapse()
             elif self.cursor_node.parent:
-                self.cursor_node = self.cursor_node.parent
+                self.move_cursor(self.cursor_node.parent)
 
     def action_expand_node(self) -> None:
         if self.cursor_node:
+            self._ensure_children(self.cursor_node)
             if not self.cursor_node.is_expanded and self.cursor_node.allow_expand:
                 self.cursor_node.expand()
             elif self.cursor_node.children:
-                self.cursor_node = self.cursor_node.children[0]
+                self.move_cursor(self.cursor_node.children[0])
 
     def action_toggle_node(self) -> None:
         if self.cursor_node:
+            self._ensure_children(self.cursor_node)
             self.cursor_node.toggle()
 
-    def build_tree_from_db(self, session):
+    def action_mark_node(self) -> None:
+        node = self.cursor_node
+        if node is not None and node.data is not None:
+            self.mark(node.data)
+
+    def mark(self, message_id):
+        """Toggle the mark on a message; a third mark drops the oldest
+
+        The message needn't have a node (too deep or not loaded yet).
+        """
+        if message_id in self.marked:
+            self.marked.remove(message_id)
+            self._show_mark(message_id, False)
+            return
+
+        self.marked.append(message_id)
+        self._show_mark(message_id)
+        if len(self.marked) > 2:
+            self._show_mark(self.marked.pop(0), False)
+        if len(self.marked) == 2:
+            self.post_message(self.BranchesMarked(*self.marked))
+
+    def _show_mark(self, message_id, marked=True):
+        node = self._message_nodes.get(message_id)
+        if node is None:
+            return
+        if marked:
+            self._unmarked_labels[message_id] = node.label
+            node.set_label(Text("◆ ", style="bold magenta") + node.label)
+        else:
+            label = self._unmarked_labels.pop(message_id, None)
+            if label is not None:
+                node.set_label(label)
+
+    def on_tree_node_expanded(self, event) -> None:
+        # Covers expansion by mouse click, which bypasses the key actions
+        self._ensure_children(event.node)
+
+    def reveal_message(self, message_id, index=None):
+        """Expand only the ancestors of a message and move the cursor to it
+
+        A TreeIndex containing the message spares the ancestor query.
+        """
+        node = self._message_nodes.get(message_id)
+        if node is None and self.lazy and self.session is not None:
+            # Load the children of every ancestor, nothing beside the chain
+            if index is not None and message_id in index:
+                path_ids = index.path_ids(message_id)
+            else:
+                path_ids = [row.id for row in load_path(self.session, message_id)]
+            if len(path_ids) > MAX_REVEAL_DEPTH:
+                return False
+            self._load_children_of(path_ids[:-1])
+            node = self._message_nodes.get(message_id)
+        if node is None:
+            return False
+
+        ancestors = []
+        parent = node.parent
+        while parent is not None:
+            ancestors.append(parent)
+            parent = parent.parent
+        if len(ancestors) > MAX_REVEAL_DEPTH:
+            return False
+        for ancestor in ancestors:
+            ancestor.expand()
+        # Line numbers are only known once the expanded tree is laid out
+        self.call_after_refresh(self.move_cursor, node)
+        return True
+
+    def build_tree_from_db(self, session, tree_data=None, root_id=None):
+        """Show one conversation (by root id), or every root when root_id is None"""
         self.clear()
-        root_messages = session.query(Message).filter_by(parent_id=None).all()
+        self.session = session
+        self.root_id = root_id
+        self._loaded_ids = set()
+        self._message_nodes = {}
+        self.marked = []
+        self._unmarked_labels = {}
 
-        for root_msg in root_messages:
-            self._add_message_node(self.root, root_msg, session)
+        if self.lazy:
+            self._build_lazy_tree(session)
+            return
 
-        self.root.expand()
+        if tree_data is None:
+            with instrumentation.phase("tree.load"):
+                tree_data = load_message_tree(session, root_id)
+
+        # Iterative walk so very deep conversations don't hit the recursion limit
+        with instrumentation.phase("tree.nodes"):
+            for message, _ in tree_data.walk():
+                parent_node = self._message_nodes.get(message.parent_id, self.root)
+                self._add_message_node(parent_node, message)
+
+        self._expand_roots()
 
-    def _add_message_node(self, parent_node, message, session):
+    def apply_changes(self, changes):
+        """Patch nodes in place from a sync.ChangeSet
+
+        Returns False when the change can't be patched (a message was moved
+        or a deleted message had children) and a full rebuild is needed.
+        """
+        for message_id in changes.deleted_ids:
+            node = self._message_nodes.pop(message_id, None)
+            if node is None:
+                continue
+            if node.children:
+                return False
+            node.remove()
+            if message_id in self.marked:
+                self.marked.remove(message_id)
+                self._unmarked_labels.pop(message_id, None)
+
+        moved_in = []
+        for message in changes.updated:
+            node = self._message_nodes.get(message.id)
+            if node is None:
+                # Moved into the shown conversation, or not loaded (lazy mode)
+                moved_in.append(message)
+                continue
+            if node.parent.data != message.parent_id:
+                return False
+            node.set_label(format_message_label(message))
+            if message.id in self._unmarked_labels:
+                self._show_mark(message.id)
+
+        # A moved subtree comes as one updated row per message; ids put
+        # parents first, as for added rows
+        moved_in.sort(key=lambda message: message.id)
+        for message in [*moved_in, *changes.added]:
+            if self.root_id is not None and message.root_id != self.root_id:
+                continue
+            if message.parent_id is None:
+                parent_node = self.root
+            else:
+                parent_node = self._message_nodes.get(message.parent_id)
+            if parent_node is None:
+                # Parent not materialized yet (lazy mode); it loads on expand
+                continue
+            if self.lazy and parent_node.data is not None:
+                parent_node.allow_expand = True
+                if parent_node.data not in self._loaded_ids:
+                    continue
+            node = self._add_message_node(parent_node, message)
+            if self.lazy:
+                node.allow_expand = False
+                self._loaded_ids.add(message.id)
+
+        return True
+
+    def _add_message_node(self, parent_node, message):
         label = format_message_label(message)
-        node = parent_node.add(label, data=message)
+        node = parent_node.add(label, data=message.id)
+        self._message_nodes[message.id] = node
+        return node
+
+    def _build_lazy_tree(self, session):
+        """Materialize only the roots and their direct children"""
+        if self.root_id is None:
+            roots = load_roots(session)
+        else:
+            roots = load_messages(session, [self.root_id])
+        for root_msg in roots:
+            self._add_lazy_node(self.root, root_msg, child_count=0)
+
+        self._populate_children(list(self.root.children))
+        self._expand_roots()
 
-        children = session.query(Message).filter_by(parent_id=message.id).all()
+    def _expand_roots(self):
+        self.root.expand()
+        # A single conversation opens on its first turns
+        if self.root_id is not None:
+            for node in self.root.children:
+                node.expand()
+
+    def _ensure_children(self, node):
+        if self.lazy and node.data is not None:
+            self._populate_children([node])
+
+    def _populate_children(self, nodes):
+        """Fetch and attach the children of nodes that were not loaded yet"""
+        self._load_children_of([node.data for node in nodes if node.data is not None])
+
+    def _load_children_of(self, parent_ids):
+        """Attach the children of messages in one batch, parents before children
 
+        A parent's node may be created by an earlier id in the same batch, as
+        when a whole ancestor chain is loaded at once.
+        """
+        pending = [
+            parent_id
+            for parent_id in dict.fromkeys(parent_ids)
+            if parent_id not in self._loaded_ids
+        ]
+        if not pending or self.session is None:
+            return
+
+        children = load_children(self.session, pending)
+        counts = count_children(self.session, [child.id for child in children])
+        by_parent = {}
         for child in children:
-            self._add_message_node(node, child, session)
+            by_parent.setdefault(child.parent_id, []).append(child)
+
+        for parent_id in pending:
+            node = self._message_nodes.get(parent_id)
+            if node is None:
+                continue
+            for child in by_parent.get(parent_id, []):
+                self._add_lazy_node(node, child, counts.get(child.id, 0))
+            node.allow_expand = bool(node.children)
+            self._loaded_ids.add(parent_id)
+
+    def _add_lazy_node(self, parent_node, message, child_count):
+        node = self._add_message_node(parent_node, message)
+        node.allow_expand = child_count > 0
+        return node
@@ -0,0 +1,93 @@
+"""Search box with ranked full-text results"""
+
+from textual.binding import Binding
+from textual.containers import Vertical
+from textual.message import Message
+from textual.widgets import Input, OptionList
+from textual.widgets.option_list import Option
+
+from src.database.search import RANK_WINDOW, search_messages
+from src.utils.formatters import format_search_hit
+
+# Seconds of typing quiet time before a query runs
+SEARCH_DEBOUNCE = 0.15
+
+
+class SearchPanel(Vertical):
+    """Hidden until opened; posts Selected when a hit is chosen"""
+
+    BINDINGS = [
+        Binding("escape", "close", "Close Search", show=False),
+        Binding("down", "focus_results", "Results", show=False),
+    ]
+
+    class Selected(Message):
+        """A search hit was chosen"""
+
+        def __init__(self, message_id):
+            super().__init__()
+            self.message_id = message_id
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = None
+        self._search_timer = None
+
+    def compose(self):
+        yield Input(placeholder="Search messages…", id="search-input")
+        yield OptionList(id="search-results")
+
+    def open(self, session):
+        self.session = session
+        self.display = True
+        self.query_one(Input).focus()
+
+    def action_close(self):
+        self.display = False
+        self.app.query_one("#message-tree").focus()
+
+    def action_focus_results(self):
+        results = self.query_one(OptionList)
+        if results.option_count:
+            results.focus()
+            results.highlighted = results.highlighted or 0
+
+    def on_input_changed(self, event):
+        if self._search_timer is not None:
+            self._search_timer.stop()
+        query = event.value
+        self._search_timer = self.set_timer(
+            SEARCH_DEBOUNCE, lambda: self.run_search(query)
+        )
+
+    def on_input_submitted(self, event):
+        if self._search_timer is not None:
+            self._search_timer.stop()
+        self.run_search(event.value)
+        self.action_focus_results()
+
+    def run_search(self, query):
+        """Replace the result list with the hits for query"""
+        results = self.query_one(OptionList)
+        results.clear_options()
+        if self.session is None or not query.strip():
+            return
+        # Runs as the user types, so very common terms rank only recent matches
+        hits = search_messages(self.session, query, window=RANK_WINDOW)
+        results.add_options(
+            Option(format_search_hit(hit), id=str(hit.message_id)) for hit in hits
+        )
+        if not hits:
+            results.add_option(Option("No matches", disabled=True))
+        elif hits.windowed:
+            results.add_option(
+                Option(
+                    f"Best of the newest {RANK_WINDOW:,} matches; "
+                    "add words to search older ones",
+                    disabled=True,
+                )
+            )
+
+    def on_option_list_option_selected(self, event):
+        event.stop()
+        self.post_message(self.Selected(int(event.option.id)))
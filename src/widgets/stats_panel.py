@@ -0,0 +1,73 @@
+"""Timing breakdown of the most recent UI actions"""
+
+from rich.table import Table
+from textual.widgets import Static
+
+from src.utils.instrumentation import instrumentation
+
+# Actions listed, newest first
+SHOWN_ACTIONS = 12
+# Seconds between checks for newly finished actions while shown
+REFRESH_INTERVAL = 0.5
+
+
+def _ms(seconds):
+    return "–" if seconds is None else f"{seconds * 1000:.1f}"
+
+
+class StatsPanel(Static):
+    """Hidden until toggled; lists actions with their SQL and phase times"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shown_version = None
+        self._timer = None
+
+    def toggle(self):
+        self.display = not self.display
+        if self.display:
+            self.refresh_stats()
+            self._timer = self.set_interval(REFRESH_INTERVAL, self.refresh_stats)
+        elif self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    def refresh_stats(self):
+        """Redraw if any action finished or painted since the last draw"""
+        # Paint times arrive after the action itself finished
+        version = (
+            instrumentation.version,
+            sum(action.paint_seconds is not None for action in instrumentation.actions),
+        )
+        if self._shown_version == version:
+            return
+        self._shown_version = version
+        self.update(self._table())
+
+    def _table(self):
+        table = Table(
+            title="Recent actions (ms)", title_justify="left", expand=True, box=None
+        )
+        table.add_column("action", style="bold")
+        table.add_column("total", justify="right")
+        table.add_column("queries", justify="right")
+        table.add_column("sql", justify="right")
+        table.add_column("phases", style="dim", ratio=1)
+        table.add_column("paint", justify="right")
+
+        actions = list(instrumentation.actions)[-SHOWN_ACTIONS:]
+        for action in reversed(actions):
+            phases = "  ".join(
+                f"{name} {_ms(seconds)}" for name, seconds in action.phases.items()
+            )
+            table.add_row(
+                action.name,
+                _ms(action.seconds),
+                str(action.queries),
+                _ms(action.query_seconds),
+                phases,
+                _ms(action.paint_seconds),
+            )
+        if not actions:
+            table.add_row("(no actions yet)", "", "", "", "", "")
+        return table
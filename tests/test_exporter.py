@@ -0,0 +1,191 @@
+"""Exported JSONL must read back as the root -> leaf paths of the tree"""
+
+import io
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+from sqlalchemy import delete, func, select
+
+from src.database import exporter
+from src.database.bodies import insert_messages
+from src.database.db import init_db
+from src.database.exporter import iter_export, iter_paths, write_jsonl
+from src.database.models import Message, Summary
+
+# id -> (parent id, speaker, content)
+MESSAGES = {
+    # 1 -> 2 -> 3 branches into 4 -> 6 -> 7 and 5
+    1: (None, "user", "How do I sort a list?"),
+    2: (1, "assistant", "Use sorted()."),
+    3: (2, "user", "In place?"),
+    4: (3, "assistant", "Use list.sort()."),
+    5: (3, "gpt", "Call .sort() on it."),
+    6: (4, "user", "Descending?"),
+    7: (6, "assistant", "Pass reverse=True."),
+    # A system prompt, then two user turns in a row on one branch
+    10: (None, "system", "Be brief."),
+    11: (10, "user", "Hi."),
+    12: (11, "assistant", "Hello."),
+    13: (11, "user", "Anyone there?"),
+}
+# A 20-turn chain, long enough for --budget to summarize its start
+CHAIN = range(20, 40)
+for _id in CHAIN:
+    MESSAGES[_id] = (
+        _id - 1 if _id > CHAIN[0] else None,
+        "user" if _id % 2 == 0 else "assistant",
+        f"Turn {_id} says something. " + "More detail follows here. " * 8,
+    )
+
+
+def root_of(message_id):
+    while MESSAGES[message_id][0] is not None:
+        message_id = MESSAGES[message_id][0]
+    return message_id
+
+
+def path_to(message_id):
+    path = [message_id]
+    while MESSAGES[path[-1]][0] is not None:
+        path.append(MESSAGES[path[-1]][0])
+    return path[::-1]
+
+
+def openai_messages(ids):
+    roles = {"user": "user", "system": "system"}
+    return [
+        {"role": roles.get(MESSAGES[i][1], "assistant"), "content": MESSAGES[i][2]}
+        for i in ids
+    ]
+
+
+def export_lines(session, *args, **kwargs):
+    out = io.StringIO()
+    count = write_jsonl(iter_export(session, *args, **kwargs), out)
+    lines = out.getvalue().splitlines()
+    assert count == len(lines)
+    return [json.loads(line) for line in lines]
+
+
+class ExporterTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.session = init_db(f"sqlite:///{Path(self._dir.name) / 'test.db'}")
+        insert_messages(
+            self.session,
+            [
+                {
+                    "id": message_id,
+                    "parent_id": parent_id,
+                    "root_id": root_of(message_id),
+                    "timestamp": datetime(2024, 1, 1),
+                    "speaker": speaker,
+                    "content": content,
+                }
+                for message_id, (parent_id, speaker, content) in MESSAGES.items()
+            ],
+        )
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.session.get_bind().dispose()
+        self._dir.cleanup()
+
+    def test_openai_modes(self):
+        cases = [
+            ("path", 6, [6]),
+            ("subtree", 3, [7, 5]),
+            ("subtree", 5, [5]),
+            ("conversation", 6, [7, 5]),
+            ("conversation", 13, [12, 13]),
+            ("leaves", None, [7, 5, 12, 13, CHAIN[-1]]),
+        ]
+        for mode, message_id, leaves in cases:
+            with self.subTest(mode=mode, message_id=message_id):
+                payloads = export_lines(self.session, mode, message_id, fmt="openai")
+                expected = [
+                    {"messages": openai_messages(path_to(leaf))} for leaf in leaves
+                ]
+                self.assertEqual(payloads, expected)
+
+    def test_anthropic_modes(self):
+        # Without system turns or repeated roles it's the OpenAI payload
+        for mode, message_id in [("path", 7), ("subtree", 2), ("conversation", 1)]:
+            with self.subTest(mode=mode, message_id=message_id):
+                self.assertEqual(
+                    export_lines(self.session, mode, message_id, fmt="anthropic"),
+                    export_lines(self.session, mode, message_id, fmt="openai"),
+                )
+
+        payloads = export_lines(self.session, "subtree", 10, fmt="anthropic")
+        self.assertEqual(
+            payloads,
+            [
+                {
+                    "system": "Be brief.",
+                    "messages": [
+                        {"role": "user", "content": "Hi."},
+                        {"role": "assistant", "content": "Hello."},
+                    ],
+                },
+                {
+                    "system": "Be brief.",
+                    "messages": [{"role": "user", "content": "Hi.\n\nAnyone there?"}],
+                },
+            ],
+        )
+        leaves = export_lines(self.session, "leaves", fmt="anthropic")
+        self.assertEqual(len(leaves), 5)
+        self.assertEqual(leaves[2:4], payloads)
+
+    def test_budget(self):
+        leaf = CHAIN[-1]
+        full = export_lines(self.session, "path", leaf)[0]["messages"]
+        self.assertEqual(full, openai_messages(CHAIN))
+
+        payload = export_lines(self.session, "path", leaf, budget=300)[0]
+        turns = payload["messages"]
+        summaries = [turn for turn in turns if turn["role"] == "system"]
+        kept = turns[len(summaries) :]
+        self.assertEqual(turns[: len(summaries)], summaries)
+        self.assertTrue(summaries[0]["content"].startswith("[Summary of messages 1-"))
+        self.assertIn("Turn 20 says something.", summaries[0]["content"])
+        self.assertTrue(0 < len(kept) < len(CHAIN))
+        self.assertEqual(kept, full[len(CHAIN) - len(kept) :])
+
+        payload = export_lines(self.session, "path", leaf, fmt="anthropic", budget=300)
+        self.assertEqual(
+            payload[0],
+            {
+                "system": "\n\n".join(turn["content"] for turn in summaries),
+                "messages": kept,
+            },
+        )
+
+        # Later exports reuse the cached summaries
+        cached = self.session.scalar(select(func.count(Summary.id)))
+        self.assertGreater(cached, 0)
+        export_lines(self.session, "leaves", budget=300)
+        self.assertEqual(self.session.scalar(select(func.count(Summary.id))), cached)
+
+    def test_missing_message(self):
+        with self.assertRaises(LookupError):
+            iter_export(self.session, "subtree", 99)
+
+    def test_message_deleted_during_export(self):
+        # One id per row lookup, so 5 is fetched after it's deleted
+        with mock.patch.object(exporter, "IN_CLAUSE_CHUNK", 1):
+            paths = iter_paths(self.session, "conversation", 1)
+            self.assertEqual([m.id for m in next(paths)], path_to(7))
+            self.session.execute(delete(Message).where(Message.id == 5))
+            with self.assertRaisesRegex(LookupError, "No message 5"):
+                next(paths)
+
+
+if __name__ == "__main__":
+    unittest.main()
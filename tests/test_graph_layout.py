@@ -0,0 +1,148 @@
+"""Incremental GraphLayout and MessageTree patches must match a fresh build"""
+
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import text
+
+from src.database.bodies import insert_messages
+from src.database.db import init_db
+from src.database.models import Message
+from src.database.sync import ChangeTracker
+from src.database.tree_loader import load_message_tree
+from src.utils.graph_layout import GraphLayout
+from src.widgets.message_tree import MessageTree
+
+
+def measure(message, hidden):
+    return 1, 40
+
+
+def snapshot(layout):
+    """Comparable form of a layout: block kinds, ids, parents and levels"""
+    return [
+        (block[0],) if block[0] != "node" else (block[1].id, *block[2:5], block[6])
+        for block in layout.blocks
+    ]
+
+
+def tree_shape(session):
+    """{message id: parent id} of a freshly built MessageTree of conversation 1"""
+    tree = MessageTree()
+    tree.build_tree_from_db(session, root_id=1)
+    return tree_nodes(tree)
+
+
+def tree_nodes(tree):
+    return {
+        message_id: node.parent.data
+        for message_id, node in tree._message_nodes.items()
+    }
+
+
+class GraphLayoutChangesTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.session = init_db(f"sqlite:///{Path(self._dir.name) / 'test.db'}")
+        # 1 - 2 - 3 - 4 - 5 - 6 - 7 - 8 - 9, with 10 forking off 3
+        parents = {1: None, 10: 3, **{i: i - 1 for i in range(2, 10)}}
+        insert_messages(
+            self.session,
+            [
+                {
+                    "id": message_id,
+                    "parent_id": parent_id,
+                    "root_id": 1,
+                    "timestamp": datetime(2024, 1, 1),
+                    "speaker": "user" if message_id % 2 else "assistant",
+                    "content": f"message {message_id}",
+                }
+                for message_id, parent_id in parents.items()
+            ],
+        )
+        self.session.commit()
+        self.tracker = ChangeTracker(self.session)
+        self.tree_data = load_message_tree(self.session, 1)
+        self.layout = GraphLayout(self.tree_data, measure, set())
+        self.tree = MessageTree()
+        self.tree.build_tree_from_db(self.session, root_id=1)
+
+    def tearDown(self):
+        self.tracker.close()
+        self.session.close()
+        self.session.get_bind().dispose()
+        self._dir.cleanup()
+
+    def sync(self):
+        changes = self.tracker.fetch_changes()
+        self.tree_data.apply_changes(changes)
+        if not self.layout.apply_changes(changes):
+            self.layout.build()
+        if not self.tree.apply_changes(changes):
+            self.tree.build_tree_from_db(self.session, root_id=1)
+
+    def assert_matches_fresh_layout(self):
+        fresh = GraphLayout(load_message_tree(self.session, 1), measure, set())
+        self.assertEqual(snapshot(self.layout), snapshot(fresh))
+        self.assertEqual(self.layout.starts, fresh.starts)
+        self.assertEqual(tree_nodes(self.tree), tree_shape(self.session))
+
+    def test_move_out_of_conversation(self):
+        # The ORM moves the subtree to a conversation of its own
+        self.session.get(Message, 5).parent_id = None
+        self.session.commit()
+        self.sync()
+        self.assertEqual(sorted(self.layout.index), [1, 2, 3, 4, 10])
+        self.assert_matches_fresh_layout()
+
+    def test_move_into_conversation(self):
+        insert_messages(
+            self.session,
+            [
+                {
+                    "id": message_id,
+                    "parent_id": parent_id,
+                    "root_id": 20,
+                    "timestamp": datetime(2024, 1, 2),
+                    "speaker": "user",
+                    "content": f"message {message_id}",
+                }
+                for message_id, parent_id in ((20, None), (21, 20))
+            ],
+        )
+        self.session.commit()
+        self.sync()
+        # The ORM moves the other conversation, 20 - 21, under 9
+        self.session.get(Message, 20).parent_id = 9
+        self.session.commit()
+        self.sync()
+        self.assertEqual(tree_nodes(self.tree)[21], 20)
+        self.assertEqual(tree_nodes(self.tree)[20], 9)
+        self.assertIn(21, self.layout.index)
+        self.assert_matches_fresh_layout()
+
+    def test_move_out_keeping_root_id(self):
+        # An external writer that leaves root_id alone: 5 becomes a root
+        self.session.execute(text("UPDATE messages SET parent_id = NULL WHERE id = 5"))
+        self.session.commit()
+        self.sync()
+        self.assert_matches_fresh_layout()
+
+    def test_delete_with_children(self):
+        self.session.execute(text("DELETE FROM messages WHERE id = 5"))
+        self.session.commit()
+        self.sync()
+        self.assertNotIn(5, self.layout.index)
+        self.assert_matches_fresh_layout()
+
+    def test_delete_leaf(self):
+        self.session.execute(text("DELETE FROM messages WHERE id = 10"))
+        self.session.commit()
+        self.sync()
+        self.assert_matches_fresh_layout()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+"""Imports resume where an interrupted run committed and read zip exports"""
+
+import json
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from sqlalchemy import func, select
+
+from src.database import importer
+from src.database.db import init_db
+from src.database.importer import ExportFormatError, import_export
+from src.database.models import ImportCheckpoint, Message
+
+CONVERSATIONS = 7
+
+
+def message_list(index):
+    return {
+        "messages": [
+            {"role": "user", "content": f"question {index}"},
+            {"role": "assistant", "content": f"answer {index}"},
+        ]
+    }
+
+
+def chatgpt_conversation(index):
+    """Root -> question with two regenerated answers, plus a hidden system node"""
+    node = {"author": {"role": "user"}, "content": {"parts": [f"question {index}"]}}
+    return {
+        "create_time": 1700000000 + index,
+        "mapping": {
+            "root": {"parent": None, "children": ["system"]},
+            "system": {
+                "parent": "root",
+                "children": ["q"],
+                "message": {"author": {"role": "system"}, "content": {"parts": [""]}},
+            },
+            "q": {"parent": "system", "children": ["a1", "a2"], "message": node},
+            "a1": {
+                "parent": "q",
+                "children": [],
+                "message": {
+                    "author": {"role": "assistant"},
+                    "content": {"parts": [f"first answer {index}"]},
+                },
+            },
+            "a2": {
+                "parent": "q",
+                "children": [],
+                "message": {
+                    "author": {"role": "assistant"},
+                    "content": {"parts": [f"second answer {index}"]},
+                },
+            },
+        },
+    }
+
+
+class ImporterTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self._dir.name)
+        self.session = init_db(f"sqlite:///{self.dir / 'test.db'}")
+
+    def tearDown(self):
+        self.session.close()
+        self.session.get_bind().dispose()
+        self._dir.cleanup()
+
+    def messages(self):
+        rows = self.session.execute(
+            select(Message.id, Message.parent_id, Message.root_id, Message.content)
+            .order_by(Message.id)
+        )
+        return rows.all()
+
+    def test_resume_after_interruption(self):
+        path = self.dir / "export.jsonl"
+        path.write_text(
+            "".join(json.dumps(message_list(i)) + "\n" for i in range(CONVERSATIONS))
+        )
+        parse_record = importer.parse_record
+        parsed = []
+
+        def interrupt_at_fifth(record):
+            parsed.append(record)
+            if len(parsed) == 5:
+                raise KeyboardInterrupt
+            return parse_record(record)
+
+        # Commits land after every second conversation (four messages)
+        with (
+            mock.patch.object(importer, "parse_record", interrupt_at_fifth),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            import_export(self.session, str(path), commit_every=4, out=None)
+        self.session.rollback()
+        self.assertEqual(len(self.messages()), 8)
+
+        stats = import_export(self.session, str(path), commit_every=4, out=None)
+        self.assertEqual(stats.skipped_records, 4)
+        self.assertEqual(stats.records, CONVERSATIONS - 4)
+
+        rows = self.messages()
+        self.assertEqual(
+            [row.content for row in rows],
+            [
+                text
+                for i in range(CONVERSATIONS)
+                for text in (f"question {i}", f"answer {i}")
+            ],
+        )
+        for question, answer in zip(rows[::2], rows[1::2]):
+            self.assertIsNone(question.parent_id)
+            self.assertEqual(question.root_id, question.id)
+            self.assertEqual(answer.parent_id, question.id)
+            self.assertEqual(answer.root_id, question.id)
+
+        checkpoint = self.session.get(ImportCheckpoint, str(path.resolve()))
+        self.assertTrue(checkpoint.completed)
+        self.assertEqual(checkpoint.records_done, CONVERSATIONS)
+        self.assertEqual(checkpoint.messages_done, 2 * CONVERSATIONS)
+
+        # A completed import isn't repeated
+        stats = import_export(self.session, str(path), out=None)
+        self.assertEqual(stats.messages, 0)
+        self.assertEqual(self.session.scalar(select(func.count(Message.id))), 14)
+
+    def test_zip_export(self):
+        path = self.dir / "export.zip"
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(
+                "export/conversations.json",
+                json.dumps([chatgpt_conversation(i) for i in range(3)]),
+            )
+            archive.writestr("export/user.json", "{}")
+
+        with self.assertRaises(ExportFormatError):
+            import_export(self.session, str(path), fmt="jsonl", out=None)
+        self.session.rollback()
+        self.assertEqual(self.messages(), [])
+
+        stats = import_export(self.session, str(path), fmt="chatgpt", out=None)
+        self.assertEqual((stats.records, stats.messages), (3, 9))
+        rows = self.messages()
+        for i, start in enumerate(range(0, 9, 3)):
+            question, first, second = rows[start : start + 3]
+            self.assertEqual(question.content, f"question {i}")
+            self.assertIsNone(question.parent_id)
+            self.assertEqual(
+                [(row.content, row.parent_id, row.root_id) for row in (first, second)],
+                [
+                    (f"first answer {i}", question.id, question.id),
+                    (f"second answer {i}", question.id, question.id),
+                ],
+            )
+
+    def test_zip_without_conversations(self):
+        path = self.dir / "export.zip"
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("user.json", "{}")
+        with self.assertRaises(ExportFormatError):
+            import_export(self.session, str(path), out=None)
+
+
+if __name__ == "__main__":
+    unittest.main()
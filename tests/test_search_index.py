@@ -0,0 +1,102 @@
+"""The FTS index must follow writes from any sqlite3 client, compressed or not"""
+
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import text
+
+from src.database.bodies import insert_messages
+from src.database.body_codecs import compression_settings, set_compression
+from src.database.db import init_db
+from src.database.models import compute_body_hash
+from src.database.search import MATCH_END, MATCH_START, search_messages
+
+# Long enough to be stored compressed at the threshold set below
+LONG_TEXT = "zebra " + "lorem ipsum dolor sit amet " * 20
+
+
+def fts_ids(session, match):
+    rows = session.execute(
+        text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH :match"),
+        {"match": match},
+    )
+    return sorted(row[0] for row in rows)
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._compression = compression_settings()
+        set_compression("zlib", 64)
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = Path(self._dir.name) / "test.db"
+        self.session = init_db(f"sqlite:///{self.path}")
+        insert_messages(
+            self.session,
+            [
+                {
+                    "id": 1,
+                    "parent_id": None,
+                    "root_id": 1,
+                    "timestamp": datetime(2024, 1, 1),
+                    "speaker": "user",
+                    "content": "an apple a day",
+                },
+                {
+                    "id": 2,
+                    "parent_id": 1,
+                    "root_id": 1,
+                    "timestamp": datetime(2024, 1, 1),
+                    "speaker": "assistant",
+                    "content": LONG_TEXT,
+                },
+            ],
+        )
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.session.get_bind().dispose()
+        self._dir.cleanup()
+        set_compression(*self._compression)
+
+    def test_compressed_body_is_indexed(self):
+        codec = self.session.execute(text("SELECT count(codec) FROM message_bodies"))
+        self.assertEqual(codec.scalar(), 1)
+        hits = search_messages(self.session, "zebra")
+        self.assertEqual([hit.message_id for hit in hits], [2])
+        self.assertIn(f"{MATCH_START}zebra{MATCH_END}", hits[0].snippet)
+
+    def test_bare_sqlite3_writes(self):
+        long_hash = compute_body_hash(LONG_TEXT)
+        kiwi_hash = compute_body_hash("kiwi")
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute(
+                "INSERT INTO message_bodies (hash, content, size) VALUES (?, ?, 4)",
+                (kiwi_hash, "kiwi"),
+            )
+            connection.executemany(
+                "INSERT INTO messages (id, parent_id, speaker, body_hash) "
+                "VALUES (?, 1, 'user', ?)",
+                [(3, long_hash), (4, kiwi_hash)],
+            )
+            connection.execute(
+                "UPDATE messages SET body_hash = ? WHERE id = 1", (long_hash,)
+            )
+            connection.execute("DELETE FROM messages WHERE id = 2")
+        connection.close()
+
+        hits = search_messages(self.session, "zebra")
+        self.assertEqual(sorted(hit.message_id for hit in hits), [1, 3])
+        self.assertEqual(fts_ids(self.session, "zebra"), [1, 3])
+        self.assertEqual(fts_ids(self.session, "apple"), [])
+        self.assertEqual(
+            [hit.message_id for hit in search_messages(self.session, "kiwi")], [4]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""TreeIndex queries must agree with walking parent ids one step at a time"""
+
+import random
+import unittest
+
+from src.database.tree_index import TreeIndex
+
+
+def random_forest(rng, count, roots):
+    """(id, parent_id) pairs with shuffled ids, so parents aren't always lower"""
+    ids = rng.sample(range(1, count * 10), count)
+    pairs = [(message_id, None) for message_id in ids[:roots]]
+    for pos in range(roots, count):
+        pairs.append((ids[pos], ids[rng.randrange(pos)]))
+    rng.shuffle(pairs)
+    return pairs
+
+
+def chain_forest(length, roots):
+    """Parallel chains, each `length` messages deep"""
+    pairs = []
+    for root in range(roots):
+        base = root * length
+        pairs.append((base + 1, None))
+        pairs.extend((base + n, base + n - 1) for n in range(2, length + 1))
+    return pairs
+
+
+def ancestors(parents, message_id):
+    """message_id, then each parent up to its root (missing parents end it)"""
+    chain = [message_id]
+    while parents.get(chain[-1]) in parents:
+        chain.append(parents[chain[-1]])
+    return chain
+
+
+def brute_lca(parents, a, b):
+    above_b = set(ancestors(parents, b))
+    return next((node for node in ancestors(parents, a) if node in above_b), None)
+
+
+class TreeIndexTest(unittest.TestCase):
+    def check(self, pairs, rng, samples=300):
+        parents = dict(pairs)
+        index = TreeIndex(pairs)
+        ids = sorted(parents)
+        chains = {message_id: ancestors(parents, message_id) for message_id in ids}
+        sizes = dict.fromkeys(ids, 0)
+        for chain in chains.values():
+            for node in chain:
+                sizes[node] += 1
+
+        self.assertEqual(len(index), len(ids))
+        for message_id in ids:
+            chain = chains[message_id]
+            self.assertEqual(index.depth_of(message_id), len(chain) - 1)
+            self.assertEqual(index.subtree_size(message_id), sizes[message_id])
+
+        for _ in range(samples):
+            a, b = rng.choice(ids), rng.choice(ids)
+            chain = chains[a]
+            self.assertEqual(index.path_ids(a), chain[::-1])
+            for depth, node in enumerate(reversed(chain)):
+                self.assertEqual(index.ancestor_at_depth(a, depth), node)
+            with self.assertRaises(ValueError):
+                index.ancestor_at_depth(a, len(chain))
+            self.assertEqual(index.lca(a, b), brute_lca(parents, a, b), (a, b))
+            self.assertEqual(index.is_ancestor(a, b), a in chains[b], (a, b))
+        return index
+
+    def test_random_forests(self):
+        rng = random.Random(20)
+        for count, roots in [(1, 1), (2, 2), (50, 1), (300, 5), (1000, 40)]:
+            with self.subTest(count=count, roots=roots):
+                self.check(random_forest(rng, count, roots), rng)
+
+    def test_deep_chains(self):
+        rng = random.Random(21)
+        index = self.check(chain_forest(1000, 3), rng, samples=500)
+        self.assertEqual(index.roots(), [1, 1001, 2001])
+        self.assertEqual(index.lca(700, 1000), 700)
+        self.assertIsNone(index.lca(1000, 1001))
+        self.assertEqual(index.ancestor_at_depth(3000, 567), 2568)
+
+    def test_chains_branching_off_chains(self):
+        # Long single-child runs with occasional forks stress the jump pointers
+        rng = random.Random(22)
+        pairs = [(1, None), (5000, None)]
+        for message_id in range(2, 2000):
+            if rng.random() < 0.95:
+                pairs.append((message_id, message_id - 1))
+            else:
+                pairs.append((message_id, rng.randrange(1, message_id)))
+        pairs.extend((message_id, message_id - 1) for message_id in range(5001, 5400))
+        self.check(pairs, rng, samples=500)
+
+    def test_missing_parent_is_root(self):
+        rng = random.Random(23)
+        index = self.check([(2, 99), (3, 2), (4, 2), (10, None), (11, 10)], rng)
+        self.assertEqual(index.roots(), [2, 10])
+        self.assertIsNone(index.parent_of(2))
+
+    def test_cycle_is_left_out(self):
+        index = TreeIndex([(1, None), (2, 1), (3, 4), (4, 3)])
+        self.assertEqual(len(index), 2)
+        self.assertNotIn(3, index)
+        with self.assertRaises(KeyError):
+            index.lca(1, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()